@@ -0,0 +1,116 @@
+# configuracion/admision.py
+"""
+Control de admisión por equipo en el listener HL7.
+
+Límites configurados en cada Equipo (0 = sin límite):
+  - max_mensajes_en_curso: mensajes del equipo procesándose a la vez.
+  - max_bytes_por_segundo: cubeta de tokens; si el equipo se pasa, la
+    conexión demora la siguiente lectura (el TCP frena al equipo) y, si la
+    deuda supera ESPERA_MAXIMA segundos, el mensaje se rechaza. Una trama
+    más grande que eso (un CBC con imágenes) entra igual si no hay deuda
+    pendiente: el exceso queda como deuda y frena a las siguientes.
+  - max_cola: trabajos pendientes en la cola de post-proceso (ACK inmediato).
+
+Un mensaje rechazado no se guarda: el equipo recibe ACK AR y lo reenvía más
+tarde. Así un equipo en tormenta de reenvíos no le quita el escritor SQLite
+ni la latencia a los demás. Los mensajes sin equipo identificado no tienen
+límite.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+
+# Máxima demora por trama antes de pasar a rechazar (segundos)
+ESPERA_MAXIMA = getattr(settings, "HL7_ADMISION_ESPERA_MAXIMA", 2.0)
+
+TEXTOS = {
+    "en_curso": "Equipo saturado: demasiados mensajes en curso",
+    "bytes": "Equipo saturado: tasa de envío excedida",
+    "cola": "Equipo saturado: cola de procesamiento llena",
+}
+
+_LOCK = threading.Lock()
+_EN_CURSO = {}   # equipo_id -> mensajes en proceso
+_CUBETAS = {}    # equipo_id -> [tokens, último_instante]
+
+
+def _consumir_bytes(equipo_id, n, tasa):
+    """
+    Descuenta n bytes de la cubeta (capacidad = 1 s de tasa; puede quedar en
+    negativo = deuda). Devuelve los segundos a esperar (a lo sumo
+    ESPERA_MAXIMA), o None si la deuda superaría ESPERA_MAXIMA y ya había
+    deuda antes de esta trama. Sin deuda la trama entra aunque sea más
+    grande que la cubeta; si no, nunca entraría.
+    """
+    ahora = time.monotonic()
+    cubeta = _CUBETAS.get(equipo_id)
+    if cubeta is None:
+        cubeta = _CUBETAS[equipo_id] = [float(tasa), ahora]
+
+    cubeta[0] = min(float(tasa), cubeta[0] + (ahora - cubeta[1]) * tasa)
+    cubeta[1] = ahora
+
+    restante = cubeta[0] - n
+    espera = -restante / tasa if restante < 0 else 0.0
+    if espera > ESPERA_MAXIMA and cubeta[0] < 0:
+        return None
+    cubeta[0] = restante
+    return min(espera, ESPERA_MAXIMA)
+
+
+def _cola_pendiente(equipo_id):
+    from .models import HL7Trabajo
+    return (
+        HL7Trabajo.objects
+        .filter(estado__in=("pendiente", "en_proceso"), mensaje__equipo_id=equipo_id)
+        .count()
+    )
+
+
+def entrar(equipo, n_bytes, contar_cola=False):
+    """
+    Devuelve (motivo, espera):
+      motivo None  -> admitido (llamar salir(equipo) al terminar);
+      motivo texto -> rechazado ('en_curso', 'bytes' o 'cola'), no llamar salir.
+      espera       -> segundos que la conexión debe demorar la próxima lectura.
+    """
+    if equipo is None:
+        return None, 0.0
+
+    # La cola se consulta fuera del lock (es la única consulta a la BD)
+    if contar_cola and equipo.max_cola and _cola_pendiente(equipo.id) >= equipo.max_cola:
+        return "cola", 0.0
+
+    with _LOCK:
+        en_curso = _EN_CURSO.get(equipo.id, 0)
+        if equipo.max_mensajes_en_curso and en_curso >= equipo.max_mensajes_en_curso:
+            return "en_curso", 0.0
+
+        espera = 0.0
+        if equipo.max_bytes_por_segundo:
+            espera = _consumir_bytes(equipo.id, n_bytes, equipo.max_bytes_por_segundo)
+            if espera is None:
+                return "bytes", ESPERA_MAXIMA
+
+        _EN_CURSO[equipo.id] = en_curso + 1
+        return None, espera
+
+
+def salir(equipo):
+    if equipo is None:
+        return
+    with _LOCK:
+        n = _EN_CURSO.get(equipo.id, 0) - 1
+        if n > 0:
+            _EN_CURSO[equipo.id] = n
+        else:
+            _EN_CURSO.pop(equipo.id, None)
+
+
+def en_curso():
+    """{equipo_id: mensajes en proceso} (para el panel)."""
+    with _LOCK:
+        return dict(_EN_CURSO)
@@ -4,3 +4,8 @@ class ConfiguracionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'configuracion'
     verbose_name = 'Configuración'
+
+    def ready(self):
+        from . import ordenes_hl7, registro_equipos
+        registro_equipos.conectar_senales()
+        ordenes_hl7.conectar_senales()
@@ -0,0 +1,275 @@
+# configuracion/archivo_hl7.py
+"""
+Archivo mensual de los HL7Mensaje viejos.
+
+`archivar_hl7` saca de la BD los mensajes con más de HL7_ARCHIVO_DIAS días y
+los agrega a dos archivos por mes en HL7_ARCHIVO_DIR:
+
+  hl7-AAAA-MM.dat  registros zlib uno tras otro; cada uno es el JSON con los
+                   campos del mensaje + "\\n" + el texto HL7
+  hl7-AAAA-MM.idx  una entrada de ENTRADA.size bytes por mensaje, ordenadas por id
+
+El índice se lee con mmap: buscar un id es una búsqueda binaria, y buscar por
+fechas, orden o clave de muestra recorre solo el índice. Del .dat se lee
+únicamente el registro pedido.
+
+obtener(id) devuelve un HL7Mensaje sin guardar (con archivado = True), así
+hl7_ver y graficas_hl7 lo tratan igual que a uno de la BD. Las imágenes y
+gráficas guardadas del mensaje se borran al archivar; salen de nuevo del texto.
+
+Un solo `archivar_hl7` a la vez: el índice de un mes se reescribe entero.
+"""
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+
+DIRECTORIO = getattr(settings, "HL7_ARCHIVO_DIR", None)
+DIAS = getattr(settings, "HL7_ARCHIVO_DIAS", 180)
+
+# id, fecha (epoch), orden_id, diario_seq, offset en el .dat, largo, crc32(sample_key)
+ENTRADA = struct.Struct("<QqQQQII")
+
+CAMPOS = (
+    "id", "ip_equipo", "sample_id", "sample_key", "exam_codes", "tipo", "estado",
+    "equipo_id", "orden_id", "diario_seq",
+)
+
+
+def _crc(clave):
+    return zlib.crc32((clave or "").encode("utf-8"))
+
+
+def _mes(fecha):
+    if timezone.is_aware(fecha):
+        fecha = timezone.localtime(fecha)
+    return fecha.strftime("%Y-%m")
+
+
+def _rutas(mes):
+    return (
+        os.path.join(DIRECTORIO, f"hl7-{mes}.dat"),
+        os.path.join(DIRECTORIO, f"hl7-{mes}.idx"),
+    )
+
+
+def meses():
+    """Meses archivados ('AAAA-MM'), del más viejo al más nuevo."""
+    if not DIRECTORIO or not os.path.isdir(DIRECTORIO):
+        return []
+    return sorted(
+        nombre[4:-4] for nombre in os.listdir(DIRECTORIO)
+        if nombre.startswith("hl7-") and nombre.endswith(".idx")
+    )
+
+
+# ------------------------------
+# LECTURA
+# ------------------------------
+
+class Indice:
+    """Índice de un mes mapeado en memoria."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(ruta, "rb") as f:
+            self.firma = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.firma.st_size else None
+        self.n = self.firma.st_size // ENTRADA.size
+        self.fecha_max = max((e[1] for e in self), default=0)
+        self.diario_seq_max = max((e[3] for e in self), default=0)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        return ENTRADA.unpack_from(self._mm, i * ENTRADA.size)
+
+    def __iter__(self):
+        if self._mm is None:
+            return iter(())
+        return ENTRADA.iter_unpack(memoryview(self._mm)[:self.n * ENTRADA.size])
+
+    def buscar(self, mensaje_id):
+        i = bisect.bisect_left(range(self.n), mensaje_id, key=lambda j: self[j][0])
+        if i < self.n and self[i][0] == mensaje_id:
+            return self[i]
+        return None
+
+    def rango_ids(self):
+        return (self[0][0], self[self.n - 1][0]) if self.n else (0, -1)
+
+
+_LOCK = threading.Lock()
+_INDICES = {}
+
+
+def _mismo_archivo(a, b):
+    return (a.st_ino, a.st_size, a.st_mtime_ns) == (b.st_ino, b.st_size, b.st_mtime_ns)
+
+
+def _indice(mes):
+    """Índice del mes; se vuelve a mapear si archivar_hl7 lo reescribió."""
+    ruta = _rutas(mes)[1]
+    try:
+        firma = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    with _LOCK:
+        indice = _INDICES.get(ruta)
+        if indice is None or not _mismo_archivo(indice.firma, firma):
+            # El mmap viejo puede estar en uso en otro hilo: se deja al GC
+            indice = _INDICES[ruta] = Indice(ruta)
+        return indice
+
+
+def _leer(mes, entrada):
+    """HL7Mensaje (sin guardar) del registro apuntado por la entrada."""
+    from .models import HL7Mensaje
+
+    _, _, _, _, offset, largo, _ = entrada
+    with open(_rutas(mes)[0], "rb") as f:
+        datos = zlib.decompress(os.pread(f.fileno(), largo, offset))
+    cabecera, texto = datos.split(b"\n", 1)
+    campos = json.loads(cabecera)
+    fecha = datetime.fromisoformat(campos.pop("fecha_recepcion"))
+
+    msg = HL7Mensaje(**campos, mensaje_texto=texto.decode("utf-8"), compresion="")
+    msg.fecha_recepcion = fecha
+    msg.tamano_raw = len(texto)
+    msg.archivado = True
+    return msg
+
+
+def obtener(mensaje_id):
+    """El mensaje archivado con ese id, o None."""
+    for mes in reversed(meses()):
+        indice = _indice(mes)
+        if indice is None:
+            continue
+        desde, hasta = indice.rango_ids()
+        if desde <= mensaje_id <= hasta:
+            entrada = indice.buscar(mensaje_id)
+            if entrada is not None:
+                return _leer(mes, entrada)
+    return None
+
+
+def _filtrar(condicion, lista_meses=None):
+    for mes in (meses() if lista_meses is None else lista_meses):
+        indice = _indice(mes)
+        if indice is None:
+            continue
+        for entrada in indice:
+            if condicion(entrada):
+                yield mes, entrada
+
+
+def por_clave(sample_key):
+    """Mensajes archivados con esa clave de muestra (ordenes_hl7.clave_muestra)."""
+    crc = _crc(sample_key)
+    for mes, entrada in _filtrar(lambda e: e[6] == crc):
+        msg = _leer(mes, entrada)
+        if msg.sample_key == sample_key:  # el crc puede repetirse
+            yield msg
+
+
+def por_orden(orden_id, desde=None):
+    """
+    Mensajes archivados enlazados a la orden, en orden de id. Con `desde`
+    (datetime) solo se recorren los meses desde el de esa fecha.
+    """
+    lista = [m for m in meses() if m >= _mes(desde)] if desde else None
+    for mes, entrada in _filtrar(lambda e: e[2] == orden_id, lista):
+        yield _leer(mes, entrada)
+
+
+def por_fechas(desde, hasta):
+    """Mensajes archivados con desde <= fecha_recepcion < hasta (datetimes)."""
+    t0, t1 = int(desde.timestamp()), int(hasta.timestamp())
+    lista = [m for m in meses() if _mes(desde) <= m <= _mes(hasta)]
+    for mes, entrada in _filtrar(lambda e: t0 <= e[1] < t1, lista):
+        yield _leer(mes, entrada)
+
+
+def fecha_maxima():
+    """Fecha de recepción más nueva archivada (datetime UTC) o None."""
+    for mes in reversed(meses()):
+        indice = _indice(mes)
+        if indice is not None and indice.n:
+            return datetime.fromtimestamp(indice.fecha_max, dt_timezone.utc)
+    return None
+
+
+def diario_seqs(desde=0):
+    """Números del diario (diario_hl7) de los mensajes archivados, >= desde."""
+    return {e[3] for _, e in _filtrar(lambda e: e[3] and e[3] >= desde)}
+
+
+def diario_seq_maximo():
+    return max((i.diario_seq_max for i in map(_indice, meses()) if i is not None), default=0)
+
+
+# ------------------------------
+# ESCRITURA (archivar_hl7)
+# ------------------------------
+
+def _registro(msg):
+    campos = {c: getattr(msg, c) for c in CAMPOS}
+    campos["fecha_recepcion"] = msg.fecha_recepcion.isoformat()
+    cabecera = json.dumps(campos, ensure_ascii=False).encode("utf-8")
+    return zlib.compress(cabecera + b"\n" + (msg.mensaje_raw or "").encode("utf-8"))
+
+
+def archivar(mensajes):
+    """
+    Agrega los mensajes (HL7Mensaje con su cuerpo) al archivo de su mes.
+    Al volver, están en disco con fsync; recién entonces se pueden borrar de
+    la BD. Un mensaje ya archivado se reemplaza. Devuelve cuántos archivó.
+    """
+    if not DIRECTORIO:
+        raise RuntimeError("El archivo HL7 está desactivado (HL7_ARCHIVO_DIR)")
+    os.makedirs(DIRECTORIO, exist_ok=True)
+
+    por_mes = {}
+    for msg in mensajes:
+        por_mes.setdefault(_mes(msg.fecha_recepcion), []).append(msg)
+
+    for mes, lista in por_mes.items():
+        ruta_dat, ruta_idx = _rutas(mes)
+        nuevas = {}
+        with open(ruta_dat, "ab") as f:
+            offset = f.tell()
+            for msg in lista:
+                registro = _registro(msg)
+                f.write(registro)
+                nuevas[msg.id] = (
+                    msg.id, int(msg.fecha_recepcion.timestamp()), msg.orden_id or 0,
+                    msg.diario_seq or 0, offset, len(registro), _crc(msg.sample_key),
+                )
+                offset += len(registro)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Índice completo ordenado por id, reescrito de una vez
+        indice = _indice(mes)
+        entradas = [e for e in (indice or ()) if e[0] not in nuevas]
+        entradas.extend(nuevas.values())
+        entradas.sort()
+        temporal = f"{ruta_idx}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(b"".join(ENTRADA.pack(*e) for e in entradas))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta_idx)
+
+    return sum(len(lista) for lista in por_mes.values())
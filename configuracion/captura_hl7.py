@@ -0,0 +1,109 @@
+# configuracion/captura_hl7.py
+"""
+Captura del tráfico real de los equipos para reproducirlo después.
+
+Con HL7_CAPTURA_DIR configurado, el listener agrega cada trama recibida
+a un archivo por día (`captura-AAAAMMDD.hl7c`), junto con la respuesta
+que se le dio al equipo y cuándo llegó. `reproducir_captura_hl7` la
+reenvía a un listener local para medir rendimiento y comparar
+resultados y ACK entre versiones.
+
+Cada registro es una cabecera fija (marca, hora de llegada en epoch,
+segundos de proceso, equipo_id, largo de la IP, largo de la trama,
+largo de la respuesta) seguida de la IP, la trama y la respuesta. A
+diferencia del diario no hay fsync: perder el final de una captura no
+importa. Un registro incompleto al final se ignora al leer.
+
+Las capturas traen datos de pacientes: tratarlas como la BD.
+"""
+
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+
+
+DIRECTORIO = getattr(settings, "HL7_CAPTURA_DIR", None)
+
+MARCA = b"HL7C"
+# marca, llegada (epoch), segundos de proceso, equipo_id (0 = ninguno), largo IP, largo trama, largo respuesta
+CABECERA = struct.Struct(">4sddIHII")
+
+
+class RegistroCaptura:
+    __slots__ = ("llegada", "duracion", "ip", "equipo_id", "trama", "respuesta")
+
+    def __init__(self, llegada, duracion, ip, equipo_id, trama, respuesta):
+        self.llegada = llegada
+        self.duracion = duracion
+        self.ip = ip
+        self.equipo_id = equipo_id
+        self.trama = trama
+        self.respuesta = respuesta
+
+
+_LOCK = threading.Lock()
+_ARCHIVO = None
+_DIA = None
+
+
+def activa():
+    return bool(DIRECTORIO)
+
+
+def registrar(llegada, duracion, ip, equipo_id, trama, respuesta):
+    """Agrega una trama con su respuesta a la captura del día."""
+    global _ARCHIVO, _DIA
+    if not DIRECTORIO:
+        return
+    ip_b = (ip or "").encode()
+    trama = bytes(trama)
+    respuesta = bytes(respuesta or b"")
+    registro = (
+        CABECERA.pack(MARCA, llegada, duracion, equipo_id or 0, len(ip_b), len(trama), len(respuesta))
+        + ip_b + trama + respuesta
+    )
+    dia = time.strftime("%Y%m%d", time.localtime(llegada))
+    try:
+        with _LOCK:
+            if _ARCHIVO is None or dia != _DIA:
+                if _ARCHIVO is not None:
+                    _ARCHIVO.close()
+                os.makedirs(DIRECTORIO, exist_ok=True)
+                _ARCHIVO = open(os.path.join(DIRECTORIO, f"captura-{dia}.hl7c"), "ab")
+                _DIA = dia
+            _ARCHIVO.write(registro)
+            _ARCHIVO.flush()
+    except OSError as e:
+        # La captura nunca debe frenar la recepción
+        print("HL7: no se pudo escribir la captura:", e)
+
+
+def cerrar():
+    global _ARCHIVO, _DIA
+    with _LOCK:
+        if _ARCHIVO is not None:
+            _ARCHIVO.close()
+        _ARCHIVO = _DIA = None
+
+
+def leer(ruta):
+    """Registros de un archivo de captura, en orden de escritura."""
+    with open(ruta, "rb") as f:
+        while True:
+            cabecera = f.read(CABECERA.size)
+            if len(cabecera) < CABECERA.size:
+                return
+            marca, llegada, duracion, equipo_id, n_ip, n_trama, n_resp = CABECERA.unpack(cabecera)
+            if marca != MARCA:
+                print(f"HL7 captura: marca inválida en {ruta} (byte {f.tell() - CABECERA.size}); se corta")
+                return
+            cuerpo = f.read(n_ip + n_trama + n_resp)
+            if len(cuerpo) < n_ip + n_trama + n_resp:
+                return  # registro incompleto al final
+            yield RegistroCaptura(
+                llegada, duracion, cuerpo[:n_ip].decode(errors="ignore"), equipo_id or None,
+                cuerpo[n_ip:n_ip + n_trama], cuerpo[n_ip + n_trama:],
+            )
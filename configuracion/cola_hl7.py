@@ -0,0 +1,191 @@
+# configuracion/cola_hl7.py
+"""
+Cola persistente (tabla HL7Trabajo) para el post-proceso de mensajes HL7.
+
+Con HL7_ACK_INMEDIATO el listener guarda el HL7Mensaje, encola un trabajo en
+la misma transacción y responde el ACK. Un pool de workers (hilos) drena la
+cola: imágenes ED -> carga de resultados -> PDF, con reintentos y espera
+creciente. Los mensajes de una misma muestra se procesan en orden.
+"""
+
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import HL7Trabajo
+
+
+TRABAJADORES = getattr(settings, "HL7_COLA_TRABAJADORES", 2)
+MAX_INTENTOS = getattr(settings, "HL7_COLA_MAX_INTENTOS", 5)
+# Un trabajo 'en_proceso' sin cambios hace más que esto se da por abandonado
+HUERFANO_SEGUNDOS = getattr(settings, "HL7_COLA_HUERFANO_SEGUNDOS", 600)
+ESPERA_MAXIMA = 300  # segundos entre reintentos como máximo
+
+_WORKERS = []
+_DETENER = threading.Event()
+_HAY_TRABAJO = threading.Event()
+_LOCK_RECLAMO = threading.Lock()
+
+
+def encolar(msg):
+    trabajo = HL7Trabajo.objects.create(mensaje=msg)
+    # Despertar a los workers recién cuando el trabajo sea visible
+    transaction.on_commit(_HAY_TRABAJO.set)
+    return trabajo
+
+
+def _espera_reintento(intentos):
+    return min(5 * (2 ** max(intentos - 1, 0)), ESPERA_MAXIMA)
+
+
+def _reclamar_trabajo():
+    """
+    Toma el trabajo pendiente más antiguo que ya se pueda correr y cuya
+    muestra no tenga otro trabajo en proceso ni esperando reintento, y lo
+    marca 'en_proceso'. Sin tope de candidatos: aunque los más viejos estén
+    todos en espera (BD bloqueada un rato), los nuevos se siguen tomando.
+    """
+    with _LOCK_RECLAMO:
+        while True:
+            ahora = timezone.now()
+
+            # Un trabajo anterior de la muestra (aunque espere reintento) va primero
+            ocupadas = {
+                sample_id for sample_id in
+                HL7Trabajo.objects
+                .filter(Q(estado="en_proceso") | Q(estado="pendiente", disponible_desde__gt=ahora))
+                .values_list("mensaje__sample_id", flat=True)
+                if (sample_id or "").strip()
+            }
+
+            trabajo = (
+                HL7Trabajo.objects
+                .filter(estado="pendiente", disponible_desde__lte=ahora)
+                .exclude(mensaje__sample_id__in=ocupadas)
+                .order_by("id")
+                .first()
+            )
+            if trabajo is None:
+                return None
+
+            tomados = (
+                HL7Trabajo.objects
+                .filter(id=trabajo.id, estado="pendiente")
+                .update(estado="en_proceso", intentos=F("intentos") + 1, actualizado=ahora)
+            )
+            if tomados:
+                trabajo.refresh_from_db()
+                return trabajo
+            # Lo tomó otro proceso: buscar el siguiente
+
+
+def procesar_trabajo(trabajo):
+    from .listener_thread import _postprocesar_resultado
+
+    msg = trabajo.mensaje
+    try:
+        if trabajo.intentos > 1:
+            # Reintento: no duplicar las imágenes del intento anterior
+            msg.imagenes.all().delete()
+        _postprocesar_resultado(msg)
+    except Exception as e:
+        traceback.print_exc()
+        if trabajo.intentos >= MAX_INTENTOS:
+            trabajo.estado = "error"
+        else:
+            trabajo.estado = "pendiente"
+            trabajo.disponible_desde = timezone.now() + timedelta(seconds=_espera_reintento(trabajo.intentos))
+        trabajo.ultimo_error = f"{type(e).__name__}: {e}"
+        trabajo.save(update_fields=["estado", "disponible_desde", "ultimo_error", "actualizado"])
+        return False
+
+    trabajo.estado = "hecho"
+    trabajo.ultimo_error = ""
+    trabajo.save(update_fields=["estado", "ultimo_error", "actualizado"])
+    return True
+
+
+def procesar_pendientes(limite=None):
+    """
+    Drena la cola en el hilo actual (sin workers). Devuelve cuántos trabajos tomó.
+    """
+    tomados = 0
+    while limite is None or tomados < limite:
+        trabajo = _reclamar_trabajo()
+        if trabajo is None:
+            break
+        procesar_trabajo(trabajo)
+        tomados += 1
+    return tomados
+
+
+def _worker_loop():
+    while not _DETENER.is_set():
+        try:
+            trabajo = _reclamar_trabajo()
+            if trabajo is None:
+                _HAY_TRABAJO.wait(1.0)
+                _HAY_TRABAJO.clear()
+                continue
+            procesar_trabajo(trabajo)
+        except Exception:
+            traceback.print_exc()
+            _DETENER.wait(1.0)
+        finally:
+            close_old_connections()
+
+
+def recuperar_huerfanos(segundos=None):
+    """
+    Trabajos que quedaron 'en_proceso' (proceso caído a mitad) vuelven a la cola.
+    Solo los tomados hace más de HUERFANO_SEGUNDOS: los más recientes pueden
+    estar en manos de los workers de otro proceso (el listener o
+    `procesar_cola_hl7`), y reencolarlos los procesaría dos veces.
+    """
+    limite = timezone.now() - timedelta(seconds=HUERFANO_SEGUNDOS if segundos is None else segundos)
+    return (
+        HL7Trabajo.objects
+        .filter(estado="en_proceso", actualizado__lt=limite)
+        .update(estado="pendiente", actualizado=timezone.now())
+    )
+
+
+def iniciar_workers(cantidad=None):
+    global _WORKERS
+    if any(w.is_alive() for w in _WORKERS):
+        return False
+
+    recuperar_huerfanos()
+    _DETENER.clear()
+    _WORKERS = []
+    for i in range(cantidad or TRABAJADORES):
+        w = threading.Thread(target=_worker_loop, name=f"hl7-cola-{i}", daemon=True)
+        w.start()
+        _WORKERS.append(w)
+    return True
+
+
+def detener_workers():
+    _DETENER.set()
+    _HAY_TRABAJO.set()
+    return True
+
+
+def workers_activos():
+    return sum(1 for w in _WORKERS if w.is_alive())
+
+
+def resumen_cola():
+    """
+    {'pendiente': n, 'en_proceso': n, 'hecho': n, 'error': n, 'workers': n}
+    """
+    resumen = {estado: 0 for estado, _ in HL7Trabajo.ESTADO_CHOICES}
+    for fila in HL7Trabajo.objects.values("estado").annotate(total=Count("id")):
+        resumen[fila["estado"]] = fila["total"]
+    resumen["workers"] = workers_activos()
+    return resumen
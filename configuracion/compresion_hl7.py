@@ -0,0 +1,50 @@
+# configuracion/compresion_hl7.py
+"""
+Compresión del cuerpo de los HL7Mensaje.
+
+Un hemograma con imágenes ED pesa cientos de KB de base64; comprimido con
+zlib queda en una fracción. HL7Mensaje.mensaje_raw sigue siendo texto para
+todo el código: al asignarlo se comprime (si HL7_COMPRESION lo pide) y al
+leerlo se descomprime, una vez por instancia.
+
+Configuración:
+  HL7_COMPRESION: 'zlib' (por defecto), 'lzma' (más chico, más lento) o ''
+      para guardar el texto tal cual.
+  HL7_COMPRESION_NIVEL: nivel de zlib (1-9) o preset de lzma (0-9).
+
+Los mensajes viejos se comprimen con `comprimir_mensajes_hl7`.
+"""
+
+import lzma
+import zlib
+
+from django.conf import settings
+
+
+ALGORITMO = getattr(settings, "HL7_COMPRESION", "zlib") or ""
+NIVEL = getattr(settings, "HL7_COMPRESION_NIVEL", 6)
+
+ALGORITMOS = ("zlib", "lzma")
+
+
+def comprimir(texto, algoritmo=None, nivel=None):
+    """texto -> bytes comprimidos con el algoritmo indicado (o el configurado)."""
+    algoritmo = ALGORITMO if algoritmo is None else algoritmo
+    nivel = NIVEL if nivel is None else nivel
+    datos = (texto or "").encode("utf-8")
+    if algoritmo == "zlib":
+        return zlib.compress(datos, nivel)
+    if algoritmo == "lzma":
+        return lzma.compress(datos, preset=nivel)
+    raise ValueError(f"Algoritmo de compresión desconocido: {algoritmo!r}")
+
+
+def descomprimir(datos, algoritmo):
+    if not datos:
+        return ""
+    datos = bytes(datos)
+    if algoritmo == "zlib":
+        return zlib.decompress(datos).decode("utf-8")
+    if algoritmo == "lzma":
+        return lzma.decompress(datos).decode("utf-8")
+    raise ValueError(f"Algoritmo de compresión desconocido: {algoritmo!r}")
@@ -1,6 +1,7 @@
 # configuracion/decoders/genrui_decoder.py
 
 import base64
+import time
 from io import BytesIO
 from PIL import Image
 
@@ -21,12 +22,13 @@ class GenruiImageDecoder:
     BYTES_PER_PIXEL = 3  # 24 bits RGB
 
     @classmethod
-    def decode_hl7_raw(cls, valor_ed: str) -> bytes:
+    def decode_hl7_raw(cls, valor_ed: str, formato: str = "PNG", compresion: int = 6) -> bytes:
         """
         Toma el componente ED completo de HL7:
             ^Image^BMP^Base64^AAAA....
 
-        Devuelve los bytes PNG listos para guardar.
+        Devuelve los bytes de la imagen listos para guardar: PNG (compresion
+        0-9, como compress_level de PIL) o BMP (sin comprimir, lo más rápido).
         """
 
         # Extraer el Base64
@@ -45,7 +47,7 @@ class GenruiImageDecoder:
                 f"El tamaño RAW ({len(raw)}) no coincide con {expected_size} bytes"
             )
 
-        # Convertir RAW → PNG usando PIL
+        # Convertir RAW → imagen usando PIL
         img = Image.frombytes(
             mode="RGB",
             size=(cls.WIDTH, cls.HEIGHT),
@@ -53,7 +55,19 @@ class GenruiImageDecoder:
             decoder_name="raw"
         )
 
-        # Guardar como PNG en buffer
         output = BytesIO()
-        img.save(output, format="PNG")
+        if formato.upper() == "BMP":
+            img.save(output, format="BMP")
+        else:
+            img.save(output, format="PNG", compress_level=compresion)
         return output.getvalue()
+
+
+def decodificar_ed(valor_ed, formato="PNG", compresion=6):
+    """
+    Punto de entrada para los procesos del pool de imágenes (sin Django):
+    devuelve (bytes de la imagen, segundos de decodificación).
+    """
+    t0 = time.perf_counter()
+    datos = GenruiImageDecoder.decode_hl7_raw(valor_ed, formato, compresion)
+    return datos, time.perf_counter() - t0
@@ -0,0 +1,305 @@
+# configuracion/diario_hl7.py
+"""
+Diario (write-ahead log) de las tramas HL7 recibidas por el listener.
+
+Cada trama aceptada se agrega al diario y se sincroniza a disco (fsync) antes
+de guardar el HL7Mensaje y de responder el ACK. Si la BD está ocupada
+("database is locked") o el proceso se cae a mitad de camino, la trama no se
+pierde: `python manage.py reprocesar_diario_hl7` reingresa, en orden, las
+entradas que no tengan HL7Mensaje con ese diario_seq.
+
+Formato: archivos `diario-<primer seq>.log` en HL7_DIARIO_DIR, rotados al
+pasar HL7_DIARIO_SEGMENTO bytes. Cada registro es una cabecera fija
+(marca, seq, equipo_id, largo de la IP, largo de la trama, CRC32) seguida de
+la IP y la trama. Un registro incompleto al final (caída durante la
+escritura) se descarta al abrir el diario.
+
+El fsync se agrupa: mientras un hilo sincroniza, los demás siguen agregando
+y el siguiente fsync cubre a todos los que esperaban.
+
+Los segmentos cerrados cuyas tramas ya están todas en la BD (o en el archivo
+mensual) se borran solos al rotar, en un hilo aparte, y al iniciar el
+listener; `reprocesar_diario_hl7` también los borra.
+
+Sin HL7_DIARIO_DIR el diario queda desactivado (registrar() devuelve None).
+"""
+
+import os
+import struct
+import threading
+import traceback
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+
+
+DIRECTORIO = getattr(settings, "HL7_DIARIO_DIR", None)
+TAMANO_SEGMENTO = getattr(settings, "HL7_DIARIO_SEGMENTO", 16 * 1024 * 1024)
+
+MARCA = b"HL7D"
+# marca, seq, equipo_id (0 = ninguno), largo IP, largo trama, crc32(IP + trama)
+CABECERA = struct.Struct(">4sQIHII")
+
+
+class RegistroDiario:
+
+    __slots__ = ("seq", "ip", "equipo_id", "datos")
+
+    def __init__(self, seq, ip, equipo_id, datos):
+        self.seq = seq
+        self.ip = ip
+        self.equipo_id = equipo_id
+        self.datos = datos
+
+
+def _nombre_segmento(primer_seq):
+    return f"diario-{primer_seq:016d}.log"
+
+
+def leer_segmento(ruta):
+    """
+    Devuelve (registros, fin_valido): los registros íntegros del archivo y el
+    offset donde termina el último (lo que sigue es un registro cortado).
+    """
+    registros = []
+    with open(ruta, "rb") as f:
+        contenido = f.read()
+
+    pos = 0
+    while pos + CABECERA.size <= len(contenido):
+        marca, seq, equipo_id, largo_ip, largo, crc = CABECERA.unpack_from(contenido, pos)
+        inicio = pos + CABECERA.size
+        fin = inicio + largo_ip + largo
+        if marca != MARCA or fin > len(contenido):
+            break
+        cuerpo = contenido[inicio:fin]
+        if zlib.crc32(cuerpo) != crc:
+            break
+        registros.append(RegistroDiario(
+            seq, cuerpo[:largo_ip].decode(errors="ignore"), equipo_id or None, cuerpo[largo_ip:]
+        ))
+        pos = fin
+    return registros, pos
+
+
+class Diario:
+
+    def __init__(self, directorio, tamano_segmento=TAMANO_SEGMENTO):
+        self.directorio = Path(directorio)
+        self.tamano_segmento = tamano_segmento
+        self._lock = threading.Lock()         # escritura y estado
+        self._lock_fsync = threading.Lock()   # un fsync a la vez
+        self._archivo = None
+        self._tamano = 0
+        self._siguiente = None
+        self._escrito = 0          # último seq agregado
+        self._sincronizado = 0     # último seq ya en disco
+        self.rotaciones = 0
+
+    def segmentos(self):
+        if not self.directorio.exists():
+            return []
+        return sorted(self.directorio.glob("diario-*.log"))
+
+    def _abrir(self, seq_minimo=1):
+        """Retoma el último segmento (recortando un registro cortado) o crea uno."""
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        siguiente = seq_minimo
+        segmentos = self.segmentos()
+        if segmentos:
+            ultimo = segmentos[-1]
+            registros, fin = leer_segmento(ultimo)
+            if fin < ultimo.stat().st_size:
+                print(f"HL7 diario: registro incompleto al final de {ultimo.name}; se descarta")
+                with open(ultimo, "r+b") as f:
+                    f.truncate(fin)
+            if registros:
+                siguiente = max(siguiente, registros[-1].seq + 1)
+            else:
+                siguiente = max(siguiente, int(ultimo.stem.split("-")[1]))
+            if fin < self.tamano_segmento:
+                self._archivo = open(ultimo, "ab")
+                self._tamano = fin
+
+        self._siguiente = siguiente
+        self._escrito = self._sincronizado = siguiente - 1
+        if self._archivo is None:
+            self._nuevo_segmento()
+
+    def _nuevo_segmento(self):
+        self._archivo = open(self.directorio / _nombre_segmento(self._siguiente), "ab")
+        self._tamano = 0
+        # La entrada del directorio también tiene que llegar al disco
+        try:
+            fd = os.open(self.directorio, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    def _rotar(self):
+        # Con self._lock tomado: cerrar el segmento ya sincronizado
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+        self._archivo.close()
+        self._sincronizado = self._escrito
+        self._nuevo_segmento()
+        self.rotaciones += 1
+
+    def registrar(self, datos, ip="", equipo_id=None, seq_minimo=1):
+        """Agrega la trama y vuelve cuando está en disco. Devuelve su seq."""
+        ip = (ip or "").encode()[:65535]
+        cuerpo = ip + bytes(datos)
+
+        with self._lock:
+            if self._siguiente is None:
+                self._abrir(seq_minimo)
+            elif self._tamano >= self.tamano_segmento:
+                self._rotar()
+            seq = self._siguiente
+            self._siguiente += 1
+            self._archivo.write(
+                CABECERA.pack(MARCA, seq, equipo_id or 0, len(ip), len(datos), zlib.crc32(cuerpo))
+            )
+            self._archivo.write(cuerpo)
+            self._tamano += CABECERA.size + len(cuerpo)
+            self._escrito = seq
+
+        self._sincronizar(seq)
+        return seq
+
+    def _sincronizar(self, seq):
+        with self._lock_fsync:
+            with self._lock:
+                if self._sincronizado >= seq:
+                    return  # lo cubrió el fsync de otro hilo (o una rotación)
+                self._archivo.flush()
+                hasta = self._escrito
+                # dup: el fsync sigue siendo válido aunque otro hilo rote y cierre
+                fd = os.dup(self._archivo.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            with self._lock:
+                self._sincronizado = max(self._sincronizado, hasta)
+
+    def registros(self):
+        """Todos los registros íntegros, en orden de seq."""
+        for ruta in self.segmentos():
+            registros, _ = leer_segmento(ruta)
+            yield from registros
+
+    def purgar(self, confirmados):
+        """
+        Borra los segmentos cerrados (todos menos el último) cuyos registros
+        están todos en `confirmados` (conjunto de seq). Devuelve cuántos borró.
+        """
+        borrados = 0
+        for ruta in self.segmentos()[:-1]:
+            registros, _ = leer_segmento(ruta)
+            if all(r.seq in confirmados for r in registros):
+                ruta.unlink()
+                borrados += 1
+        return borrados
+
+    def cerrar(self):
+        with self._lock:
+            if self._archivo is not None:
+                self._archivo.close()
+            self._archivo = None
+            self._siguiente = None
+
+
+_DIARIO = None
+_LOCK = threading.Lock()
+_LOCK_PURGA = threading.Lock()
+
+
+def diario():
+    """El diario del proceso (None si HL7_DIARIO_DIR no está configurado)."""
+    global _DIARIO
+    if not DIRECTORIO:
+        return None
+    with _LOCK:
+        if _DIARIO is None:
+            _DIARIO = Diario(DIRECTORIO)
+        return _DIARIO
+
+
+def _seq_minimo():
+    # Si se borró el directorio del diario, no reutilizar números ya guardados
+    from django.db import DatabaseError
+    from django.db.models import Max
+    from .models import HL7Mensaje
+    try:
+        ultimo = HL7Mensaje.objects.aggregate(m=Max("diario_seq"))["m"]
+    except DatabaseError:
+        ultimo = 0  # BD ocupada: alcanza con lo que diga el propio diario
+    # Ni los de mensajes ya pasados al archivo mensual
+    from . import archivo_hl7
+    return max(ultimo or 0, archivo_hl7.diario_seq_maximo()) + 1
+
+
+def confirmados(desde=0):
+    """Seq >= desde que ya tienen HL7Mensaje en la BD o en el archivo mensual."""
+    from . import archivo_hl7
+    from .models import HL7Mensaje
+    seqs = set(
+        HL7Mensaje.objects
+        .filter(diario_seq__gte=desde)
+        .values_list("diario_seq", flat=True)
+    )
+    return seqs | archivo_hl7.diario_seqs(desde)
+
+
+def purgar_confirmados():
+    """
+    Borra los segmentos cerrados del diario cuyas tramas están todas
+    confirmadas. Devuelve cuántos borró (0 si otro hilo ya está purgando).
+    """
+    d = diario()
+    if d is None or not _LOCK_PURGA.acquire(blocking=False):
+        return 0
+    try:
+        cerrados = d.segmentos()[:-1]
+        if not cerrados:
+            return 0
+        return d.purgar(confirmados(int(cerrados[0].stem.split("-")[1])))
+    finally:
+        _LOCK_PURGA.release()
+
+
+def _purgar_en_segundo_plano():
+    from django.db import connection
+
+    def purgar():
+        try:
+            borrados = purgar_confirmados()
+            if borrados:
+                print(f"HL7 diario: {borrados} segmento(s) confirmado(s) borrado(s)")
+        except Exception:
+            traceback.print_exc()
+        finally:
+            connection.close()
+
+    threading.Thread(target=purgar, name="hl7-diario-purga", daemon=True).start()
+
+
+def registrar(datos, ip="", equipo_id=None):
+    """Agrega la trama al diario (fsync incluido). Devuelve el seq o None."""
+    d = diario()
+    if d is None:
+        return None
+    rotaciones = d.rotaciones
+    if d._siguiente is None:
+        seq = d.registrar(datos, ip, equipo_id, seq_minimo=_seq_minimo())
+    else:
+        seq = d.registrar(datos, ip, equipo_id)
+    if d.rotaciones != rotaciones:
+        # El segmento que se cerró (y los anteriores) puede que ya no haga falta
+        _purgar_en_segundo_plano()
+    return seq
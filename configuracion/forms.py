@@ -27,7 +27,8 @@ class EquipoForm(forms.ModelForm):
             'nombre', 'codigo', 'fabricante', 'modelo',
             'tipo_integracion', 'host', 'puerto',
             'ruta_archivos', 'prefijo_archivo',
-            'activo', 'notas'
+            'activo', 'notas',
+            'max_mensajes_en_curso', 'max_bytes_por_segundo', 'max_cola',
         ]
         widgets = {
             'nombre': forms.TextInput(attrs={'class': 'form-control'}),
@@ -41,6 +42,9 @@ class EquipoForm(forms.ModelForm):
             'prefijo_archivo': forms.TextInput(attrs={'class': 'form-control'}),
             'activo': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'notas': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
+            'max_mensajes_en_curso': forms.NumberInput(attrs={'class': 'form-control', 'min': 0}),
+            'max_bytes_por_segundo': forms.NumberInput(attrs={'class': 'form-control', 'min': 0}),
+            'max_cola': forms.NumberInput(attrs={'class': 'form-control', 'min': 0}),
         }
 
 
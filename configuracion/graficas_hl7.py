@@ -0,0 +1,237 @@
+# configuracion/graficas_hl7.py
+"""
+Histogramas (RBC/PLT) y scatter (DIFF/BASO) de los hemogramas, extraídos una
+vez al recibir el mensaje y guardados en HL7Grafica como arreglos empacados.
+
+Formato de HL7Grafica.datos: uno o más grupos seguidos, cada uno
+    <color uint32><typecode 'H'|'I'><cantidad uint32> + array (little endian)
+Un histograma es un solo grupo con los valores; un scatter, un grupo por
+color con x, y intercalados.
+
+graficas_para_orden(orden) es lo que usa el informe: una consulta indexada
+por orden, sin LIKE sobre mensaje_raw.
+"""
+
+import re
+import struct
+import sys
+from array import array
+from datetime import timedelta
+
+from . import archivo_hl7
+
+
+CABECERA_GRUPO = struct.Struct("<IcI")
+
+# tipo -> textos que puede traer OBX-3 (según firmware, con o sin espacio)
+NOMBRES = {
+    "rbc": ("RBC Histogram.Binary", "RBC  Histogram.Binary"),
+    "plt": ("PLT Histogram.Binary", "PLT  Histogram.Binary"),
+    "diff": ("DIFFScatter.Binary", "DIFF Scatter.Binary"),
+    "baso": ("BASOScatter.Binary", "BASO Scatter.Binary"),
+}
+HISTOGRAMAS = ("rbc", "plt")
+
+
+def clasificar(obx3):
+    for tipo, nombres in NOMBRES.items():
+        if any(n in obx3 for n in nombres):
+            return tipo
+    return None
+
+
+# ------------------------------
+# PARSEO (OBX-5)
+# ------------------------------
+
+def parsear_histograma(valor):
+    """
+    '16711680;0,0,1,2,5,...' | '(0, 0, 1, 2, ...)' | '16711680,(0,0,1,...)'
+    -> (color, [0, 0, 1, 2, 5, ...]) o None.
+    """
+    valor = (valor or "").strip()
+    for c in "()[]":
+        valor = valor.replace(c, "")
+
+    color = 0
+    if ";" in valor:
+        cabeza, valores = valor.split(";", 1)
+        try:
+            color = int(cabeza)
+        except ValueError:
+            pass
+    elif "," in valor:
+        # El primer número es un color si no entra en 16 bits
+        primero, resto = valor.split(",", 1)
+        try:
+            if int(primero) > 65535:
+                color, valor = int(primero), resto
+        except ValueError:
+            pass
+        valores = valor
+    else:
+        return None
+
+    numeros = []
+    for x in valores.split(","):
+        x = x.strip()
+        if not x:
+            continue
+        try:
+            numeros.append(int(x))
+        except ValueError:
+            try:
+                numeros.append(int(float(x)))
+            except ValueError:
+                continue
+    return (color, numeros) if numeros else None
+
+
+def parsear_scatter(valor):
+    """
+    '16711680,(10,20)(30,40);255,(5,5)(6,7)'
+    -> [(16711680, [(10, 20), (30, 40)]), (255, [(5, 5), (6, 7)])] o None.
+    """
+    grupos = []
+    for chunk in re.split(r"[;|]", (valor or "").strip()):
+        chunk = chunk.strip()
+        m = re.match(r"^(\d+),?", chunk)
+        if not m:
+            continue
+        puntos = [(int(x), int(y)) for x, y in re.findall(r"\((\d+),(\d+)\)", chunk[m.end():])]
+        if puntos:
+            grupos.append((int(m.group(1)), puntos))
+    return grupos or None
+
+
+# ------------------------------
+# EMPAQUE
+# ------------------------------
+
+def _arreglo(numeros):
+    numeros = [max(0, n) for n in numeros]
+    return array("H" if max(numeros, default=0) <= 0xFFFF else "I", numeros)
+
+
+def empacar(grupos):
+    """grupos: [(color, [enteros])] -> bytes."""
+    partes = []
+    for color, numeros in grupos:
+        arr = _arreglo(numeros)
+        if sys.byteorder == "big":
+            arr.byteswap()
+        partes.append(CABECERA_GRUPO.pack(color & 0xFFFFFFFF, arr.typecode.encode(), len(arr)))
+        partes.append(arr.tobytes())
+    return b"".join(partes)
+
+
+def desempacar(datos):
+    """bytes -> [(color, array)]."""
+    datos = bytes(datos)
+    grupos = []
+    pos = 0
+    while pos + CABECERA_GRUPO.size <= len(datos):
+        color, typecode, cantidad = CABECERA_GRUPO.unpack_from(datos, pos)
+        pos += CABECERA_GRUPO.size
+        arr = array(typecode.decode())
+        fin = pos + cantidad * arr.itemsize
+        arr.frombytes(datos[pos:fin])
+        if sys.byteorder == "big":
+            arr.byteswap()
+        grupos.append((color, arr))
+        pos = fin
+    return grupos
+
+
+# ------------------------------
+# INGESTA Y LECTURA
+# ------------------------------
+
+def _grupos(msg):
+    """{tipo: [(color, [enteros])]} con las gráficas de los OBX del mensaje."""
+    grupos_por_tipo = {}
+    for seg in msg.hl7.todos("OBX"):
+        tipo = clasificar(seg.campo(3))
+        if tipo is None or tipo in grupos_por_tipo:
+            continue
+        valor = seg.campo(5)
+        if tipo in HISTOGRAMAS:
+            hist = parsear_histograma(valor)
+            grupos = [hist] if hist else None
+        else:
+            grupos = parsear_scatter(valor)
+            if grupos:
+                grupos = [(color, [c for p in puntos for c in p]) for color, puntos in grupos]
+        if grupos:
+            grupos_por_tipo[tipo] = grupos
+    return grupos_por_tipo
+
+
+def _como_graficas(tipo, grupos):
+    if tipo in HISTOGRAMAS:
+        return list(grupos[0][1]) if grupos else []
+    return [(color, list(zip(arr[0::2], arr[1::2]))) for color, arr in grupos]
+
+
+def extraer(msg, orden_id=None):
+    """
+    Extrae las gráficas del mensaje y (re)escribe sus HL7Grafica.
+    orden_id: por defecto, la orden enlazada al mensaje.
+    Devuelve cuántas guardó.
+    """
+    from .models import HL7Grafica
+
+    if orden_id is None:
+        orden_id = msg.orden_id
+
+    filas = {
+        tipo: HL7Grafica(
+            mensaje=msg, orden_id=orden_id, equipo_id=msg.equipo_id,
+            sample_id=(msg.sample_id or "").strip(), tipo=tipo, datos=empacar(grupos),
+        )
+        for tipo, grupos in _grupos(msg).items()
+    }
+
+    HL7Grafica.objects.filter(mensaje=msg).delete()
+    if filas:
+        HL7Grafica.objects.bulk_create(filas.values())
+    return len(filas)
+
+
+def graficas_para_orden(orden):
+    """
+    {'rbc': [valores], 'plt': [valores], 'diff': [(color, [(x, y), ...])], 'baso': [...]}
+    con las gráficas del mensaje más antiguo de la orden (los primeros datos
+    del equipo). HL7Grafica.orden es la del mensaje (ver ordenes_hl7.py).
+    Si no hay ninguna y la orden es anterior a lo archivado, se buscan en
+    archivo_hl7, solo en los meses desde el anterior al de la orden (el
+    mensaje puede llegar antes que la orden, no mucho antes).
+    """
+    from .models import HL7Grafica
+
+    filas = (
+        HL7Grafica.objects
+        .filter(orden_id=orden.id)
+        .order_by("mensaje_id")
+        .values_list("tipo", "datos")
+    )
+
+    graficas = {}
+    for tipo, datos in filas:
+        if tipo not in graficas:
+            graficas[tipo] = _como_graficas(tipo, desempacar(datos))
+    if graficas:
+        return graficas
+
+    # Orden vieja: sus mensajes pueden estar en el archivo mensual (sin HL7Grafica)
+    maxima = archivo_hl7.fecha_maxima()
+    if maxima is None or (orden.fecha and orden.fecha > maxima):
+        return graficas
+    desde = orden.fecha - timedelta(days=31) if orden.fecha else None
+    for msg in archivo_hl7.por_orden(orden.id, desde):
+        for tipo, grupos in _grupos(msg).items():
+            if tipo not in graficas:
+                graficas[tipo] = _como_graficas(tipo, grupos)
+        if graficas:
+            break
+    return graficas
@@ -0,0 +1,119 @@
+# configuracion/hl7.py
+"""
+Parser HL7 v2 de una sola pasada.
+
+MensajeHL7 separa el texto en segmentos una vez y los indexa por nombre
+(MSH, PID, OBR, OBX...). Cada Segmento ubica sus separadores de campo ('|')
+recién cuando se piden y solo hasta el campo pedido; los componentes ('^')
+también bajo demanda. Así un OBX con una imagen ED de cientos de KB no se
+copia si nadie lee su OBX-5.
+
+Los índices de campo son los de line.split("|"), como en el resto del
+código: para MSH, campo(2) es la aplicación emisora (MSH-3).
+"""
+
+
+def _lineas(texto):
+    # Lo normal es \r; algunos equipos/exportaciones usan \n o \r\n
+    if "\n" in texto:
+        texto = texto.replace("\r\n", "\r").replace("\n", "\r")
+    return texto.split("\r")
+
+
+class Segmento:
+
+    __slots__ = ("nombre", "texto", "_cortes", "_completo")
+
+    def __init__(self, texto):
+        self.texto = texto
+        self.nombre = texto[:3]
+        # Posiciones de los '|' ya ubicados; el campo i va de _cortes[i]+1 a _cortes[i+1]
+        self._cortes = [-1]
+        self._completo = False
+
+    def _ubicar(self, n):
+        """Busca separadores hasta cubrir el campo n (sin copiar el texto)."""
+        cortes = self._cortes
+        texto = self.texto
+        while len(cortes) <= n + 1 and not self._completo:
+            pos = texto.find("|", cortes[-1] + 1)
+            if pos < 0:
+                cortes.append(len(texto))
+                self._completo = True
+            else:
+                cortes.append(pos)
+        return len(cortes) > n + 1
+
+    def __len__(self):
+        while not self._completo:
+            self._ubicar(len(self._cortes))
+        return len(self._cortes) - 1
+
+    def campo(self, n, defecto=""):
+        if not self._ubicar(n):
+            return defecto
+        return self.texto[self._cortes[n] + 1:self._cortes[n + 1]]
+
+    def tiene_campo(self, n):
+        return self._ubicar(n)
+
+    def componente(self, n, c, defecto=""):
+        valor = self.campo(n)
+        if not valor:
+            return defecto
+        partes = valor.split("^")
+        return partes[c] if len(partes) > c else defecto
+
+    def __repr__(self):
+        return f"<Segmento {self.nombre} ({len(self.texto)} chars)>"
+
+
+class MensajeHL7:
+
+    __slots__ = ("texto", "segmentos", "_por_nombre")
+
+    def __init__(self, texto):
+        self.texto = texto or ""
+        self.segmentos = []
+        self._por_nombre = {}
+
+        for linea in _lineas(self.texto):
+            linea = linea.strip()
+            if not linea:
+                continue
+            seg = Segmento(linea)
+            self.segmentos.append(seg)
+            self._por_nombre.setdefault(seg.nombre, []).append(seg)
+
+    @classmethod
+    def desde_bytes(cls, raw):
+        return cls(raw.decode(errors="ignore"))
+
+    def todos(self, nombre):
+        return self._por_nombre.get(nombre, [])
+
+    def primero(self, nombre):
+        segs = self._por_nombre.get(nombre)
+        return segs[0] if segs else None
+
+    def linea(self, nombre):
+        """Texto del primer segmento con ese nombre ("" si no hay)."""
+        seg = self.primero(nombre)
+        return seg.texto if seg else ""
+
+    def tiene(self, nombre):
+        return nombre in self._por_nombre
+
+    def __repr__(self):
+        return f"<MensajeHL7 {len(self.segmentos)} segmentos>"
+
+
+def como_mensaje(valor):
+    """
+    Acepta un MensajeHL7, texto o bytes y devuelve siempre un MensajeHL7.
+    """
+    if isinstance(valor, MensajeHL7):
+        return valor
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return MensajeHL7.desde_bytes(bytes(valor))
+    return MensajeHL7(valor or "")
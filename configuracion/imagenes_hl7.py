@@ -0,0 +1,243 @@
+# configuracion/imagenes_hl7.py
+"""
+Decodificación de imágenes ED (Genrui) en un pool acotado de procesos.
+
+Base64 de ~195 KB + Image.frombytes + codificación PNG por imagen retienen el
+GIL; en un proceso aparte no frenan la recepción de los demás equipos.
+
+Uso en el post-proceso (ver listener_thread._postprocesar_resultado):
+
+    pendientes = imagenes_hl7.enviar_imagenes(msg)   # no bloquea
+    ... carga de resultados mientras tanto ...
+    imagenes_hl7.finalizar(msg, pendientes)          # crea los HL7Imagen
+
+Modo diferido (HL7_IMAGENES_MODO = 'diferido'): al recibir no se decodifica
+nada; el HL7Imagen guarda solo la posición del OBX dentro del mensaje y la
+imagen (o su miniatura) se genera la primera vez que se pide
+(materializar(), vista configuracion/hl7/imagen/<id>/). Lo generado queda en
+un caché en disco (HL7_IMAGENES_CACHE_DIR) que se poda por antigüedad de
+último acceso al pasar HL7_IMAGENES_CACHE_MAX bytes.
+
+Configuración:
+  HL7_IMAGENES_MODO: 'inmediato' (archivo al recibir) o 'diferido'.
+  HL7_IMAGENES_PROCESOS: procesos del pool (0 = decodificar en el mismo hilo).
+  HL7_IMAGENES_FORMATO: 'png' o 'bmp' (sin comprimir, lo más rápido).
+  HL7_IMAGENES_COMPRESION: nivel PNG 0-9 (compress_level de PIL).
+
+Si se llenan los cupos del pool (4 trabajos por proceso), el que envía espera.
+"""
+
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from laboratorio.utils.cache_disco import CacheDisco
+
+from . import metricas_hl7
+from .decoders.genrui_decoder import GenruiImageDecoder, decodificar_ed
+from .hl7 import Segmento
+
+
+MODO = getattr(settings, "HL7_IMAGENES_MODO", "inmediato")
+PROCESOS = getattr(settings, "HL7_IMAGENES_PROCESOS", 2)
+FORMATO = getattr(settings, "HL7_IMAGENES_FORMATO", "png").lower()
+COMPRESION = getattr(settings, "HL7_IMAGENES_COMPRESION", 6)
+CACHE_DIR = getattr(settings, "HL7_IMAGENES_CACHE_DIR", None)
+CACHE_MAX = getattr(settings, "HL7_IMAGENES_CACHE_MAX", 256 * 1024 * 1024)
+MINIATURA = 160  # px, lado mayor
+
+CONTENT_TYPES = {"png": "image/png", "bmp": "image/bmp"}
+
+_LOCK = threading.Lock()
+_POOL = None
+_CUPOS = threading.BoundedSemaphore(max(1, PROCESOS * 4))
+
+
+def _pool():
+    global _POOL
+    with _LOCK:
+        if _POOL is None:
+            # spawn: el hijo no hereda hilos ni conexiones a la BD del proceso web
+            _POOL = ProcessPoolExecutor(
+                max_workers=PROCESOS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _POOL
+
+
+def cerrar():
+    global _POOL
+    with _LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _en_el_hilo(valor_ed):
+    futuro = Future()
+    try:
+        futuro.set_result(decodificar_ed(valor_ed, FORMATO, COMPRESION))
+    except Exception as e:
+        futuro.set_exception(e)
+    return futuro
+
+
+def decodificar(valor_ed):
+    """Future con (bytes, segundos) de la imagen."""
+    if not PROCESOS:
+        return _en_el_hilo(valor_ed)
+
+    _CUPOS.acquire()
+    try:
+        futuro = _pool().submit(decodificar_ed, valor_ed, FORMATO, COMPRESION)
+    except (BrokenProcessPool, RuntimeError):
+        # Un proceso murió (o el pool se cerró): se rearma para la próxima
+        _CUPOS.release()
+        traceback.print_exc()
+        cerrar()
+        return _en_el_hilo(valor_ed)
+    futuro.add_done_callback(lambda _: _CUPOS.release())
+    return futuro
+
+
+def _es_imagen(seg):
+    """
+    Si el OBX ED trae una imagen que se puede decodificar: no es una gráfica
+    del equipo (Histogram / Scatter / .Binary, ver graficas_hl7.py) y el valor
+    es ^Image^<formato>^Base64^<datos> con el tamaño RAW que espera el
+    decoder. Sin decodificar: en modo diferido la fila se crea sin probarla.
+    """
+    nombre = seg.campo(3)
+    if "Histogram" in nombre or "Scatter" in nombre or ".Binary" in nombre:
+        return False
+    partes = seg.campo(5).strip().split("^")
+    if len(partes) < 5 or partes[1] != "Image" or partes[3] != "Base64":
+        return False
+    b64 = "".join(partes[4:]).strip()
+    tamano = len(b64) * 3 // 4 - b64[-2:].count("=")
+    return tamano == GenruiImageDecoder.WIDTH * GenruiImageDecoder.HEIGHT * GenruiImageDecoder.BYTES_PER_PIXEL
+
+
+def enviar_imagen(obx, indice=None):
+    """
+    Prepara un OBX ED (Segmento o línea). Devuelve
+    (secuencia, nombre_logico, indice, futuro) o None si no trae imagen.
+    indice: posición del OBX en el mensaje; con él, en modo diferido no se
+    decodifica nada (futuro = None).
+    """
+    seg = obx if isinstance(obx, Segmento) else Segmento(obx.strip())
+    if not seg.tiene_campo(5) or not _es_imagen(seg):
+        return None
+    secuencia = seg.campo(1).strip()
+    nombre_logico = seg.campo(3).strip().replace("^", "_") or "Imagen"
+    if MODO == "diferido" and indice is not None:
+        return secuencia, nombre_logico, indice, None
+    return secuencia, nombre_logico, indice, decodificar(seg.campo(5).strip())
+
+
+def enviar_imagenes(msg):
+    pendientes = []
+    for indice, seg in enumerate(msg.hl7.todos("OBX")):
+        if seg.campo(2) == "ED":
+            pendiente = enviar_imagen(seg, indice)
+            if pendiente:
+                pendientes.append(pendiente)
+    return pendientes
+
+
+def finalizar(msg, pendientes):
+    """Espera cada imagen y guarda su HL7Imagen. Devuelve cuántas guardó."""
+    from .models import HL7Imagen
+
+    guardadas = 0
+    diferidas = []
+    for secuencia, nombre_logico, indice, futuro in pendientes:
+        if futuro is None:
+            diferidas.append(HL7Imagen(mensaje=msg, tipo=nombre_logico, formato=FORMATO, obx_indice=indice))
+            continue
+        try:
+            datos, segundos = futuro.result()
+            metricas_hl7.observar("decodificacion", segundos)
+            imagen = HL7Imagen(mensaje=msg, tipo=nombre_logico, formato=FORMATO, obx_indice=indice)
+            filename = f"hl7_{msg.id}_{secuencia}_{nombre_logico}.{FORMATO}"
+            imagen.archivo.save(filename, ContentFile(datos), save=True)
+            guardadas += 1
+        except Exception as e:
+            metricas_hl7.ETAPA_ERRORES.inc("decodificacion")
+            print("ERROR guardando imagen HL7:", e)
+
+    if diferidas:
+        HL7Imagen.objects.bulk_create(diferidas)
+        guardadas += len(diferidas)
+    return guardadas
+
+
+# ------------------------------
+# MATERIALIZACIÓN BAJO DEMANDA
+# ------------------------------
+
+_CACHE = CacheDisco(CACHE_MAX)
+
+
+def _cache_dir():
+    return CACHE_DIR or os.path.join(settings.MEDIA_ROOT, "hl7_cache")
+
+
+def _generar(imagen, miniatura):
+    if imagen.archivo:
+        with imagen.archivo.open("rb") as f:
+            datos = f.read()
+    else:
+        obx = imagen.mensaje.hl7.todos("OBX")
+        if imagen.obx_indice is None or imagen.obx_indice >= len(obx):
+            raise ValueError(f"La imagen {imagen.id} no tiene OBX en su mensaje")
+        valor_ed = obx[imagen.obx_indice].campo(5).strip()
+        formato = "BMP" if imagen.formato == "bmp" else "PNG"
+        datos, segundos = decodificar_ed(valor_ed, formato, COMPRESION)
+        metricas_hl7.observar("decodificacion", segundos)
+
+    if not miniatura:
+        return datos
+
+    img = Image.open(BytesIO(datos))
+    img.thumbnail((MINIATURA, MINIATURA))
+    salida = BytesIO()
+    img.save(salida, format="PNG", compress_level=COMPRESION)
+    return salida.getvalue()
+
+
+def materializar(imagen, miniatura=False):
+    """
+    Ruta a un archivo con la imagen (o su miniatura PNG) y su content type.
+    Sirve el archivo guardado si lo hay; si no, lo genera desde el OBX y lo
+    deja en el caché.
+    """
+    if imagen.archivo and not miniatura:
+        return imagen.archivo.path, CONTENT_TYPES.get(imagen.formato, "application/octet-stream")
+
+    extension = "png" if miniatura else (imagen.formato if imagen.formato in CONTENT_TYPES else "png")
+    directorio = _cache_dir()
+    ruta = os.path.join(directorio, f"{imagen.id}{'_mini' if miniatura else ''}.{extension}")
+
+    try:
+        os.utime(ruta)  # acceso reciente: lo último en podarse
+        return ruta, CONTENT_TYPES[extension]
+    except FileNotFoundError:
+        pass
+
+    datos = _generar(imagen, miniatura)
+    os.makedirs(directorio, exist_ok=True)
+    temporal = f"{ruta}.{threading.get_ident()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(datos)
+    os.replace(temporal, ruta)
+    _CACHE.anotar(directorio, len(datos))
+    return ruta, CONTENT_TYPES[extension]
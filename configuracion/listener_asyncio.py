@@ -0,0 +1,174 @@
+# configuracion/listener_asyncio.py
+"""
+Motor asyncio del listener HL7.
+
+Lecturas de socket, enmarcado MLLP y envío de ACK corren en el event loop;
+el trabajo de BD (guardar HL7Mensaje, cargar resultados, PDF) se delega a un
+pool de hilos. Así un solo proceso mantiene muchas conexiones inactivas de
+equipos sin dedicar un hilo del sistema a cada una.
+
+Se activa con HL7_LISTENER_MOTOR = 'asyncio'; el API sigue siendo
+start_listener / stop_listener / status_listener de listener_thread.
+"""
+
+import asyncio
+import functools
+import socket
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import listener_thread as lt
+from . import metricas_hl7
+from .mllp import EscanerMLLP, TramaDemasiadoGrande, envolver
+
+
+# Hilos para el trabajo de BD (el event loop nunca toca el ORM)
+HILOS_BD = getattr(settings, "HL7_LISTENER_HILOS_BD", 4)
+
+
+def _procesar_en_hilo(hl7_message, ip_equipo, equipo_id=None):
+    try:
+        return lt._procesar_trama(hl7_message, ip_equipo, equipo_id)
+    finally:
+        # Igual que al terminar un request: no dejar conexiones colgadas en el hilo
+        close_old_connections()
+
+
+def _puertos_en_hilo():
+    try:
+        return lt.puertos_deseados()
+    finally:
+        close_old_connections()
+
+
+async def _atender_conexion(reader, writer, executor, equipo_id=None):
+    addr = writer.get_extra_info("peername") or ("", 0)
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        lt._configurar_conexion(sock)
+
+    loop = asyncio.get_running_loop()
+    timeout = lt.TIMEOUT_INACTIVIDAD or None
+
+    metricas_hl7.CONEXIONES_TOTAL.inc()
+    metricas_hl7.CONEXIONES_ACTIVAS.inc()
+    try:
+        escaner = EscanerMLLP(lt.MAX_TRAMA)
+        while True:
+            try:
+                chunk = await asyncio.wait_for(reader.read(lt.TAMANO_LECTURA), timeout)
+            except asyncio.TimeoutError:
+                print(f"HL7: conexión {addr[0]}:{addr[1]} cerrada por inactividad")
+                break
+
+            if not chunk:
+                break
+
+            cerrar = False
+            try:
+                with metricas_hl7.medir("recepcion"):
+                    tramas = escaner.alimentar(chunk)
+            except TramaDemasiadoGrande as e:
+                print(f"HL7: {addr[0]}:{addr[1]} {e}; se cierra la conexión")
+                # Las tramas completas que llegaron antes sí se procesan y responden
+                tramas, cerrar = e.tramas, True
+
+            for hl7_message in tramas:
+                respuesta, espera = await loop.run_in_executor(
+                    executor, _procesar_en_hilo, hl7_message, addr[0], equipo_id
+                )
+                t0 = time.perf_counter()
+                writer.write(envolver(respuesta))
+                await writer.drain()
+                metricas_hl7.observar("ack", time.perf_counter() - t0)
+                if espera and not cerrar:
+                    # Control de admisión: demorar la próxima lectura de este equipo
+                    await asyncio.sleep(espera)
+            if cerrar:
+                break
+    except asyncio.CancelledError:
+        pass
+    except Exception:
+        traceback.print_exc()
+    finally:
+        metricas_hl7.CONEXIONES_ACTIVAS.dec()
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+async def _sincronizar_puertos(servidores, deseados, on_conexion):
+    """
+    Abre/cierra un servidor por puerto para que coincidan con `deseados`.
+    Las conexiones ya aceptadas en un puerto que se cierra siguen abiertas.
+    """
+    for puerto in list(servidores):
+        if puerto not in deseados:
+            # Sin wait_closed(): desde 3.12 espera también a las conexiones abiertas
+            servidores.pop(puerto).close()
+            lt.PUERTOS_ABIERTOS.pop(puerto, None)
+            print(f"HL7: puerto {puerto} cerrado")
+
+    for puerto, equipo_id in deseados.items():
+        if puerto not in servidores:
+            try:
+                servidores[puerto] = await asyncio.start_server(
+                    functools.partial(on_conexion, puerto), "0.0.0.0", puerto,
+                    family=socket.AF_INET, backlog=lt.BACKLOG, reuse_address=True,
+                )
+            except OSError as e:
+                print(f"HL7: no se pudo abrir el puerto {puerto}: {e}")
+                continue
+            print(f"HL7: escuchando en el puerto {puerto}")
+        lt.PUERTOS_ABIERTOS[puerto] = equipo_id
+
+
+async def _servir():
+    executor = ThreadPoolExecutor(max_workers=HILOS_BD, thread_name_prefix="hl7-bd")
+    loop = asyncio.get_running_loop()
+    conexiones = set()
+    servidores = {}
+    ultimos = None
+
+    def _on_conexion(puerto, reader, writer):
+        equipo_id = lt.PUERTOS_ABIERTOS.get(puerto)
+        tarea = asyncio.ensure_future(_atender_conexion(reader, writer, executor, equipo_id))
+        conexiones.add(tarea)
+        tarea.add_done_callback(conexiones.discard)
+
+    lt.LISTENER_RUNNING = True
+
+    try:
+        # stop_listener() solo baja la bandera; se revisa cada segundo, junto con
+        # los puertos de los equipos (la consulta, si hace falta, va al pool)
+        while lt.LISTENER_RUNNING:
+            deseados = await loop.run_in_executor(executor, _puertos_en_hilo)
+            if deseados != ultimos:
+                await _sincronizar_puertos(servidores, deseados, _on_conexion)
+                ultimos = deseados
+            await asyncio.sleep(1.0)
+    finally:
+        for server in servidores.values():
+            server.close()
+        lt.PUERTOS_ABIERTOS.clear()
+        for tarea in list(conexiones):
+            tarea.cancel()
+        if conexiones:
+            await asyncio.gather(*conexiones, return_exceptions=True)
+        for server in servidores.values():
+            await server.wait_closed()
+        executor.shutdown(wait=False)
+
+
+def listener_loop_asyncio():
+    try:
+        asyncio.run(_servir())
+    except Exception:
+        traceback.print_exc()
+    finally:
+        lt.LISTENER_RUNNING = False
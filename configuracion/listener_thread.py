@@ -1,25 +1,100 @@
 # configuracion/listener_thread.py
 
+import selectors
 import socket
 import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 
-from django.core.files.base import ContentFile
-from django.db import models
-from django.db import transaction
+from django.conf import settings
 
-from .models import HL7Mensaje, HL7Imagen, Equipo, EquipoMapeo
-from configuracion.decoders.genrui_decoder import GenruiImageDecoder
+from django.db import DatabaseError, transaction
+from django.db import connection
+
+from .models import HL7Mensaje
+from . import (
+    admision, captura_hl7, cola_hl7, diario_hl7, graficas_hl7, imagenes_hl7, metricas_hl7, ordenes_hl7,
+    registro_equipos,
+)
+from .hl7 import MensajeHL7, Segmento, como_mensaje
+from .mllp import EscanerMLLP, TramaDemasiadoGrande, MAX_TRAMA_DEFECTO, START_BLOCK, END_BLOCK, envolver
 
 
 LISTENER_RUNNING = False
 LISTENER_THREAD = None
 
+# Puerto general: los equipos sin puerto propio; el equipo se resuelve por IP/MSH.
+# Además se abre un puerto por cada Equipo HL7 activo con `puerto` (ver puertos_deseados).
 PORT = 2575
+BACKLOG = 5
+
+# {puerto: equipo_id | None} de los sockets abiertos por el motor en curso
+PUERTOS_ABIERTOS = {}
+
+# 'hilos': este módulo (socket bloqueante); 'asyncio': ver listener_asyncio.py
+LISTENER_MOTOR = getattr(settings, "HL7_LISTENER_MOTOR", "hilos")
+
+# 'secuencial': atiende una conexión a la vez (comportamiento original).
+# 'concurrente': atiende varias conexiones en paralelo con un pool acotado de hilos.
+LISTENER_MODO = getattr(settings, "HL7_LISTENER_MODO", "secuencial")
+MAX_CONEXIONES = getattr(settings, "HL7_LISTENER_MAX_CONEXIONES", 16)
+# Segundos sin recibir datos antes de cerrar la conexión (0 = sin límite).
+# Aplica a ambos motores.
+TIMEOUT_INACTIVIDAD = getattr(settings, "HL7_LISTENER_TIMEOUT_INACTIVIDAD", 300)
+
+# Responder el ACK apenas se guarda el mensaje y dejar imágenes, resultados y PDF
+# a los workers de la cola persistente (configuracion/cola_hl7.py).
+ACK_INMEDIATO = getattr(settings, "HL7_ACK_INMEDIATO", False)
 
-START_BLOCK = b"\x0b"
-END_BLOCK = b"\x1c"
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVALO = 15
+KEEPALIVE_REINTENTOS = 4
+
+MAX_TRAMA = getattr(settings, "HL7_MLLP_MAX_TRAMA", MAX_TRAMA_DEFECTO)
+TAMANO_LECTURA = 65536
+
+
+class _OrdenPorMuestra:
+    """
+    Turnos por sample_id: los mensajes de una misma muestra se procesan
+    de a uno y en el orden en que pidieron turno (orden de llegada).
+    Muestras distintas no se bloquean entre sí.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # sample_id -> [siguiente_turno, turno_actual, pendientes]
+        self._turnos = {}
+
+    @contextmanager
+    def turno(self, sample_id):
+        if not sample_id:
+            yield
+            return
+
+        with self._cond:
+            estado = self._turnos.setdefault(sample_id, [0, 0, 0])
+            mi_turno = estado[0]
+            estado[0] += 1
+            estado[2] += 1
+            while estado[1] != mi_turno:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                estado[1] += 1
+                estado[2] -= 1
+                if estado[2] == 0:
+                    self._turnos.pop(sample_id, None)
+                self._cond.notify_all()
+
+
+_TURNOS_MUESTRA = _OrdenPorMuestra()
+_CUPOS_CONEXION = None
 
 
 def _msh_get_parts(msh_line: str):
@@ -79,6 +154,7 @@ def construir_ack(msh_in: str, ack_code: str = "AA", text: str = "") -> bytes:
     else:
         msa = f"MSA|{ack_code}|{in_ctrl}"
 
+    metricas_hl7.ACKS.inc(ack_code)
     return f"{msh}\r{msa}\r".encode("utf-8")
 
 
@@ -89,8 +165,11 @@ def construir_respuesta_consulta(sample_id, msh_in=""):
     """
     try:
         from laboratorio.models import Orden 
-        # Buscamos la orden por el numero_orden que envió el equipo
-        orden = Orden.objects.filter(numero_orden=sample_id).select_related('paciente').first()
+        # Buscamos la orden por el numero_orden que envió el equipo (con o sin ceros)
+        orden = (
+            Orden.objects.filter(numero_orden__in=ordenes_hl7.candidatos(sample_id))
+            .select_related('paciente').first()
+        )
         now = datetime.now().strftime("%Y%m%d%H%M%S")
 
         in_ctrl = _msh_get_control_id(msh_in) or "1"
@@ -162,51 +241,45 @@ def construir_respuesta_consulta(sample_id, msh_in=""):
 
 
 def parse_hl7(raw):
+    """
+    raw: bytes, texto o MensajeHL7 ya parseado.
+    Devuelve (msh, pid, obr, obx, sample_id, exam_codes).
+    """
     try:
-        text = raw.decode(errors="ignore")
-        lines = text.split("\r")
+        mensaje = como_mensaje(raw)
 
-        msh = next((l for l in lines if l.startswith("MSH")), "")
-        pid = next((l for l in lines if l.startswith("PID")), "")
-        obr = next((l for l in lines if l.startswith("OBR")), "")
-        qrd = next((l for l in lines if l.startswith("QRD")), "")
-        orc = next((l for l in lines if l.startswith("ORC")), "")
-        obx = "\n".join([l for l in lines if l.startswith("OBX")])
+        msh = mensaje.linea("MSH")
+        pid = mensaje.linea("PID")
+        obr = mensaje.linea("OBR")
+        obx = "\n".join(seg.texto for seg in mensaje.todos("OBX"))
 
         sample_id = ""
         exam_codes = ""
 
         try:
-            if obr:
-                parts = obr.split("|")
+            seg = mensaje.primero("OBR")
+            if seg:
                 # OBR-2: Placer Order Number (número de orden/sample ID - posición estándar)
                 # OBR-3: Filler Order Number (puede tener fecha u otro ID)
                 # Primero buscar en posición 2 (más común para número de orden)
-                sample_id = ""
-                if len(parts) > 2 and parts[2]:
-                    sample_id = parts[2]
-                elif len(parts) > 3 and parts[3]:
-                    sample_id = parts[3]
-                exam_codes = parts[4] if len(parts) > 4 else ""
-
-            if not sample_id and orc:
-                parts = orc.split("|")
+                sample_id = seg.campo(2) or seg.campo(3)
+                exam_codes = seg.campo(4)
+
+            seg = mensaje.primero("ORC")
+            if not sample_id and seg:
                 # ORC-2: Placer Order Number (número de orden en posición estándar)
                 # Formato: ORC|NW|NUMERO_ORDEN|...
-                if len(parts) > 2 and parts[2]:
-                    sample_id = parts[2]
                 # ORC-3 como fallback (otros equipos lo usan ahí)
-                elif len(parts) > 3 and parts[3]:
-                    sample_id = parts[3]
+                sample_id = seg.campo(2) or seg.campo(3)
 
-            if not sample_id and pid:
-                parts = pid.split("|")
+            seg = mensaje.primero("PID")
+            if not sample_id and seg:
                 # PID|1||001000||...  -> PID-3 = 001000 (si el equipo lo manda ahí)
-                sample_id = parts[3] if len(parts) > 3 else ""
+                sample_id = seg.campo(3)
 
-            if not sample_id and qrd:
-                parts = qrd.split("|")
-                sample_id = parts[8] if len(parts) > 8 else ""
+            seg = mensaje.primero("QRD")
+            if not sample_id and seg:
+                sample_id = seg.campo(8)
 
             if sample_id:
                 sample_id = (sample_id.split("^")[0] or "").strip()
@@ -242,41 +315,28 @@ def _infer_equipo(ip_equipo: str, msh_line: str):
     Prioridad:
       1) host == ip_equipo
       2) match por MSH sending_facility / sending_app contra codigo/modelo/nombre/fabricante
+    Se resuelve en memoria (registro_equipos), sin consultas en el caso normal.
     """
-    try:
-        if ip_equipo:
-            eq = Equipo.objects.filter(activo=True, host=str(ip_equipo).strip()).order_by("id").first()
-            if eq:
-                return eq
-    except Exception:
-        pass
-
     msh = _parse_msh_fields(msh_line or "")
-    app = msh.get("sending_app", "")
-    fac = msh.get("sending_facility", "")
-
     try:
-        qs = Equipo.objects.filter(activo=True)
-        # Buscamos coincidencias suaves
-        if fac:
-            qs = qs.filter(
-                models.Q(codigo__icontains=fac) |
-                models.Q(modelo__icontains=fac) |
-                models.Q(nombre__icontains=fac)
-            )
-        if app:
-            qs = qs.filter(
-                models.Q(codigo__icontains=app) |
-                models.Q(fabricante__icontains=app) |
-                models.Q(nombre__icontains=app)
-            )
-        return qs.order_by("id").first()
+        return registro_equipos.resolver_equipo(
+            ip_equipo, msh.get("sending_app", ""), msh.get("sending_facility", "")
+        )
     except Exception:
         return None
 
 
-def _extract_obx_items(hl7_raw_text: str):
+def _equipo_del_mensaje(msg: HL7Mensaje):
     """
+    El equipo guardado en el mensaje (si sigue activo) o, si no, el inferido por IP/MSH.
+    """
+    equipo = registro_equipos.equipo_por_id(msg.equipo_id) if msg.equipo_id else None
+    return equipo or _infer_equipo(msg.ip_equipo, msg.msh)
+
+
+def _extract_obx_items(mensaje):
+    """
+    mensaje: MensajeHL7 (o el texto crudo).
     Devuelve items OBX respetando el ORDEN DEL EQUIPO (OBX-1):
       [
         {
@@ -294,40 +354,27 @@ def _extract_obx_items(hl7_raw_text: str):
     items = []
 
     try:
-        for line in (hl7_raw_text or "").split("\r"):
-            line = (line or "").strip()
-            if not line.startswith("OBX|"):
-                continue
-
-            parts = line.split("|")
-            if len(parts) < 6:
+        for seg in como_mensaje(mensaje).todos("OBX"):
+            if not seg.tiene_campo(5):
                 continue
 
             try:
-                seq = int(parts[1])
+                seq = int(seg.campo(1))
             except Exception:
                 seq = 0
 
-            vtype = (parts[2] or "").strip()
-            obx3  = (parts[3] or "").strip()
-            val   = (parts[5] or "").strip()
-            unit  = (parts[6] or "").strip() if len(parts) > 6 else ""
-            ref   = (parts[7] or "").strip() if len(parts) > 7 else ""
-
-            parts3 = obx3.split("^")
-            code = parts3[1].strip() if len(parts3) > 1 else ""
-
+            code = seg.componente(3, 1).strip()
             if not code:
                 continue
 
             items.append({
                 "seq": seq,
                 "code": code,
-                "raw_obx3": obx3,
-                "value": val,
-                "unit": unit,
-                "ref": ref,
-                "type": vtype,
+                "raw_obx3": seg.campo(3).strip(),
+                "value": seg.campo(5).strip(),
+                "unit": seg.campo(6).strip(),
+                "ref": seg.campo(7).strip(),
+                "type": seg.campo(2).strip(),
             })
 
     except Exception:
@@ -359,7 +406,7 @@ def _is_graph_or_binary_obx(item):
 def _auto_cargar_resultados_desde_hl7(msg: HL7Mensaje):
     """
     AUTOMÁTICO:
-      HL7Mensaje -> Orden(numero_orden == sample_id) -> aplica EquipoMapeo -> guarda Resultado
+      HL7Mensaje -> msg.orden (enlazada al recibirlo) -> aplica EquipoMapeo -> guarda Resultado
     REGLA:
       NO crea OrdenExamen si no existe (solo carga si la orden ya lo tiene).
     """
@@ -368,7 +415,7 @@ def _auto_cargar_resultados_desde_hl7(msg: HL7Mensaje):
         return {"ok": False, "reason": "sin_sample_id", "creados": 0, "actualizados": 0, "ignorados": 0}
 
     try:
-        from django.db import transaction, models
+        from django.db import transaction
     except Exception:
         return {"ok": False, "reason": "no_importa_django_db", "creados": 0, "actualizados": 0, "ignorados": 0}
 
@@ -377,66 +424,40 @@ def _auto_cargar_resultados_desde_hl7(msg: HL7Mensaje):
     except Exception:
         return {"ok": False, "reason": "no_importa_modelos_laboratorio", "creados": 0, "actualizados": 0, "ignorados": 0}
 
-    orden = Orden.objects.filter(numero_orden=sample_id).first()
+    orden = ordenes_hl7.orden_del_mensaje(msg)
     if not orden:
         return {"ok": False, "reason": "sin_orden", "creados": 0, "actualizados": 0, "ignorados": 0}
 
-    equipo = None
-    try:
-        if msg.ip_equipo:
-            equipo = Equipo.objects.filter(activo=True, host=str(msg.ip_equipo).strip()).order_by("id").first()
-    except Exception:
-        equipo = None
-    if not equipo:
-        try:
-            msh_line = msg.msh or ""
-            msh = _parse_msh_fields(msh_line)
-            app = msh.get("sending_app", "")
-            fac = msh.get("sending_facility", "")
-            qs = Equipo.objects.filter(activo=True)
-
-            if fac:
-                qs = qs.filter(
-                    models.Q(codigo__icontains=fac) |
-                    models.Q(modelo__icontains=fac) |
-                    models.Q(nombre__icontains=fac)
-                )
-            if app:
-                qs = qs.filter(
-                    models.Q(codigo__icontains=app) |
-                    models.Q(fabricante__icontains=app) |
-                    models.Q(nombre__icontains=app)
-                )
-            equipo = qs.order_by("id").first()
-        except Exception:
-            equipo = None
+    equipo = _equipo_del_mensaje(msg)
 
     if not equipo:
         return {"ok": False, "reason": "sin_equipo", "creados": 0, "actualizados": 0, "ignorados": 0}
 
-    mapeos = (
-        EquipoMapeo.objects
-        .filter(equipo=equipo, activo=True)
-        .select_related("examen")
-        .all()
-    )
-    mapa = {}
-    for mp in mapeos:
-        if not mp.codigo_equipo:
-            continue
-        mapa[mp.codigo_equipo.strip()] = mp
-
+    mapa = registro_equipos.mapa_equipo(equipo)
     if not mapa:
         return {"ok": False, "reason": "sin_mapeos", "creados": 0, "actualizados": 0, "ignorados": 0}
 
-    items = _extract_obx_items(msg.mensaje_raw or "")
+    items = _extract_obx_items(msg.hl7)
     if not items:
         return {"ok": False, "reason": "sin_obx", "creados": 0, "actualizados": 0, "ignorados": 0}
 
     creados = 0
+    actualizados = 0
     ignorados = 0
 
     with transaction.atomic():
+        # Una consulta para los OrdenExamen de la orden y otra para los resultados ya cargados
+        oe_por_examen = {}
+        for oe in OrdenExamen.objects.filter(orden=orden).order_by("id"):
+            oe_por_examen.setdefault(oe.examen_id, oe)
+
+        existentes = set(
+            Resultado.objects
+            .filter(orden_examen__orden=orden)
+            .values_list("orden_examen_id", "parametro")
+        )
+
+        nuevos = []
         for it in items:
             if _is_graph_or_binary_obx(it):
                 ignorados += 1
@@ -452,7 +473,7 @@ def _auto_cargar_resultados_desde_hl7(msg: HL7Mensaje):
                 ignorados += 1
                 continue
 
-            if not mp.examen:
+            if not mp.examen_id:
                 ignorados += 1
                 continue
 
@@ -461,40 +482,37 @@ def _auto_cargar_resultados_desde_hl7(msg: HL7Mensaje):
                 ignorados += 1
                 continue
 
-            oe = OrdenExamen.objects.filter(orden=orden, examen=mp.examen).first()
+            oe = oe_por_examen.get(mp.examen_id)
             if not oe:
                 ignorados += 1
                 continue
 
             # VERIFICAR SI YA EXISTE EL RESULTADO - NO ACTUALIZAR NUNCA
             # Si ya existe, se ignora (no se actualiza aunque el equipo reenvíe)
-            existe = Resultado.objects.filter(
-                orden_examen=oe,
-                parametro=param
-            ).exists()
-
-            if existe:
+            if (oe.id, param) in existentes:
                 ignorados += 1
                 continue
+            existentes.add((oe.id, param))
 
             # Solo crear si no existe - NUNCA actualizar
-            obj = Resultado.objects.create(
+            valor = it.get("value") if (it.get("value") or "").strip() != "" else None
+            referencia = it.get("ref") if (it.get("ref") or "").strip() != "" else None
+            resultado = Resultado(
                 orden_examen=oe,
                 parametro=param,
-                valor=it.get("value") if (it.get("value") or "").strip() != "" else None,
+                valor=valor,
                 unidad=it.get("unit") if (it.get("unit") or "").strip() != "" else None,
-                referencia=it.get("ref") if (it.get("ref") or "").strip() != "" else None,
+                referencia=referencia,
                 orden_equipo=int(it.get("seq") or 0),
             )
+            # bulk_create no llama a save(): marcar el rango antes
+            resultado.marca_fuera_de_rango()
+            nuevos.append(resultado)
 
-            try:
-                if hasattr(obj, "marca_fuera_de_rango"):
-                    obj.marca_fuera_de_rango()
-                    obj.save(update_fields=["fuera_de_rango"])
-            except Exception:
-                pass
+        creados = len(nuevos)
 
-            creados += 1
+        if nuevos:
+            Resultado.objects.bulk_create(nuevos)
 
         if creados > 0:
             msg.estado = "procesado"
@@ -529,160 +547,428 @@ def _auto_cargar_resultados_desde_hl7(msg: HL7Mensaje):
     }
 
 
-def guardar_imagen_desde_obx(msg: HL7Mensaje, obx_linea: str) -> None:
+def guardar_imagen_desde_obx(msg: HL7Mensaje, obx_linea) -> None:
     """
-    Guarda una imagen PNG proveniente de un OBX tipo ED.
+    Guarda la imagen de un OBX tipo ED (formato según HL7_IMAGENES_FORMATO;
+    en modo diferido, solo la referencia al OBX).
+    obx_linea: Segmento OBX ya parseado o la línea de texto.
     """
     try:
-        partes = obx_linea.split("|")
-        if len(partes) < 6:
-            return
+        # Posición del OBX en el mensaje (para el modo diferido)
+        indice = None
+        if isinstance(obx_linea, Segmento):
+            indice = next((i for i, seg in enumerate(msg.hl7.todos("OBX")) if seg is obx_linea), None)
+        pendiente = imagenes_hl7.enviar_imagen(obx_linea, indice)
+        if pendiente:
+            imagenes_hl7.finalizar(msg, [pendiente])
+    except Exception as e:
+        print("ERROR guardando imagen HL7:", e)
 
-        secuencia = (partes[1] or "").strip()
-        codigo = (partes[3] or "").strip()
-        valor_ed = (partes[5] or "").strip()
 
-        png_bytes = GenruiImageDecoder.decode_hl7_raw(valor_ed)
+def _postprocesar_resultado(msg: HL7Mensaje):
+    """
+    Post-proceso de un mensaje de resultados ya guardado:
+    imágenes ED -> carga de resultados -> gráficas -> pedido del PDF de la orden.
+    Las imágenes se decodifican en el pool de procesos mientras se cargan los
+    resultados; sus HL7Imagen se crean antes del PDF.
+    Los errores de la carga de resultados se propagan (la cola los reintenta).
+    """
+    t0 = time.perf_counter()
+    pendientes = imagenes_hl7.enviar_imagenes(msg)
+    t_envio = time.perf_counter() - t0
 
-        nombre_logico = codigo.replace("^", "_") or "Imagen"
-        filename = f"hl7_{msg.id}_{secuencia}_{nombre_logico}.png"
+    try:
+        with metricas_hl7.medir("resultados"):
+            resultado = _auto_cargar_resultados_desde_hl7(msg)
+    finally:
+        # "imagenes" = envío al pool + espera y guardado (sin el tiempo de resultados)
+        t0 = time.perf_counter()
+        imagenes_hl7.finalizar(msg, pendientes)
+        metricas_hl7.observar("imagenes", t_envio + time.perf_counter() - t0)
+
+    # Histogramas / scatter a su tabla, antes del PDF que los dibuja
+    try:
+        graficas_hl7.extraer(msg)
+    except Exception:
+        traceback.print_exc()
+
+    # PDF de la orden en segundo plano; varios mensajes seguidos de la orden dan un solo informe
+    if resultado and resultado.get("ok") and resultado.get("orden_id"):
+        try:
+            from laboratorio.utils import pdf_servicio
+            pdf_servicio.solicitar(resultado["orden_id"])
+        except Exception as e:
+            print(f"Error pidiendo el PDF automático: {e}")
+            traceback.print_exc()
+
+    return resultado
+
+
+def _procesar_trama(hl7_message: bytes, ip_equipo: str, equipo_id=None, diario_seq=None):
+    """
+    Procesa UNA trama HL7 ya desenmarcada (sin 0x0B / 0x1C 0x0D) y devuelve
+    (respuesta, espera): la respuesta a enviar al equipo (ACK o respuesta de
+    consulta, sin MLLP) y los segundos que la conexión debe demorar la próxima
+    lectura por el control de admisión (ver admision.py).
+    equipo_id: el equipo dueño del puerto por el que llegó (None en el puerto general).
+    diario_seq: al reingresar desde el diario (reprocesar_diario_hl7); la trama
+    ya fue aceptada, así que no pasa de nuevo por admisión ni por el diario.
+    Con HL7_CAPTURA_DIR, la trama y su respuesta quedan en la captura (captura_hl7.py).
+    """
+    if diario_seq is not None or not captura_hl7.activa():
+        return _procesar_trama_recibida(hl7_message, ip_equipo, equipo_id, diario_seq)
+
+    llegada = time.time()
+    t0 = time.perf_counter()
+    respuesta, espera = _procesar_trama_recibida(hl7_message, ip_equipo, equipo_id)
+    captura_hl7.registrar(llegada, time.perf_counter() - t0, ip_equipo, equipo_id, hl7_message, respuesta)
+    return respuesta, espera
+
+
+def _procesar_trama_recibida(hl7_message, ip_equipo, equipo_id=None, diario_seq=None):
+    with metricas_hl7.medir("parseo"):
+        mensaje = MensajeHL7.desde_bytes(hl7_message)
+        msh, pid, obr, obx, sample_id, exam_codes = parse_hl7(mensaje)
+
+    equipo = registro_equipos.equipo_por_id(equipo_id) if equipo_id else None
+    if equipo is None:
+        equipo = _infer_equipo(ip_equipo, msh)
+    metricas_hl7.BYTES_RECIBIDOS.inc(equipo.codigo if equipo else ip_equipo, cantidad=len(hl7_message))
+
+    # Determinar tipo de mensaje
+    msg_type = _msh_get_message_type(msh)
+    has_qrd = mensaje.tiene("QRD")
+
+    is_query = False
+    try:
+        if has_qrd:
+            is_query = True
+        elif "QRY" in msg_type or "QBP" in msg_type:
+            is_query = True
+        elif ("ORM" in msg_type) and (not obx):
+            is_query = True
+    except Exception:
+        is_query = False
+
+    if diario_seq is not None:
+        return _procesar_admitido(
+            hl7_message, mensaje, ip_equipo, equipo, msh, pid, obr, obx, sample_id, exam_codes,
+            is_query, diario_seq,
+        ), 0.0
+
+    # Límites del equipo: si se pasa, AR sin guardar (el equipo reenvía luego)
+    motivo, espera = admision.entrar(equipo, len(hl7_message), ACK_INMEDIATO and not is_query)
+    if motivo:
+        metricas_hl7.RECHAZOS.inc(equipo.codigo, motivo)
+        print(f"HL7: mensaje de {equipo.codigo} rechazado ({motivo})")
+        return construir_ack(msh, "AR", admision.TEXTOS[motivo]), espera
+    if espera:
+        metricas_hl7.DEMORA_SEGUNDOS.inc(equipo.codigo, cantidad=espera)
 
-        imagen = HL7Imagen(
-            mensaje=msg,
-            tipo=nombre_logico,
-            formato="png"
+    try:
+        return _procesar_admitido(
+            hl7_message, mensaje, ip_equipo, equipo, msh, pid, obr, obx, sample_id, exam_codes, is_query
+        ), espera
+    finally:
+        admision.salir(equipo)
+
+
+def _procesar_admitido(hl7_message, mensaje, ip_equipo, equipo, msh, pid, obr, obx, sample_id, exam_codes,
+                       is_query, diario_seq=None):
+    raw_text = mensaje.texto
+    reingreso = diario_seq is not None
+
+    # Mensajes de la misma muestra se procesan uno a la vez y en orden de llegada,
+    # aunque lleguen por conexiones distintas.
+    with _TURNOS_MUESTRA.turno(sample_id):
+        # Guardar mensaje con el tipo correcto
+        tipo_mensaje = 'consulta' if is_query else 'resultado'
+
+        # Resultados: primero al diario en disco; desde acá el ACK ya no depende de la BD.
+        # (Las consultas no: su respuesta necesita la BD de todos modos.)
+        if not reingreso and not is_query:
+            with metricas_hl7.medir("diario"):
+                diario_seq = diario_hl7.registrar(hl7_message, ip_equipo, equipo.id if equipo else None)
+
+        msg = HL7Mensaje(
+            ip_equipo=ip_equipo,
+            mensaje_raw=raw_text,
+            sample_id=sample_id, exam_codes=exam_codes,
+            tipo=tipo_mensaje,
+            estado="pendiente",
+            equipo=equipo,
+            diario_seq=diario_seq,
         )
-        imagen.archivo.save(filename, ContentFile(png_bytes), save=True)
+        # El post-proceso reutiliza el mensaje ya parseado
+        msg.hl7 = mensaje
+        metricas_hl7.MENSAJES.inc(tipo_mensaje)
+        try:
+            # Enlace directo a la orden (índice único de numero_orden)
+            msg.orden = ordenes_hl7.resolver_orden(sample_id)
+            if ACK_INMEDIATO and not is_query:
+                # Mensaje y trabajo se confirman juntos: si hay ACK, hay trabajo en cola
+                with metricas_hl7.medir("guardado"), transaction.atomic():
+                    msg.save()
+                    cola_hl7.encolar(msg)
+                return construir_ack(msh, "AA")
+            with metricas_hl7.medir("guardado"):
+                msg.save()
+        except DatabaseError:
+            if reingreso or diario_seq is None:
+                raise
+            # Está en el diario: se confirma igual y reprocesar_diario_hl7 lo reingresa
+            print(f"HL7: no se pudo guardar la trama {diario_seq} del diario; queda para reprocesar")
+            traceback.print_exc()
+            return construir_ack(msh, "AA")
+
+        if is_query:
+            # Es una consulta - responder con datos del paciente
+            return construir_respuesta_consulta(sample_id, msh)
 
-    except Exception as e:
-        print("ERROR guardando imagen HL7:", e)
+        try:
+            _postprocesar_resultado(msg)
+        except Exception:
+            traceback.print_exc()
 
+        return construir_ack(msh, "AA")
 
-def listener_loop():
-    global LISTENER_RUNNING
 
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+def _configurar_conexion(conn):
+    """
+    Activa TCP keepalive para detectar equipos que se apagan sin cerrar el socket.
+    """
+    try:
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Opciones finas (solo Linux / algunos BSD)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, KEEPALIVE_IDLE)
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVE_INTERVALO)
+        if hasattr(socket, "TCP_KEEPCNT"):
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_REINTENTOS)
+    except OSError:
+        pass
+
 
+def _atender_conexion(conn, addr, equipo_id=None):
+    """
+    Atiende una conexión de equipo hasta que la cierre, se detenga el listener
+    o pase TIMEOUT_INACTIVIDAD segundos sin recibir datos.
+    """
+    metricas_hl7.CONEXIONES_TOTAL.inc()
+    metricas_hl7.CONEXIONES_ACTIVAS.inc()
     try:
-        server_socket.bind(("0.0.0.0", PORT))
-        server_socket.listen(5)
-        server_socket.settimeout(1.0)
-        LISTENER_RUNNING = True
+        _configurar_conexion(conn)
+        # Timeout corto para poder revisar LISTENER_RUNNING y la inactividad
+        conn.settimeout(1.0)
+        ultimo_dato = time.monotonic()
+
+        escaner = EscanerMLLP(MAX_TRAMA)
+        lectura = bytearray(TAMANO_LECTURA)
+        vista = memoryview(lectura)
 
         while LISTENER_RUNNING:
             try:
-                conn, addr = server_socket.accept()
+                n = conn.recv_into(lectura)
             except socket.timeout:
+                if TIMEOUT_INACTIVIDAD and time.monotonic() - ultimo_dato > TIMEOUT_INACTIVIDAD:
+                    print(f"HL7: conexión {addr[0]}:{addr[1]} cerrada por inactividad")
+                    break
                 continue
 
+            if not n:
+                break
+            ultimo_dato = time.monotonic()
+
+            cerrar = False
             try:
-                buffer = b""
-                while True:
-                    chunk = conn.recv(4096)
-                    if not chunk:
-                        break
-
-                    buffer += chunk
-
-                    if END_BLOCK in buffer:
-                        start = buffer.find(START_BLOCK) + 1
-                        end = buffer.find(END_BLOCK)
-                        hl7_message = buffer[start:end]
-
-                        raw_text = hl7_message.decode(errors="ignore")
-                        msh, pid, obr, obx, sample_id, exam_codes = parse_hl7(hl7_message)
-
-                        # Determinar tipo de mensaje
-                        msg_type = _msh_get_message_type(msh)
-                        has_qrd = ("QRD|" in raw_text)
-
-                        is_query = False
-                        try:
-                            if has_qrd:
-                                is_query = True
-                            elif "QRY" in msg_type or "QBP" in msg_type:
-                                is_query = True
-                            elif ("ORM" in msg_type) and (not obx):
-                                is_query = True
-                        except Exception:
-                            is_query = False
-
-                        # Guardar mensaje con el tipo correcto
-                        tipo_mensaje = 'consulta' if is_query else 'resultado'
-                        
-                        msg = HL7Mensaje.objects.create(
-                            ip_equipo=addr[0],
-                            mensaje_raw=raw_text,
-                            msh=msh, pid=pid, obr=obr, obx=obx,
-                            sample_id=sample_id, exam_codes=exam_codes,
-                            tipo=tipo_mensaje,
-                            estado="pendiente",
-                        )
-
-                        if is_query:
-                            # Es una consulta - responder con datos del paciente
-                            respuesta = construir_respuesta_consulta(sample_id, msh)
-                            conn.send(START_BLOCK + respuesta + END_BLOCK + b"\x0d")
-                        else:
-                            if obx:
-                                for linea in obx.split("\n"):
-                                    if "|ED|" in linea:
-                                        guardar_imagen_desde_obx(msg, linea)
-
-                            try:
-                                resultado = _auto_cargar_resultados_desde_hl7(msg)
-                                
-                                # Generar PDF automáticamente si se procesaron resultados
-                                if resultado and resultado.get("ok") and resultado.get("orden_id"):
-                                    try:
-                                        from laboratorio.models import Orden
-                                        from laboratorio.utils.pdf_informe import generar_pdf_para_orden
-                                        
-                                        orden_id = resultado.get("orden_id")
-                                        orden = Orden.objects.filter(id=orden_id).first()
-                                        
-                                        if orden:
-                                            pdf_path = generar_pdf_para_orden(orden, guardar=True)
-                                            print(f"PDF generado automáticamente: {pdf_path}")
-                                    except Exception as e:
-                                        print(f"Error generando PDF automático: {e}")
-                                        import traceback
-                                        traceback.print_exc()
-                                        
-                            except Exception:
-                                traceback.print_exc()
-
-                            ack = construir_ack(msh, "AA")
-                            conn.send(START_BLOCK + ack + END_BLOCK + b"\x0d")
-                        
-                        buffer = b""
-
-                conn.close()
-            except Exception:
-                traceback.print_exc()
+                with metricas_hl7.medir("recepcion"):
+                    tramas = escaner.alimentar(vista[:n])
+            except TramaDemasiadoGrande as e:
+                print(f"HL7: {addr[0]}:{addr[1]} {e}; se cierra la conexión")
+                # Las tramas completas que llegaron antes sí se procesan y responden
+                tramas, cerrar = e.tramas, True
+
+            for hl7_message in tramas:
+                respuesta, espera = _procesar_trama(hl7_message, addr[0], equipo_id)
+                with metricas_hl7.medir("ack"):
+                    conn.sendall(envolver(respuesta))
+                if espera and not cerrar:
+                    # No leer más de este equipo por un rato: el TCP lo frena
+                    time.sleep(espera)
+            if cerrar:
+                break
     except Exception:
         traceback.print_exc()
     finally:
+        metricas_hl7.CONEXIONES_ACTIVAS.dec()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _atender_conexion_en_pool(conn, addr, equipo_id=None):
+    try:
+        _atender_conexion(conn, addr, equipo_id)
+    finally:
+        # Cada hilo del pool tiene su propia conexión a la BD: liberarla al terminar
         try:
-            server_socket.close()
-        except:
+            connection.close()
+        except Exception:
             pass
+        _CUPOS_CONEXION.release()
+
+
+def puertos_deseados():
+    """
+    {puerto: equipo_id | None}: el puerto general PORT más uno por cada Equipo
+    HL7 activo con puerto propio (None si el puerto lo comparten varios).
+    """
+    puertos = {}
+    try:
+        for puerto, eq in registro_equipos.puertos_hl7().items():
+            puertos[puerto] = eq.id if eq else None
+    except Exception:
+        traceback.print_exc()
+    # En el puerto general el equipo siempre se resuelve por IP/MSH
+    puertos[PORT] = None
+    return puertos
+
+
+def _abrir_socket(puerto):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("0.0.0.0", puerto))
+        sock.listen(BACKLOG)
+        sock.setblocking(False)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def _sincronizar_puertos(selector, sockets, deseados):
+    """
+    Abre/cierra sockets para que coincidan con `deseados`. Las conexiones ya
+    aceptadas en un puerto que se cierra siguen hasta que el equipo las cierre.
+    """
+    for puerto in list(sockets):
+        if puerto not in deseados:
+            sock = sockets.pop(puerto)
+            selector.unregister(sock)
+            sock.close()
+            PUERTOS_ABIERTOS.pop(puerto, None)
+            print(f"HL7: puerto {puerto} cerrado")
+
+    for puerto, equipo_id in deseados.items():
+        if puerto not in sockets:
+            try:
+                sockets[puerto] = _abrir_socket(puerto)
+            except OSError as e:
+                print(f"HL7: no se pudo abrir el puerto {puerto}: {e}")
+                continue
+            selector.register(sockets[puerto], selectors.EVENT_READ, puerto)
+            print(f"HL7: escuchando en el puerto {puerto}")
+        PUERTOS_ABIERTOS[puerto] = equipo_id
+
+
+def listener_loop():
+    global LISTENER_RUNNING, _CUPOS_CONEXION
+
+    concurrente = (LISTENER_MODO == "concurrente")
+    pool = None
+    selector = selectors.DefaultSelector()
+    sockets = {}
+    ultimos = None
+
+    try:
+        LISTENER_RUNNING = True
+
+        if concurrente:
+            # Pool acotado: como máximo MAX_CONEXIONES equipos atendidos a la vez,
+            # el resto espera en el backlog del socket.
+            _CUPOS_CONEXION = threading.BoundedSemaphore(MAX_CONEXIONES)
+            pool = ThreadPoolExecutor(max_workers=MAX_CONEXIONES, thread_name_prefix="hl7-conn")
+
+        while LISTENER_RUNNING:
+            # Equipos activados/desactivados: abrir o cerrar sus puertos (en memoria
+            # salvo cuando el registro se invalida)
+            deseados = puertos_deseados()
+            if deseados != ultimos:
+                _sincronizar_puertos(selector, sockets, deseados)
+                ultimos = deseados
+
+            if concurrente and not _CUPOS_CONEXION.acquire(timeout=1.0):
+                continue
+
+            if not sockets:
+                # Ningún puerto se pudo abrir: reintentar cuando cambie la configuración
+                time.sleep(1.0)
+                listos = []
+            else:
+                listos = selector.select(timeout=1.0)
+            if not listos:
+                if concurrente:
+                    _CUPOS_CONEXION.release()
+                continue
+
+            key = listos[0][0]
+            try:
+                conn, addr = key.fileobj.accept()
+            except (BlockingIOError, InterruptedError):
+                if concurrente:
+                    _CUPOS_CONEXION.release()
+                continue
+
+            equipo_id = PUERTOS_ABIERTOS.get(key.data)
+            if concurrente:
+                pool.submit(_atender_conexion_en_pool, conn, addr, equipo_id)
+            else:
+                _atender_conexion(conn, addr, equipo_id)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        for sock in sockets.values():
+            try:
+                sock.close()
+            except Exception:
+                pass
+        selector.close()
+        PUERTOS_ABIERTOS.clear()
         LISTENER_RUNNING = False
+        if pool is not None:
+            pool.shutdown(wait=False)
 
 
 def start_listener():
     global LISTENER_RUNNING, LISTENER_THREAD
     if LISTENER_RUNNING:
         return False
-    LISTENER_THREAD = threading.Thread(target=listener_loop, daemon=True)
+    if LISTENER_MOTOR == "asyncio":
+        from .listener_asyncio import listener_loop_asyncio
+        objetivo = listener_loop_asyncio
+    else:
+        objetivo = listener_loop
+    LISTENER_THREAD = threading.Thread(target=objetivo, daemon=True)
     LISTENER_THREAD.start()
+    from laboratorio.utils import pdf_servicio
+    pdf_servicio.recuperar_pendientes()
+    try:
+        diario_hl7.purgar_confirmados()
+    except Exception:
+        traceback.print_exc()
+    if ACK_INMEDIATO:
+        cola_hl7.iniciar_workers()
     return True
 
 
 def stop_listener():
     global LISTENER_RUNNING
     LISTENER_RUNNING = False
+    cola_hl7.detener_workers()
+    captura_hl7.cerrar()
     return True
 
 
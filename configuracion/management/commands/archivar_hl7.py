@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from configuracion import archivo_hl7
+from configuracion.models import HL7Imagen, HL7Mensaje
+
+
+class Command(BaseCommand):
+    help = (
+        "Pasa los mensajes HL7 más viejos que --dias a los archivos mensuales de "
+        "HL7_ARCHIVO_DIR y los borra de la BD."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=archivo_hl7.DIAS,
+            help=f'Antigüedad mínima en días (por defecto {archivo_hl7.DIAS})',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=500,
+            help='Mensajes por lote (por defecto 500)',
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Solo cuenta los mensajes que se archivarían',
+        )
+
+    def handle(self, *args, **options):
+        if not archivo_hl7.DIRECTORIO:
+            raise CommandError('El archivo HL7 está desactivado (HL7_ARCHIVO_DIR)')
+
+        corte = timezone.now() - timedelta(days=options['dias'])
+        # Los que todavía tienen post-proceso en la cola se dejan para la próxima
+        candidatos = (
+            HL7Mensaje.objects
+            .filter(fecha_recepcion__lt=corte)
+            .exclude(trabajos__estado__in=('pendiente', 'en_proceso'))
+            .order_by('id')
+        )
+
+        if options['simular']:
+            self.stdout.write(f'Mensajes a archivar (anteriores a {corte:%Y-%m-%d}): {candidatos.count()}')
+            return
+
+        lote = max(1, options['lote'])
+        total = 0
+        ultimo = 0
+        while True:
+            mensajes = list(candidatos.filter(id__gt=ultimo)[:lote])
+            if not mensajes:
+                break
+            ids = [m.id for m in mensajes]
+
+            # Primero a disco (con fsync); recién después se borran de la BD
+            archivo_hl7.archivar(mensajes)
+            archivos = list(
+                HL7Imagen.objects.filter(mensaje_id__in=ids).exclude(archivo='').values_list('archivo', flat=True)
+            )
+            with transaction.atomic():
+                HL7Mensaje.objects.filter(id__in=ids).delete()
+            for nombre in archivos:
+                HL7Imagen.archivo.field.storage.delete(nombre)
+
+            ultimo = ids[-1]
+            total += len(ids)
+            self.stdout.write(f'  hasta el mensaje {ultimo}: {total}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Mensajes archivados: {total}; meses en el archivo: {", ".join(archivo_hl7.meses()) or "-"}'
+        ))
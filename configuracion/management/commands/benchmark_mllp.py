@@ -0,0 +1,86 @@
+import base64
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from configuracion.mllp import EscanerMLLP, envolver, START_BLOCK, END_BLOCK
+
+
+def _mensaje_cbc(numero, imagenes=3):
+    """
+    ORU^R01 parecido al del KT-6610: 30 OBX numéricos + imágenes ED de 255x255 RGB.
+    """
+    segmentos = [
+        f"MSH|^~\\&|Genrui|KT-6610|||20260101080000||ORU^R01|{numero}|P|2.3.1",
+        f"OBR|1|{numero:06d}|||",
+    ]
+    for i in range(1, 31):
+        segmentos.append(f"OBX|{i}|NM|^P{i}^||{i}.0|u|1-10|N|||F")
+    raw = base64.b64encode(os.urandom(255 * 255 * 3)).decode()
+    for i in range(imagenes):
+        segmentos.append(f"OBX|{31 + i}|ED|^Img{i}^||^Image^BMP^Base64^{raw}||||||F")
+    return "\r".join(segmentos).encode()
+
+
+def _bucle_original(chunks):
+    """Copia del bucle de recepción anterior (buffer += chunk, solo la primera trama)."""
+    tramas = []
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        if END_BLOCK in buffer:
+            start = buffer.find(START_BLOCK) + 1
+            end = buffer.find(END_BLOCK)
+            tramas.append(buffer[start:end])
+            buffer = b""
+    return tramas
+
+
+def _bucle_escaner(chunks):
+    escaner = EscanerMLLP(max_trama=0)
+    tramas = []
+    for chunk in chunks:
+        tramas.extend(escaner.alimentar(chunk))
+    return tramas
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark del enmarcado MLLP: bucle original vs EscanerMLLP."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mensajes', type=int, default=5, help='Mensajes por flujo')
+        parser.add_argument('--imagenes', type=int, default=3, help='Imágenes ED por mensaje')
+        parser.add_argument('--lectura', type=int, default=4096, help='Bytes por recv simulado')
+        parser.add_argument('--repeticiones', type=int, default=3)
+
+    def handle(self, *args, **options):
+        flujo = b"".join(
+            envolver(_mensaje_cbc(n, options['imagenes'])) for n in range(options['mensajes'])
+        )
+        paso = options['lectura']
+        chunks = [flujo[i:i + paso] for i in range(0, len(flujo), paso)]
+
+        self.stdout.write(
+            f"Flujo: {options['mensajes']} mensajes, {len(flujo) / 1024:.0f} KB, "
+            f"{len(chunks)} lecturas de {paso} bytes"
+        )
+
+        for nombre, funcion in (("original", _bucle_original), ("escaner", _bucle_escaner)):
+            mejor = None
+            tramas = []
+            for _ in range(options['repeticiones']):
+                t0 = time.perf_counter()
+                tramas = funcion(chunks)
+                dt = time.perf_counter() - t0
+                mejor = dt if mejor is None else min(mejor, dt)
+            self.stdout.write(
+                f"  {nombre:<9} {mejor * 1000:9.1f} ms  tramas={len(tramas)}"
+            )
+
+        # Varias tramas en una sola lectura: el bucle original pierde todas menos la primera
+        pegadas = [flujo]
+        self.stdout.write(
+            f"Todas las tramas en un solo recv: original={len(_bucle_original(pegadas))} "
+            f"escaner={len(_bucle_escaner(pegadas))}"
+        )
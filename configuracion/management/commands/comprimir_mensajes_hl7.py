@@ -0,0 +1,122 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+
+from configuracion import compresion_hl7
+from configuracion.models import HL7Mensaje
+
+
+CAMPOS = ['mensaje_texto', 'mensaje_comprimido', 'compresion', 'tamano_raw']
+
+
+def _formato(n):
+    n = float(n or 0)
+    for unidad in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unidad == 'GB':
+            return f'{n:.1f} {unidad}'
+        n /= 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Comprime por lotes el cuerpo de los mensajes HL7 ya guardados (los nuevos "
+        "se comprimen al recibirlos) y muestra cuánto espacio ocupan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--algoritmo',
+            default=compresion_hl7.ALGORITMO or 'ninguno',
+            choices=compresion_hl7.ALGORITMOS + ('ninguno',),
+            help="Algoritmo destino (por defecto HL7_COMPRESION); 'ninguno' descomprime",
+        )
+        parser.add_argument(
+            '--nivel',
+            type=int,
+            default=None,
+            help='Nivel de zlib / preset de lzma (por defecto HL7_COMPRESION_NIVEL)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=200,
+            help='Mensajes por transacción (por defecto 200)',
+        )
+        parser.add_argument(
+            '--informe',
+            action='store_true',
+            help='Solo muestra el espacio ocupado, sin modificar nada',
+        )
+        parser.add_argument(
+            '--vacuum',
+            action='store_true',
+            help='Al terminar ejecuta VACUUM (solo SQLite) para devolver el espacio al disco',
+        )
+
+    def handle(self, *args, **options):
+        if not options['informe']:
+            algoritmo = '' if options['algoritmo'] == 'ninguno' else options['algoritmo']
+            total = self._convertir(algoritmo, options['nivel'], max(1, options['lote']))
+            self.stdout.write(self.style.SUCCESS(f'Mensajes convertidos: {total}'))
+
+            if options['vacuum']:
+                if connection.vendor != 'sqlite':
+                    raise CommandError('--vacuum solo aplica a SQLite')
+                with connection.cursor() as cursor:
+                    cursor.execute('VACUUM')
+                self.stdout.write('VACUUM terminado')
+
+        self._informe()
+
+    def _convertir(self, algoritmo, nivel, lote):
+        pendientes = HL7Mensaje.objects.exclude(compresion=algoritmo).order_by('id')
+        total = 0
+        ultimo = 0
+        while True:
+            mensajes = list(pendientes.filter(id__gt=ultimo)[:lote])
+            if not mensajes:
+                return total
+            for msg in mensajes:
+                msg.asignar_cuerpo(msg.mensaje_raw, algoritmo, nivel)
+            with transaction.atomic():
+                HL7Mensaje.objects.bulk_update(mensajes, CAMPOS)
+            ultimo = mensajes[-1].id
+            total += len(mensajes)
+            self.stdout.write(f'  hasta el mensaje {ultimo}: {total}')
+
+    def _informe(self):
+        filas = (
+            HL7Mensaje.objects
+            .values('compresion')
+            .annotate(
+                mensajes=Count('id'),
+                original=Sum('tamano_raw'),
+                texto=Sum(Length('mensaje_texto')),
+                comprimido=Sum(Length('mensaje_comprimido')),
+            )
+            .order_by('compresion')
+        )
+
+        total_original = total_guardado = 0
+        self.stdout.write(f"{'Compresión':<12}{'Mensajes':>10}{'Original':>14}{'Guardado':>14}{'Ahorro':>9}")
+        for f in filas:
+            if f['compresion']:
+                original, guardado = f['original'] or 0, f['comprimido'] or 0
+            else:
+                # Filas sin comprimir anteriores a tamano_raw: se cuenta el texto
+                guardado = f['texto'] or 0
+                original = max(f['original'] or 0, guardado)
+            total_original += original
+            total_guardado += guardado
+            ahorro = 100 * (1 - guardado / original) if original else 0
+            self.stdout.write(
+                f"{f['compresion'] or 'ninguna':<12}{f['mensajes']:>10}"
+                f"{_formato(original):>14}{_formato(guardado):>14}{ahorro:>8.1f}%"
+            )
+
+        ahorrado = total_original - total_guardado
+        self.stdout.write(self.style.SUCCESS(
+            f'Total: {_formato(total_original)} -> {_formato(total_guardado)} '
+            f'(ahorro {_formato(ahorrado)})'
+        ))
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+
+from configuracion.models import HL7Grafica, HL7Mensaje
+from configuracion.ordenes_hl7 import clave_muestra, elegir
+from laboratorio.models import Orden
+
+
+class Command(BaseCommand):
+    help = (
+        "Completa sample_key y la orden de los mensajes HL7 ya guardados (los "
+        "nuevos se enlazan al recibirlos) y pasa la orden a sus gráficas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos',
+            action='store_true',
+            help='Recalcula también los mensajes que ya tienen clave u orden',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=500,
+            help='Mensajes por bulk_update (por defecto 500)',
+        )
+
+    def handle(self, *args, **options):
+        lote = max(1, options['lote'])
+
+        # numero_orden -> orden; se elige como al recibir el mensaje (ordenes_hl7.elegir)
+        ordenes = dict(Orden.objects.values_list('numero_orden', 'id').iterator())
+
+        mensajes = HL7Mensaje.objects.only('id', 'sample_id', 'sample_key', 'orden_id').order_by('id')
+        if not options['todos']:
+            mensajes = mensajes.filter(orden__isnull=True)
+
+        cambiados = []
+        total = 0
+        enlazados = 0
+        for msg in mensajes.iterator(chunk_size=lote):
+            clave = clave_muestra(msg.sample_id)
+            orden_id = elegir(msg.sample_id, ordenes)
+            if orden_id is None and not options['todos']:
+                orden_id = msg.orden_id
+            if clave == msg.sample_key and orden_id == msg.orden_id:
+                continue
+            msg.sample_key = clave
+            msg.orden_id = orden_id
+            cambiados.append(msg)
+            total += 1
+            enlazados += orden_id is not None
+            if len(cambiados) >= lote:
+                HL7Mensaje.objects.bulk_update(cambiados, ['sample_key', 'orden'])
+                cambiados = []
+        if cambiados:
+            HL7Mensaje.objects.bulk_update(cambiados, ['sample_key', 'orden'])
+
+        graficas = HL7Grafica.objects.all() if options['todos'] else HL7Grafica.objects.filter(orden__isnull=True)
+        graficas_actualizadas = graficas.update(
+            orden_id=Subquery(HL7Mensaje.objects.filter(pk=OuterRef('mensaje_id')).values('orden_id')[:1])
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Mensajes actualizados: {total} (con orden: {enlazados}); '
+            f'gráficas revisadas: {graficas_actualizadas}'
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from configuracion import graficas_hl7
+from configuracion.models import HL7Mensaje
+
+
+class Command(BaseCommand):
+    help = (
+        "Extrae histogramas y scatter de los mensajes HL7 ya guardados a la tabla "
+        "HL7Grafica (los mensajes nuevos se extraen al recibirlos)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos',
+            action='store_true',
+            help='Reextrae también los mensajes que ya tienen gráficas',
+        )
+
+    def handle(self, *args, **options):
+        # El cuerpo puede estar comprimido: se revisa cada mensaje de resultados
+        mensajes = HL7Mensaje.objects.filter(tipo='resultado').order_by('id')
+        if not options['todos']:
+            mensajes = mensajes.filter(graficas__isnull=True)
+
+        total_msg = 0
+        total_graf = 0
+        for msg in mensajes.iterator(chunk_size=200):
+            if not any(graficas_hl7.clasificar(seg.campo(3)) for seg in msg.hl7.todos("OBX")):
+                continue
+            total_graf += graficas_hl7.extraer(msg)
+            total_msg += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Mensajes procesados: {total_msg}; gráficas guardadas: {total_graf}'
+        ))
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from configuracion import cola_hl7
+from configuracion.models import HL7Trabajo
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de post-proceso HL7 (imágenes, resultados y PDF)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Cantidad de workers (por defecto HL7_COLA_TRABAJADORES)',
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Drena la cola en este hilo y termina',
+        )
+        parser.add_argument(
+            '--reintentar-errores',
+            action='store_true',
+            help='Devuelve a la cola los trabajos en estado error',
+        )
+
+    def handle(self, *args, **options):
+        if options['reintentar_errores']:
+            n = HL7Trabajo.objects.filter(estado='error').update(estado='pendiente', intentos=0)
+            self.stdout.write(f'Trabajos devueltos a la cola: {n}')
+
+        if options['una_vez']:
+            cola_hl7.recuperar_huerfanos()
+            total = cola_hl7.procesar_pendientes()
+            self.stdout.write(f'Trabajos procesados: {total}')
+            self.stdout.write(str(cola_hl7.resumen_cola()))
+            return
+
+        cola_hl7.iniciar_workers(options['workers'])
+        self.stdout.write(self.style.NOTICE('Workers de la cola HL7 iniciados (Ctrl+C para detener)'))
+        try:
+            while True:
+                time.sleep(10)
+                self.stdout.write(str(cola_hl7.resumen_cola()))
+        except KeyboardInterrupt:
+            cola_hl7.detener_workers()
@@ -7,19 +7,22 @@ class Command(BaseCommand):
     help = "Regenera las imágenes PNG de mensajes HL7 antiguos."
 
     def handle(self, *args, **options):
-        mensajes = HL7Mensaje.objects.filter(obx__icontains='|ED|').order_by('id')
+        # El cuerpo puede estar comprimido: el filtro por OBX ED se hace al leerlo
+        mensajes = HL7Mensaje.objects.filter(tipo='resultado').order_by('id')
 
         total_img = 0
 
-        for msg in mensajes:
+        for msg in mensajes.iterator(chunk_size=200):
+            if not any(seg.campo(2) == "ED" for seg in msg.hl7.todos("OBX")):
+                continue
             print(f"Procesando mensaje {msg.id}...")
 
             # Borrar imágenes previas
             msg.imagenes.all().delete()
 
-            for linea in msg.obx.split("\n"):
-                if "|ED|" in linea:
-                    guardar_imagen_desde_obx(msg, linea)
+            for seg in msg.hl7.todos("OBX"):
+                if seg.campo(2) == "ED":
+                    guardar_imagen_desde_obx(msg, seg)
                     total_img += 1
 
         print(f"Listo. Imágenes generadas: {total_img}")
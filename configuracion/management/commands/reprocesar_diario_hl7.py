@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from configuracion import diario_hl7
+from configuracion.listener_thread import _procesar_trama
+
+
+class Command(BaseCommand):
+    help = (
+        "Reingresa, en orden, las tramas del diario HL7 que no llegaron a "
+        "guardarse como HL7Mensaje y borra los segmentos ya confirmados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Solo lista las tramas pendientes',
+        )
+        parser.add_argument(
+            '--conservar',
+            action='store_true',
+            help='No borra los segmentos ya confirmados en la BD',
+        )
+
+    def handle(self, *args, **options):
+        diario = diario_hl7.diario()
+        if diario is None:
+            raise CommandError('El diario HL7 está desactivado (HL7_DIARIO_DIR)')
+
+        registros = list(diario.registros())
+        if not registros:
+            self.stdout.write('El diario está vacío')
+            return
+
+        # En la BD o ya pasados de la BD al archivo mensual
+        confirmados = diario_hl7.confirmados(registros[0].seq)
+        pendientes = [r for r in registros if r.seq not in confirmados]
+        self.stdout.write(
+            f'Tramas en el diario: {len(registros)} (seq {registros[0].seq}-{registros[-1].seq}); '
+            f'sin guardar: {len(pendientes)}'
+        )
+
+        if options['simular']:
+            for r in pendientes:
+                self.stdout.write(f'  {r.seq} {r.ip} equipo={r.equipo_id} {len(r.datos)} bytes')
+            return
+
+        for r in pendientes:
+            try:
+                _procesar_trama(r.datos, r.ip, r.equipo_id, diario_seq=r.seq)
+            except Exception as e:
+                # Se corta para no alterar el orden; lo que falta queda para la próxima vez
+                raise CommandError(f'Error reingresando la trama {r.seq}: {e}')
+            confirmados.add(r.seq)
+            self.stdout.write(f'  reingresada {r.seq}')
+
+        if not options['conservar']:
+            borrados = diario.purgar(confirmados)
+            self.stdout.write(f'Segmentos borrados: {borrados}')
+
+        self.stdout.write(self.style.SUCCESS(f'Tramas reingresadas: {len(pendientes)}'))
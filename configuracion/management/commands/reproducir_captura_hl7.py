@@ -0,0 +1,279 @@
+import json
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from configuracion import captura_hl7, ordenes_hl7
+from configuracion.hl7 import MensajeHL7
+from configuracion.listener_thread import PORT, parse_hl7
+from configuracion.mllp import EscanerMLLP, envolver
+from configuracion.models import Equipo, HL7Trabajo
+from laboratorio.models import Resultado
+
+
+PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def _percentiles(valores):
+    valores = sorted(valores)
+    if not valores:
+        return {}
+    fila = {
+        f"p{int(p * 100)}": valores[min(len(valores) - 1, int(round(p * (len(valores) - 1))))]
+        for p in PERCENTILES
+    }
+    fila["max"] = valores[-1]
+    fila["n"] = len(valores)
+    return fila
+
+
+def _tipo(trama):
+    msh = MensajeHL7.desde_bytes(trama).primero("MSH")
+    tipo = (msh.campo(8) if msh else "").split("^")[0]
+    return tipo or "?"
+
+
+def _normalizar_respuesta(respuesta):
+    """Respuesta sin MSH (fecha e id de control propios de cada corrida)."""
+    segmentos = respuesta.decode("utf-8", errors="ignore").replace("\n", "\r").split("\r")
+    return "\r".join(s for s in segmentos if s and not s.startswith("MSH|"))
+
+
+class _Fuente(threading.Thread):
+    """Reenvía, por una conexión, las tramas de un mismo equipo en su orden y a su ritmo."""
+
+    def __init__(self, destino, registros, inicio, t0, velocidad, timeout, salida):
+        super().__init__(daemon=True)
+        self.destino = destino
+        self.registros = registros      # [(indice, RegistroCaptura)]
+        self.inicio = inicio
+        self.t0 = t0
+        self.velocidad = velocidad
+        self.timeout = timeout
+        self.salida = salida            # {indice: (latencia | None, respuesta | error)}
+
+    def _respuesta(self, sock, escaner):
+        limite = time.monotonic() + self.timeout
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise socket.timeout()
+            sock.settimeout(restante)
+            datos = sock.recv(65536)
+            if not datos:
+                raise ConnectionResetError("el listener cerró la conexión")
+            tramas = escaner.alimentar(datos)
+            if tramas:
+                return tramas[0]
+
+    def run(self):
+        sock = None
+        escaner = EscanerMLLP()
+        for indice, r in self.registros:
+            if self.velocidad:
+                espera = self.inicio + (r.llegada - self.t0) / self.velocidad - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+            try:
+                if sock is None:
+                    sock = socket.create_connection(self.destino, timeout=self.timeout)
+                    escaner.reiniciar()
+                t = time.perf_counter()
+                sock.sendall(envolver(r.trama))
+                respuesta = self._respuesta(sock, escaner)
+                self.salida[indice] = (time.perf_counter() - t, respuesta)
+            except OSError as e:
+                self.salida[indice] = (None, type(e).__name__)
+                if sock is not None:
+                    sock.close()
+                sock = None
+        if sock is not None:
+            sock.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Reenvía una captura del listener (HL7_CAPTURA_DIR) a un listener local, "
+        "a la velocidad original, N veces más rápido o sin pausas, y compara ACK, "
+        "Resultado y latencias con una corrida base."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivos', nargs='+', help='Archivos captura-*.hl7c')
+        parser.add_argument('--ip', default='127.0.0.1')
+        parser.add_argument('--puerto', type=int, default=PORT,
+                            help='Puerto general; las tramas de equipos con puerto propio van a ese puerto')
+        parser.add_argument('--velocidad', type=float, default=1.0,
+                            help='1 = ritmo original, 10 = diez veces más rápido, 0 = sin pausas')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Segundos de espera de cada respuesta')
+        parser.add_argument('--esperar-cola', type=float, default=120.0,
+                            help='Segundos máximos de espera a que la cola HL7 termine (ACK inmediato)')
+        parser.add_argument('--guardar-base', metavar='JSON', help='Guarda esta corrida como base')
+        parser.add_argument('--comparar', metavar='JSON', help='Compara con una base guardada antes')
+
+    def handle(self, *args, **options):
+        registros = []
+        for ruta in options['archivos']:
+            registros.extend(captura_hl7.leer(ruta))
+        if not registros:
+            raise CommandError('La captura está vacía')
+        registros.sort(key=lambda r: r.llegada)
+        self.stdout.write(
+            f'Tramas: {len(registros)} en {registros[-1].llegada - registros[0].llegada:.1f} s de captura; '
+            f'velocidad {options["velocidad"] or "máxima"}'
+        )
+
+        salida = self._reproducir(registros, options)
+        corrida = self._resumen(registros, salida, options)
+        self._informe(corrida)
+
+        if options['guardar_base']:
+            with open(options['guardar_base'], 'w', encoding='utf-8') as f:
+                json.dump(corrida, f, ensure_ascii=False, indent=1)
+            self.stdout.write(f'Base guardada en {options["guardar_base"]}')
+
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as f:
+                base = json.load(f)
+            diferencias = self._comparar(base, corrida)
+            if diferencias:
+                raise CommandError(f'{diferencias} diferencias con la base')
+            self.stdout.write(self.style.SUCCESS('Sin diferencias con la base'))
+
+    # ------------------------------
+
+    def _reproducir(self, registros, options):
+        puertos = {}
+        for equipo_id, puerto in Equipo.objects.exclude(puerto__isnull=True).values_list('id', 'puerto'):
+            try:
+                puertos[equipo_id] = int(puerto)
+            except (TypeError, ValueError):
+                pass
+
+        # Una conexión por equipo de origen (IP + puerto), como en producción
+        fuentes = {}
+        for indice, r in enumerate(registros):
+            fuentes.setdefault((r.ip, r.equipo_id), []).append((indice, r))
+
+        salida = {}
+        inicio = time.monotonic()
+        self._segundos_inicio = time.perf_counter()
+        hilos = [
+            _Fuente(
+                (options['ip'], puertos.get(equipo_id, options['puerto'])), lista, inicio,
+                registros[0].llegada, options['velocidad'], options['timeout'], salida,
+            )
+            for (_, equipo_id), lista in fuentes.items()
+        ]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        self._segundos = time.perf_counter() - self._segundos_inicio
+
+        # Con ACK inmediato los resultados se cargan después: esperar a la cola
+        limite = time.monotonic() + options['esperar_cola']
+        while HL7Trabajo.objects.filter(estado__in=('pendiente', 'en_proceso')).exists():
+            if time.monotonic() > limite:
+                self.stdout.write(self.style.WARNING('La cola HL7 no terminó a tiempo; los Resultado pueden estar incompletos'))
+                break
+            time.sleep(0.5)
+        return salida
+
+    def _resumen(self, registros, salida, options):
+        latencias = {}
+        captura = {}
+        respuestas = {}
+        errores = 0
+        muestras = set()
+        for indice, r in enumerate(registros):
+            tipo = _tipo(r.trama)
+            captura.setdefault(tipo, []).append(r.duracion)
+            latencia, respuesta = salida.get(indice, (None, 'sin_enviar'))
+            if latencia is None:
+                errores += 1
+                respuestas[str(indice)] = f'ERROR {respuesta}'
+            else:
+                latencias.setdefault(tipo, []).append(latencia)
+                respuestas[str(indice)] = _normalizar_respuesta(respuesta)
+            sample_id = parse_hl7(r.trama)[4]
+            if sample_id:
+                muestras.add(sample_id)
+
+        ordenes = {o.id: o.numero_orden for o in map(ordenes_hl7.resolver_orden, sorted(muestras)) if o}
+        resultados = sorted(
+            [numero, parametro, valor or '', unidad or '', fuera]
+            for numero, parametro, valor, unidad, fuera in (
+                Resultado.objects
+                .filter(orden_examen__orden_id__in=list(ordenes))
+                .values_list('orden_examen__orden__numero_orden', 'parametro', 'valor', 'unidad', 'fuera_de_rango')
+            )
+        )
+
+        return {
+            'tramas': len(registros),
+            'velocidad': options['velocidad'],
+            'segundos': round(self._segundos, 3),
+            'mensajes_por_segundo': round((len(registros) - errores) / self._segundos, 2) if self._segundos else 0,
+            'errores': errores,
+            'latencias': {tipo: _percentiles(v) for tipo, v in latencias.items()},
+            'latencias_captura': {tipo: _percentiles(v) for tipo, v in captura.items()},
+            'respuestas': respuestas,
+            'resultados': resultados,
+        }
+
+    def _tabla(self, titulo, latencias):
+        self.stdout.write(f'{titulo:<22}{"n":>6}' + ''.join(f'{c:>9}' for c in ('p50', 'p90', 'p95', 'p99', 'max')))
+        for tipo, fila in sorted(latencias.items()):
+            self.stdout.write(
+                f'  {tipo:<20}{fila["n"]:>6}'
+                + ''.join(f'{fila[c] * 1000:>9.1f}' for c in ('p50', 'p90', 'p95', 'p99', 'max'))
+            )
+
+    def _informe(self, corrida):
+        self.stdout.write(
+            f'Reenviadas en {corrida["segundos"]:.1f} s: {corrida["mensajes_por_segundo"]} msg/s; '
+            f'errores: {corrida["errores"]}; Resultado de las órdenes: {len(corrida["resultados"])}'
+        )
+        self._tabla('ACK (ms)', corrida['latencias'])
+        self._tabla('Proceso capturado (ms)', corrida['latencias_captura'])
+
+    def _comparar(self, base, corrida):
+        diferencias = 0
+
+        distintas = [
+            i for i, r in corrida['respuestas'].items()
+            if base['respuestas'].get(i) != r
+        ]
+        if distintas:
+            diferencias += len(distintas)
+            self.stdout.write(self.style.WARNING(f'Respuestas distintas: {len(distintas)}'))
+            for i in distintas[:5]:
+                self.stdout.write(f'  trama {i}:\n    base:   {base["respuestas"].get(i)!r}\n    ahora:  {corrida["respuestas"][i]!r}')
+
+        antes = {tuple(r) for r in base['resultados']}
+        ahora = {tuple(r) for r in corrida['resultados']}
+        if antes != ahora:
+            diferencias += len(antes ^ ahora)
+            self.stdout.write(self.style.WARNING(
+                f'Resultado: {len(ahora - antes)} nuevos o cambiados, {len(antes - ahora)} faltan'
+            ))
+            for r in sorted(antes - ahora)[:5]:
+                self.stdout.write(f'  - {r}')
+            for r in sorted(ahora - antes)[:5]:
+                self.stdout.write(f'  + {r}')
+
+        self.stdout.write(
+            f'Rendimiento: {base["mensajes_por_segundo"]} -> {corrida["mensajes_por_segundo"]} msg/s '
+            f'(base a velocidad {base["velocidad"] or "máxima"})'
+        )
+        for tipo, fila in sorted(corrida['latencias'].items()):
+            anterior = base['latencias'].get(tipo)
+            if anterior:
+                self.stdout.write(
+                    f'  {tipo}: p50 {anterior["p50"] * 1000:.1f} -> {fila["p50"] * 1000:.1f} ms, '
+                    f'p95 {anterior["p95"] * 1000:.1f} -> {fila["p95"] * 1000:.1f} ms'
+                )
+        return diferencias
@@ -0,0 +1,212 @@
+# configuracion/metricas_hl7.py
+"""
+Métricas en memoria del pipeline HL7 (contadores, indicadores e histogramas
+de latencia por etapa), expuestas en formato de texto de Prometheus en
+configuracion/hl7/metrics/ y resumidas en el panel HL7.
+
+Sin dependencias externas: cada proceso lleva sus propias métricas (las del
+listener viven en el proceso web que lo arranca; `procesar_cola_hl7` corriendo
+aparte no se ve aquí).
+
+Etapas: recepcion (enmarcado MLLP), parseo, diario (append + fsync),
+guardado (insert HL7Mensaje), imagenes, decodificacion (de cada imagen, en el
+proceso del pool), resultados, pdf, ack (envío).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+ETAPAS = ("recepcion", "parseo", "diario", "guardado", "imagenes", "decodificacion", "resultados", "pdf", "ack")
+
+# Límites (segundos) de los buckets de latencia
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ""
+    pares = []
+    for n, v in zip(nombres, valores):
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pares.append(f'{n}="{v}"')
+    return "{" + ",".join(pares) + "}"
+
+
+class Contador:
+
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores, cantidad=1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def valores(self):
+        with self._lock:
+            return dict(self._valores)
+
+    def lineas(self):
+        for clave, valor in sorted(self.valores().items()):
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}"
+
+
+class Indicador(Contador):
+
+    tipo = "gauge"
+
+    def dec(self, *valores, cantidad=1):
+        self.inc(*valores, cantidad=-cantidad)
+
+
+class Histograma:
+
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        # clave -> [conteos por bucket (+Inf al final), suma, total]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, segundos, *valores):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            i = 0
+            for limite in self.buckets:
+                if segundos <= limite:
+                    break
+                i += 1
+            serie[0][i] += 1
+            serie[1] += segundos
+            serie[2] += 1
+
+    def series(self):
+        with self._lock:
+            return {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+
+    def lineas(self):
+        for clave, (conteos, suma, total) in sorted(self.series().items()):
+            acumulado = 0
+            for limite, n in zip(self.buckets + ("+Inf",), conteos):
+                acumulado += n
+                etiquetas = _etiquetas(self.etiquetas + ("le",), clave + (limite,))
+                yield f"{self.nombre}_bucket{etiquetas} {acumulado}"
+            etiquetas = _etiquetas(self.etiquetas, clave)
+            yield f"{self.nombre}_sum{etiquetas} {suma:.6f}"
+            yield f"{self.nombre}_count{etiquetas} {total}"
+
+    def percentil(self, clave, p):
+        """Aproximación por límite superior de bucket (None si no hay datos)."""
+        conteos, _, total = self.series().get(clave, (None, 0, 0))
+        if not total:
+            return None
+        objetivo = total * p
+        acumulado = 0
+        for limite, n in zip(self.buckets + (None,), conteos):
+            acumulado += n
+            if acumulado >= objetivo:
+                return limite
+        return None
+
+
+ETAPA_SEGUNDOS = Histograma("hl7_etapa_segundos", "Latencia por etapa del pipeline HL7", ("etapa",))
+ETAPA_ERRORES = Contador("hl7_etapa_errores_total", "Errores por etapa del pipeline HL7", ("etapa",))
+CONEXIONES_ACTIVAS = Indicador("hl7_conexiones_activas", "Conexiones de equipos abiertas en el listener")
+CONEXIONES_TOTAL = Contador("hl7_conexiones_total", "Conexiones aceptadas por el listener")
+BYTES_RECIBIDOS = Contador("hl7_bytes_recibidos_total", "Bytes de tramas HL7 recibidas por equipo", ("equipo",))
+MENSAJES = Contador("hl7_mensajes_total", "Mensajes HL7 recibidos por tipo", ("tipo",))
+ACKS = Contador("hl7_acks_total", "ACK enviados por código (MSA-1)", ("codigo",))
+RECHAZOS = Contador("hl7_rechazos_total", "Mensajes rechazados por control de admisión", ("equipo", "motivo"))
+DEMORA_SEGUNDOS = Contador("hl7_demora_lectura_segundos_total", "Segundos de lectura demorada por tasa de bytes", ("equipo",))
+
+_METRICAS = (
+    ETAPA_SEGUNDOS, ETAPA_ERRORES, CONEXIONES_ACTIVAS, CONEXIONES_TOTAL,
+    BYTES_RECIBIDOS, MENSAJES, ACKS, RECHAZOS, DEMORA_SEGUNDOS,
+)
+_INICIO = time.time()
+
+# Series sin etiquetas: que aparezcan en 0 desde el primer scrape
+CONEXIONES_ACTIVAS.inc(cantidad=0)
+CONEXIONES_TOTAL.inc(cantidad=0)
+
+
+@contextmanager
+def medir(etapa):
+    """
+    with medir("parseo"): ...
+    Registra la duración aunque haya excepción (y la cuenta como error).
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        ETAPA_ERRORES.inc(etapa)
+        raise
+    finally:
+        ETAPA_SEGUNDOS.observar(time.perf_counter() - t0, etapa)
+
+
+def observar(etapa, segundos):
+    ETAPA_SEGUNDOS.observar(segundos, etapa)
+
+
+def exponer():
+    """Texto en formato de exposición de Prometheus (0.0.4)."""
+    lineas = [
+        "# HELP hl7_inicio_segundos Momento (epoch) en que se cargaron las métricas",
+        "# TYPE hl7_inicio_segundos gauge",
+        f"hl7_inicio_segundos {_INICIO:.0f}",
+    ]
+    for m in _METRICAS:
+        lineas.append(f"# HELP {m.nombre} {m.ayuda}")
+        lineas.append(f"# TYPE {m.nombre} {m.tipo}")
+        lineas.extend(m.lineas())
+    return "\n".join(lineas) + "\n"
+
+
+def resumen():
+    """
+    Para el panel del dashboard:
+      {'etapas': [{'etapa', 'total', 'promedio_ms', 'p95_ms', 'errores'}, ...],
+       'conexiones_activas', 'conexiones_total', 'acks': {...}, 'bytes': {...}, 'mensajes': {...},
+       'rechazos': [{'equipo', 'motivo', 'total'}, ...]}
+    """
+    series = ETAPA_SEGUNDOS.series()
+    errores = ETAPA_ERRORES.valores()
+    etapas = []
+    for etapa in ETAPAS:
+        _, suma, total = series.get((etapa,), (None, 0.0, 0))
+        p95 = ETAPA_SEGUNDOS.percentil((etapa,), 0.95)
+        etapas.append({
+            "etapa": etapa,
+            "total": total,
+            "promedio_ms": round(suma / total * 1000, 2) if total else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "errores": errores.get((etapa,), 0),
+        })
+
+    return {
+        "etapas": etapas,
+        "conexiones_activas": CONEXIONES_ACTIVAS.valores().get((), 0),
+        "conexiones_total": CONEXIONES_TOTAL.valores().get((), 0),
+        "acks": {k[0]: v for k, v in sorted(ACKS.valores().items())},
+        "bytes": {k[0]: v for k, v in sorted(BYTES_RECIBIDOS.valores().items())},
+        "mensajes": {k[0]: v for k, v in sorted(MENSAJES.valores().items())},
+        "rechazos": [
+            {"equipo": k[0], "motivo": k[1], "total": v}
+            for k, v in sorted(RECHAZOS.valores().items())
+        ],
+    }
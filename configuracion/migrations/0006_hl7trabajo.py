@@ -0,0 +1,32 @@
+# Generated by Django 5.2.11 on 2026-10-17 22:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configuracion', '0005_hl7mensaje_tipo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HL7Trabajo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('hecho', 'Hecho'), ('error', 'Error')], db_index=True, default='pendiente', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('disponible_desde', models.DateTimeField(default=django.utils.timezone.now, help_text='No se reintenta antes de esta fecha.')),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('mensaje', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos', to='configuracion.hl7mensaje')),
+            ],
+            options={
+                'verbose_name': 'Trabajo HL7',
+                'verbose_name_plural': 'Trabajos HL7',
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.11 on 2026-10-17 23:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configuracion', '0006_hl7trabajo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hl7mensaje',
+            name='equipo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mensajes_hl7', to='configuracion.equipo'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.11 on 2026-10-17 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configuracion', '0007_hl7mensaje_equipo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipo',
+            name='max_bytes_por_segundo',
+            field=models.PositiveIntegerField(default=0, help_text='Tasa de recepción; por encima se demora la lectura y, si no alcanza, ACK AR. 0 = sin límite.'),
+        ),
+        migrations.AddField(
+            model_name='equipo',
+            name='max_cola',
+            field=models.PositiveIntegerField(default=0, help_text='Trabajos pendientes en la cola de post-proceso (ACK inmediato); el exceso recibe ACK AR. 0 = sin límite.'),
+        ),
+        migrations.AddField(
+            model_name='equipo',
+            name='max_mensajes_en_curso',
+            field=models.PositiveIntegerField(default=0, help_text='Mensajes de este equipo procesándose a la vez; el exceso recibe ACK AR. 0 = sin límite.'),
+        ),
+    ]
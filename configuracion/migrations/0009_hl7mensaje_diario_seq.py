@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-17 23:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configuracion', '0008_equipo_limites_admision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hl7mensaje',
+            name='diario_seq',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-17 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configuracion', '0009_hl7mensaje_diario_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hl7imagen',
+            name='obx_indice',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='hl7imagen',
+            name='archivo',
+            field=models.ImageField(blank=True, upload_to='lis_imagenes/%Y/%m/%d/'),
+        ),
+    ]
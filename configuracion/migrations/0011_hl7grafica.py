@@ -0,0 +1,30 @@
+# Generated by Django 5.2.11 on 2026-10-17 23:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configuracion', '0010_hl7imagen_diferida'),
+        ('laboratorio', '0012_contadorproforma'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HL7Grafica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sample_id', models.CharField(blank=True, db_index=True, default='', max_length=100)),
+                ('tipo', models.CharField(choices=[('rbc', 'RBC Histogram'), ('plt', 'PLT Histogram'), ('diff', 'DIFF Scatter'), ('baso', 'BASO Scatter')], max_length=10)),
+                ('datos', models.BinaryField()),
+                ('equipo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='configuracion.equipo')),
+                ('mensaje', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='graficas', to='configuracion.hl7mensaje')),
+                ('orden', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='graficas_hl7', to='laboratorio.orden')),
+            ],
+            options={
+                'unique_together': {('mensaje', 'tipo')},
+            },
+        ),
+    ]
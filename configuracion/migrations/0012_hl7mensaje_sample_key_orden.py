@@ -0,0 +1,25 @@
+# Generated by Django 5.2.11 on 2026-10-17 23:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configuracion', '0011_hl7grafica'),
+        ('laboratorio', '0012_contadorproforma'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hl7mensaje',
+            name='orden',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mensajes_hl7', to='laboratorio.orden'),
+        ),
+        migrations.AddField(
+            model_name='hl7mensaje',
+            name='sample_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+    ]
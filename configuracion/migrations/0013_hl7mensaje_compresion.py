@@ -0,0 +1,60 @@
+# Generated by Django 5.2.11 on 2026-10-17 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configuracion', '0012_hl7mensaje_sample_key_orden'),
+    ]
+
+    operations = [
+        # mensaje_raw pasa a ser una propiedad: el campo se renombra sin tocar la columna
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='hl7mensaje',
+                    old_name='mensaje_raw',
+                    new_name='mensaje_texto',
+                ),
+                migrations.AlterField(
+                    model_name='hl7mensaje',
+                    name='mensaje_texto',
+                    field=models.TextField(blank=True, db_column='mensaje_raw', default=''),
+                ),
+            ],
+            database_operations=[],
+        ),
+        migrations.RemoveField(
+            model_name='hl7mensaje',
+            name='msh',
+        ),
+        migrations.RemoveField(
+            model_name='hl7mensaje',
+            name='obr',
+        ),
+        migrations.RemoveField(
+            model_name='hl7mensaje',
+            name='obx',
+        ),
+        migrations.RemoveField(
+            model_name='hl7mensaje',
+            name='pid',
+        ),
+        migrations.AddField(
+            model_name='hl7mensaje',
+            name='compresion',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='hl7mensaje',
+            name='mensaje_comprimido',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='hl7mensaje',
+            name='tamano_raw',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,106 @@
+# configuracion/mllp.py
+"""
+Enmarcado MLLP:  0x0B <mensaje HL7> 0x1C 0x0D
+
+EscanerMLLP acumula lo recibido en un bytearray y devuelve TODAS las tramas
+completas en orden, conservando la trama parcial para la siguiente lectura.
+La búsqueda del fin de trama continúa desde donde quedó (no re-escanea lo ya
+revisado), así un mensaje grande con imágenes ED no cuesta O(n²).
+"""
+
+START_BLOCK = b"\x0b"
+END_BLOCK = b"\x1c"
+CARRIAGE_RETURN = b"\x0d"
+
+# 4 MB: un CBC del KT-6610 con sus imágenes ED ronda los 600-800 KB
+MAX_TRAMA_DEFECTO = 4 * 1024 * 1024
+
+
+class TramaDemasiadoGrande(ValueError):
+    """
+    La trama en curso supera el máximo configurado (el buffer se descarta).
+    `tramas`: las completas que llegaron antes en la misma lectura; hay que
+    procesarlas (y responder su ACK) antes de cerrar la conexión.
+    """
+
+    def __init__(self, mensaje, tramas=()):
+        super().__init__(mensaje)
+        self.tramas = list(tramas)
+
+
+class EscanerMLLP:
+
+    __slots__ = ("max_trama", "_buf", "_inicio", "_buscar_desde")
+
+    def __init__(self, max_trama=MAX_TRAMA_DEFECTO):
+        self.max_trama = max_trama
+        self._buf = bytearray()
+        # Posición del 0x0B de la trama en curso (-1 = aún no llega)
+        self._inicio = -1
+        # Desde dónde seguir buscando 0x1C dentro de la trama en curso
+        self._buscar_desde = 0
+
+    def pendientes(self):
+        """Bytes recibidos que todavía no forman una trama completa."""
+        return len(self._buf)
+
+    def reiniciar(self):
+        self._buf.clear()
+        self._inicio = -1
+        self._buscar_desde = 0
+
+    def alimentar(self, datos):
+        """
+        Agrega lo leído del socket (bytes, bytearray o memoryview) y devuelve
+        la lista de tramas completas (bytes, sin delimitadores MLLP). Si la
+        trama en curso pasa de max_trama lanza TramaDemasiadoGrande, con las
+        completas anteriores en su atributo `tramas`.
+        """
+        buf = self._buf
+        buf += datos
+
+        tramas = []
+        consumido = 0
+
+        while True:
+            if self._inicio < 0:
+                inicio = buf.find(START_BLOCK, consumido)
+                if inicio < 0:
+                    # Basura entre tramas (p. ej. el 0x0D final): se descarta
+                    consumido = len(buf)
+                    break
+                self._inicio = inicio
+                self._buscar_desde = inicio + 1
+
+            fin = buf.find(END_BLOCK, self._buscar_desde)
+            if fin < 0:
+                self._buscar_desde = len(buf)
+                break
+
+            with memoryview(buf) as mv:
+                tramas.append(bytes(mv[self._inicio + 1:fin]))
+
+            consumido = fin + 1
+            if buf[consumido:consumido + 1] == CARRIAGE_RETURN:
+                consumido += 1
+            self._inicio = -1
+
+        if consumido:
+            del buf[:consumido]
+            if self._inicio >= 0:
+                self._inicio -= consumido
+                self._buscar_desde -= consumido
+
+        if self._inicio >= 0 and self.max_trama and len(buf) - self._inicio > self.max_trama:
+            tamano = len(buf) - self._inicio
+            self.reiniciar()
+            raise TramaDemasiadoGrande(
+                f"Trama MLLP de más de {self.max_trama} bytes ({tamano} recibidos)", tramas
+            )
+
+        return tramas
+
+
+def envolver(mensaje: bytes) -> bytes:
+    """Agrega los delimitadores MLLP a un mensaje HL7."""
+    return START_BLOCK + mensaje + END_BLOCK + CARRIAGE_RETURN
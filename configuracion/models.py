@@ -1,5 +1,10 @@
 from django.db import models
-from laboratorio.models import Examen
+from django.utils import timezone
+from django.utils.functional import cached_property
+from laboratorio.models import Examen, Orden
+
+from . import compresion_hl7
+from .ordenes_hl7 import clave_muestra
 
 
 class ConfigGeneral(models.Model):
@@ -71,6 +76,21 @@ class Equipo(models.Model):
     )
     activo = models.BooleanField(default=True)
     notas = models.TextField(blank=True, default='')
+
+    # Control de admisión en el listener HL7 (0 = sin límite); ver configuracion/admision.py
+    max_mensajes_en_curso = models.PositiveIntegerField(
+        default=0,
+        help_text='Mensajes de este equipo procesándose a la vez; el exceso recibe ACK AR. 0 = sin límite.'
+    )
+    max_bytes_por_segundo = models.PositiveIntegerField(
+        default=0,
+        help_text='Tasa de recepción; por encima se demora la lectura y, si no alcanza, ACK AR. 0 = sin límite.'
+    )
+    max_cola = models.PositiveIntegerField(
+        default=0,
+        help_text='Trabajos pendientes en la cola de post-proceso (ACK inmediato); el exceso recibe ACK AR. 0 = sin límite.'
+    )
+
     creado = models.DateTimeField(auto_now_add=True)
     actualizado = models.DateTimeField(auto_now=True)
 
@@ -120,28 +140,167 @@ class HL7Mensaje(models.Model):
     
     fecha_recepcion = models.DateTimeField(auto_now_add=True)
     ip_equipo = models.CharField(max_length=100, blank=True, null=True)
-    mensaje_raw = models.TextField()
+    # Cuerpo del mensaje: se lee y asigna con `mensaje_raw` (ver compresion_hl7.py).
+    # Texto tal cual (compresion = '') o comprimido en mensaje_comprimido.
+    mensaje_texto = models.TextField(blank=True, default='', db_column='mensaje_raw')
+    mensaje_comprimido = models.BinaryField(null=True, blank=True)
+    compresion = models.CharField(max_length=10, blank=True, default='')
+    tamano_raw = models.PositiveIntegerField(default=0)  # bytes UTF-8 sin comprimir
 
-    msh = models.TextField(blank=True, null=True)
-    pid = models.TextField(blank=True, null=True)
-    obr = models.TextField(blank=True, null=True)
-    obx = models.TextField(blank=True, null=True)
+    # Para .defer() en listados que no muestran el mensaje
+    CAMPOS_CUERPO = ('mensaje_texto', 'mensaje_comprimido')
 
     sample_id = models.CharField(max_length=100, blank=True, null=True)
+    # sample_id normalizado (sin ceros a la izquierda ni componentes), ver ordenes_hl7.py
+    sample_key = models.CharField(max_length=100, blank=True, default='', db_index=True)
     exam_codes = models.CharField(max_length=500, blank=True, null=True)
 
     tipo = models.CharField(max_length=20, choices=TIPO_MENSAJE_CHOICES, default='resultado')
     estado = models.CharField(max_length=20, default="pendiente")
 
+    # Equipo que envió el mensaje: por el puerto en que llegó o, en el puerto
+    # general, por IP/MSH al recibirlo.
+    equipo = models.ForeignKey(
+        Equipo, on_delete=models.SET_NULL, null=True, blank=True, related_name='mensajes_hl7'
+    )
+    # Número de la trama en el diario del listener (configuracion/diario_hl7.py);
+    # `reprocesar_diario_hl7` reingresa las tramas del diario que no tengan mensaje.
+    diario_seq = models.BigIntegerField(null=True, blank=True, unique=True)
+    # Orden resuelta al recibir el mensaje (o al crearse la orden después)
+    orden = models.ForeignKey(
+        Orden, on_delete=models.SET_NULL, null=True, blank=True, related_name='mensajes_hl7'
+    )
+
     def __str__(self):
         return f"Mensaje HL7 {self.id} - {self.fecha_recepcion}"
+
+    def save(self, *args, **kwargs):
+        self.sample_key = clave_muestra(self.sample_id)
+        super().save(*args, **kwargs)
+
+    @property
+    def mensaje_raw(self):
+        """Texto del mensaje (descomprimido una sola vez por instancia)."""
+        if not self.compresion:
+            return self.mensaje_texto
+        texto = self.__dict__.get("_texto_descomprimido")
+        if texto is None:
+            texto = compresion_hl7.descomprimir(self.mensaje_comprimido, self.compresion)
+            self.__dict__["_texto_descomprimido"] = texto
+        return texto
+
+    @mensaje_raw.setter
+    def mensaje_raw(self, texto):
+        self.asignar_cuerpo(texto)
+
+    def asignar_cuerpo(self, texto, algoritmo=None, nivel=None):
+        """Asigna el cuerpo comprimido con `algoritmo` (por defecto HL7_COMPRESION; '' = sin comprimir). No guarda."""
+        algoritmo = compresion_hl7.ALGORITMO if algoritmo is None else algoritmo
+        texto = texto or ""
+        self.tamano_raw = len(texto.encode("utf-8"))
+        if algoritmo:
+            self.mensaje_comprimido = compresion_hl7.comprimir(texto, algoritmo, nivel)
+            self.compresion = algoritmo
+            self.mensaje_texto = ""
+            self.__dict__["_texto_descomprimido"] = texto
+        else:
+            self.mensaje_comprimido = None
+            self.compresion = ""
+            self.mensaje_texto = texto
+            self.__dict__.pop("_texto_descomprimido", None)
+        self.__dict__.pop("hl7", None)
+
+    @cached_property
+    def hl7(self):
+        """Mensaje parseado (MensajeHL7), una sola vez por instancia."""
+        from .hl7 import MensajeHL7
+        return MensajeHL7(self.mensaje_raw or "")
+
+    # Segmentos: se derivan del mensaje (ya no se guardan aparte)
+    @property
+    def msh(self):
+        return self.hl7.linea("MSH")
+
+    @property
+    def pid(self):
+        return self.hl7.linea("PID")
+
+    @property
+    def obr(self):
+        return self.hl7.linea("OBR")
+
+    @property
+    def obx(self):
+        return "\n".join(seg.texto for seg in self.hl7.todos("OBX"))
     
 class HL7Imagen(models.Model):
     mensaje = models.ForeignKey(HL7Mensaje, on_delete=models.CASCADE, related_name="imagenes")
-    archivo = models.ImageField(upload_to="lis_imagenes/%Y/%m/%d/")
+    # Vacío en modo diferido: la imagen se genera al pedirla (configuracion/imagenes_hl7.py)
+    archivo = models.ImageField(upload_to="lis_imagenes/%Y/%m/%d/", blank=True)
     tipo = models.CharField(max_length=50, blank=True, null=True)  # ej: 'DIFF', 'SCATTER'
     formato = models.CharField(max_length=20, default="bmp")
+    # Posición del OBX (entre los OBX del mensaje) que trae la imagen
+    obx_indice = models.PositiveIntegerField(null=True, blank=True)
     creado = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Imagen {self.id} del mensaje {self.mensaje_id}"
+
+
+class HL7Grafica(models.Model):
+    """
+    Histogramas (RBC/PLT) y scatter (DIFF/BASO) extraídos del mensaje al
+    recibirlo, empacados como arreglos binarios (ver configuracion/graficas_hl7.py).
+    El informe los lee de acá sin volver a buscar ni parsear el mensaje.
+    """
+    TIPO_CHOICES = [
+        ('rbc', 'RBC Histogram'),
+        ('plt', 'PLT Histogram'),
+        ('diff', 'DIFF Scatter'),
+        ('baso', 'BASO Scatter'),
+    ]
+
+    mensaje = models.ForeignKey(HL7Mensaje, on_delete=models.CASCADE, related_name='graficas')
+    orden = models.ForeignKey(
+        Orden, on_delete=models.SET_NULL, null=True, blank=True, related_name='graficas_hl7'
+    )
+    equipo = models.ForeignKey(Equipo, on_delete=models.SET_NULL, null=True, blank=True)
+    # Para órdenes que se cargan después del mensaje
+    sample_id = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    datos = models.BinaryField()
+
+    class Meta:
+        unique_together = ('mensaje', 'tipo')
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} del mensaje {self.mensaje_id}"
+
+
+class HL7Trabajo(models.Model):
+    """
+    Cola persistente de post-proceso de mensajes HL7 (imágenes, carga de
+    resultados y PDF). Se usa cuando el listener responde el ACK apenas
+    guarda el mensaje (HL7_ACK_INMEDIATO); ver configuracion/cola_hl7.py.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('hecho', 'Hecho'),
+        ('error', 'Error'),
+    ]
+
+    mensaje = models.ForeignKey(HL7Mensaje, on_delete=models.CASCADE, related_name='trabajos')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', db_index=True)
+    intentos = models.PositiveIntegerField(default=0)
+    disponible_desde = models.DateTimeField(default=timezone.now, help_text='No se reintenta antes de esta fecha.')
+    ultimo_error = models.TextField(blank=True, default='')
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Trabajo HL7'
+        verbose_name_plural = 'Trabajos HL7'
+
+    def __str__(self):
+        return f"Trabajo {self.id} ({self.estado}) del mensaje {self.mensaje_id}"
@@ -0,0 +1,110 @@
+# configuracion/ordenes_hl7.py
+"""
+Enlace HL7Mensaje -> Orden.
+
+El equipo manda el número de muestra como lo tiene cargado: '001000',
+'1000', a veces con componentes ('1000^^^'). Las órdenes se numeran con
+ceros a la izquierda (laboratorio/views.py). Para no probar variantes en
+cada consulta:
+
+  - HL7Mensaje.sample_key guarda clave_muestra(sample_id) (indexado).
+  - HL7Mensaje.orden se resuelve una vez al recibir el mensaje.
+  - Si la orden se crea después que el mensaje, la señal post_save de
+    Orden enlaza los mensajes (y sus gráficas) que tengan su misma clave.
+  - `enlazar_mensajes_hl7` completa los mensajes anteriores a este esquema.
+
+Así orden -> mensajes es HL7Mensaje.objects.filter(orden=orden).
+"""
+
+
+def clave_muestra(valor):
+    """'  001000^^^ ' -> '1000'; '' o None -> ''."""
+    valor = str(valor or "").strip().split("^", 1)[0].strip().upper()
+    if not valor:
+        return ""
+    return valor.lstrip("0") or "0"
+
+
+def candidatos(sample_id):
+    """Números de orden que pueden corresponder a ese sample_id."""
+    crudo = str(sample_id or "").strip()
+    clave = clave_muestra(crudo)
+    if not clave:
+        return []
+    valores = [crudo, clave]
+    if clave.isdigit():
+        valores.append(f"{int(clave):06d}")
+    return list(dict.fromkeys(valores))
+
+
+def elegir(sample_id, por_numero):
+    """
+    De {numero_orden: orden}, la del sample_id o None. Si hay más de una
+    (p. ej. '1000' y '001000'), el orden de candidatos(): primero la
+    coincidencia exacta, después la clave sin ceros y al final la de 6 dígitos.
+    """
+    for valor in candidatos(sample_id):
+        if valor in por_numero:
+            return por_numero[valor]
+    return None
+
+
+def resolver_orden(sample_id):
+    """Orden del sample_id (una consulta por el índice único de numero_orden) o None."""
+    from laboratorio.models import Orden
+
+    valores = candidatos(sample_id)
+    if not valores:
+        return None
+    return elegir(sample_id, {o.numero_orden: o for o in Orden.objects.filter(numero_orden__in=valores)})
+
+
+def orden_del_mensaje(msg, guardar=True):
+    """
+    La Orden del mensaje: la enlazada al recibirlo o, si no tenía, la que se
+    resuelva ahora (y se guarda el enlace).
+    """
+    if msg.orden_id:
+        return msg.orden
+    orden = resolver_orden(msg.sample_id)
+    if orden is not None:
+        msg.orden = orden
+        if guardar and msg.pk:
+            type(msg).objects.filter(pk=msg.pk).update(orden=orden)
+    return orden
+
+
+def mensaje_de_orden(orden):
+    """Primer HL7Mensaje de la orden (o None)."""
+    from .models import HL7Mensaje
+
+    return HL7Mensaje.objects.filter(orden=orden).order_by("id").first()
+
+
+def enlazar_orden(orden):
+    """Enlaza a la orden los mensajes sin orden con su misma clave. Devuelve cuántos."""
+    from .models import HL7Grafica, HL7Mensaje
+
+    clave = clave_muestra(orden.numero_orden)
+    if not clave:
+        return 0
+    ids = list(
+        HL7Mensaje.objects.filter(sample_key=clave, orden__isnull=True).values_list("id", flat=True)
+    )
+    if ids:
+        HL7Mensaje.objects.filter(id__in=ids).update(orden=orden)
+        HL7Grafica.objects.filter(mensaje_id__in=ids, orden__isnull=True).update(orden=orden)
+    return len(ids)
+
+
+def _orden_guardada(sender, instance, created, **kwargs):
+    if created:
+        enlazar_orden(instance)
+
+
+def conectar_senales():
+    from django.db.models.signals import post_save
+
+    from laboratorio.models import Orden
+
+    post_save.connect(_orden_guardada, sender=Orden, dispatch_uid="ordenes_hl7_orden_guardada")
@@ -0,0 +1,201 @@
+# configuracion/registro_equipos.py
+"""
+Registro en memoria de equipos y mapeos para el camino caliente del listener.
+
+- resolver_equipo(ip, app, fac): mismo criterio que las consultas originales
+  (host exacto; si no, coincidencia parcial sin mayúsculas de MSH-3/MSH-4
+  contra codigo/modelo/nombre/fabricante), resuelto contra la lista de
+  equipos activos cargada una vez. El resultado se memoriza por clave.
+- mapa_equipo(equipo): dict codigo_equipo -> EquipoMapeo (activos, con su
+  examen ya cargado), compilado una vez por equipo.
+- puertos_hl7(): puerto TCP -> Equipo de los equipos HL7 activos (lo usa el
+  listener para abrir un socket por equipo).
+
+Se invalida con post_save / post_delete de Equipo, EquipoMapeo y Examen
+(conectados en ConfiguracionConfig.ready). Para cambios hechos desde otro
+proceso hay además un vencimiento (HL7_REGISTRO_TTL, segundos; 0 = nunca).
+
+Los objetos devueltos se comparten entre hilos: solo lectura.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+
+TTL = getattr(settings, "HL7_REGISTRO_TTL", 60)
+
+_LOCK = threading.Lock()
+_EQUIPOS = None        # [Equipo activo, ...] ordenados por id
+_CARGADO_EN = 0.0
+_RESOLUCIONES = {}     # (ip, app, fac) -> Equipo | None
+_MAPAS = {}            # equipo_id -> {codigo_equipo: EquipoMapeo}
+_PUERTOS = None        # {puerto: Equipo | None}
+
+
+def _descartar():
+    global _EQUIPOS, _PUERTOS
+    with _LOCK:
+        _EQUIPOS = None
+        _PUERTOS = None
+        _RESOLUCIONES.clear()
+        _MAPAS.clear()
+
+
+def invalidar(**kwargs):
+    """
+    Receptor de señales: descarta todo lo cacheado. Se repite al confirmar la
+    transacción para que otro hilo no recargue datos aún sin confirmar.
+    """
+    from django.db import transaction
+
+    _descartar()
+    transaction.on_commit(_descartar)
+
+
+def _vencido():
+    return TTL and (time.monotonic() - _CARGADO_EN) > TTL
+
+
+def _equipos_activos():
+    global _EQUIPOS, _CARGADO_EN, _PUERTOS
+    from .models import Equipo
+
+    with _LOCK:
+        if _EQUIPOS is not None and not _vencido():
+            return _EQUIPOS
+
+    equipos = list(Equipo.objects.filter(activo=True).order_by("id"))
+
+    with _LOCK:
+        if _EQUIPOS is None or _vencido():
+            _EQUIPOS = equipos
+            _CARGADO_EN = time.monotonic()
+            _PUERTOS = None
+            _RESOLUCIONES.clear()
+            _MAPAS.clear()
+        return _EQUIPOS
+
+
+def _contiene(texto, valor):
+    # Equivalente a icontains
+    return valor.lower() in (texto or "").lower()
+
+
+def _buscar(equipos, ip, app, fac):
+    if ip:
+        for eq in equipos:
+            if eq.host == ip:
+                return eq
+
+    for eq in equipos:
+        if fac and not (_contiene(eq.codigo, fac) or _contiene(eq.modelo, fac) or _contiene(eq.nombre, fac)):
+            continue
+        if app and not (_contiene(eq.codigo, app) or _contiene(eq.fabricante, app) or _contiene(eq.nombre, app)):
+            continue
+        return eq
+    return None
+
+
+def resolver_equipo(ip="", app="", fac=""):
+    """
+    Equipo (activo) que envió el mensaje:
+      1) host == ip
+      2) MSH sending_facility / sending_app contra codigo/modelo/nombre/fabricante
+    """
+    clave = (str(ip or "").strip(), (app or "").strip(), (fac or "").strip())
+
+    equipos = _equipos_activos()
+    with _LOCK:
+        if clave in _RESOLUCIONES:
+            return _RESOLUCIONES[clave]
+
+    eq = _buscar(equipos, *clave)
+
+    with _LOCK:
+        if _EQUIPOS is equipos:
+            _RESOLUCIONES[clave] = eq
+    return eq
+
+
+def equipo_por_id(equipo_id):
+    """Equipo activo con ese id (None si no existe o está inactivo)."""
+    if not equipo_id:
+        return None
+    for eq in _equipos_activos():
+        if eq.id == equipo_id:
+            return eq
+    return None
+
+
+def puertos_hl7():
+    """
+    {puerto: Equipo} de los equipos activos con integración HL7 y puerto
+    numérico. Si varios equipos declaran el mismo puerto, el valor es None
+    (el equipo se sigue resolviendo por IP/MSH).
+    """
+    global _PUERTOS
+
+    equipos = _equipos_activos()
+    with _LOCK:
+        if _PUERTOS is not None and _EQUIPOS is equipos:
+            return _PUERTOS
+
+    puertos = {}
+    for eq in equipos:
+        if eq.tipo_integracion != "HL7":
+            continue
+        puerto = (eq.puerto or "").strip()
+        if not puerto.isdigit() or not (0 < int(puerto) < 65536):
+            continue
+        puerto = int(puerto)
+        puertos[puerto] = None if puerto in puertos else eq
+
+    with _LOCK:
+        if _EQUIPOS is equipos:
+            _PUERTOS = puertos
+    return puertos
+
+
+def mapa_equipo(equipo):
+    """
+    {codigo_equipo: EquipoMapeo} con los mapeos activos del equipo.
+    """
+    from .models import EquipoMapeo
+
+    if equipo is None:
+        return {}
+
+    equipos = _equipos_activos()
+    with _LOCK:
+        mapa = _MAPAS.get(equipo.id)
+    if mapa is not None:
+        return mapa
+
+    mapa = {}
+    mapeos = (
+        EquipoMapeo.objects
+        .filter(equipo_id=equipo.id, activo=True)
+        .select_related("examen")
+    )
+    for mp in mapeos:
+        if not mp.codigo_equipo:
+            continue
+        mapa[mp.codigo_equipo.strip()] = mp
+
+    with _LOCK:
+        if _EQUIPOS is equipos:
+            _MAPAS[equipo.id] = mapa
+    return mapa
+
+
+def conectar_senales():
+    from django.db.models.signals import post_delete, post_save
+
+    from laboratorio.models import Examen
+    from .models import Equipo, EquipoMapeo
+
+    for modelo in (Equipo, EquipoMapeo, Examen):
+        post_save.connect(invalidar, sender=modelo, dispatch_uid=f"registro_equipos_save_{modelo.__name__}")
+        post_delete.connect(invalidar, sender=modelo, dispatch_uid=f"registro_equipos_delete_{modelo.__name__}")
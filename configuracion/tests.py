@@ -1 +1,744 @@
-from django.test import TestCase
+import base64
+import os
+import socket
+import tempfile
+import threading
+import time
+from io import StringIO
+from pathlib import Path
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from laboratorio.models import Examen, Orden, OrdenExamen, Paciente, Resultado
+
+from . import (
+    admision, archivo_hl7, captura_hl7, cola_hl7, compresion_hl7, diario_hl7, graficas_hl7, imagenes_hl7, listener_asyncio,
+    listener_thread, metricas_hl7, ordenes_hl7, registro_equipos,
+)
+from .hl7 import MensajeHL7
+from .listener_thread import (
+    _OrdenPorMuestra, _auto_cargar_resultados_desde_hl7, _extract_obx_items, _procesar_trama, parse_hl7,
+)
+from .mllp import EscanerMLLP, TramaDemasiadoGrande, envolver
+from .models import Equipo, EquipoMapeo, HL7Grafica, HL7Mensaje, HL7Trabajo
+
+
+class OrdenPorMuestraTests(SimpleTestCase):
+
+    def test_misma_muestra_se_procesa_en_orden_de_llegada(self):
+        turnos = _OrdenPorMuestra()
+        orden = []
+        entro_primero = threading.Event()
+
+        def primero():
+            with turnos.turno("000123"):
+                entro_primero.set()
+                time.sleep(0.05)
+                orden.append(1)
+
+        def segundo():
+            with turnos.turno("000123"):
+                orden.append(2)
+
+        t1 = threading.Thread(target=primero)
+        t1.start()
+        entro_primero.wait(1)
+        t2 = threading.Thread(target=segundo)
+        t2.start()
+        t1.join()
+        t2.join()
+
+        self.assertEqual(orden, [1, 2])
+        self.assertEqual(turnos._turnos, {})
+
+    def test_muestras_distintas_no_se_bloquean(self):
+        turnos = _OrdenPorMuestra()
+        with turnos.turno("A"):
+            hecho = threading.Event()
+
+            def otra():
+                with turnos.turno("B"):
+                    hecho.set()
+
+            t = threading.Thread(target=otra)
+            t.start()
+            self.assertTrue(hecho.wait(1))
+            t.join()
+
+
+class EscanerMLLPTests(SimpleTestCase):
+
+    def test_varias_tramas_en_una_lectura(self):
+        escaner = EscanerMLLP()
+        datos = envolver(b"MSH|1") + envolver(b"MSH|2") + envolver(b"MSH|3")
+        self.assertEqual(escaner.alimentar(datos), [b"MSH|1", b"MSH|2", b"MSH|3"])
+        self.assertEqual(escaner.pendientes(), 0)
+
+    def test_trama_partida_entre_lecturas(self):
+        escaner = EscanerMLLP()
+        datos = envolver(b"MSH|uno\rOBX|1") + envolver(b"MSH|dos")
+        tramas = []
+        for i in range(len(datos)):
+            tramas.extend(escaner.alimentar(datos[i:i + 1]))
+        self.assertEqual(tramas, [b"MSH|uno\rOBX|1", b"MSH|dos"])
+
+    def test_cr_final_en_la_lectura_siguiente(self):
+        escaner = EscanerMLLP()
+        self.assertEqual(escaner.alimentar(b"\x0bMSH|1\x1c"), [b"MSH|1"])
+        self.assertEqual(escaner.alimentar(b"\x0d\x0bMSH|2\x1c\x0d"), [b"MSH|2"])
+
+    def test_trama_demasiado_grande(self):
+        escaner = EscanerMLLP(max_trama=10)
+        with self.assertRaises(TramaDemasiadoGrande):
+            escaner.alimentar(b"\x0b" + b"X" * 20)
+        self.assertEqual(escaner.pendientes(), 0)
+        self.assertEqual(escaner.alimentar(envolver(b"MSH|ok")), [b"MSH|ok"])
+
+    def test_trama_demasiado_grande_entrega_las_anteriores(self):
+        escaner = EscanerMLLP(max_trama=10)
+        with self.assertRaises(TramaDemasiadoGrande) as error:
+            escaner.alimentar(envolver(b"MSH|1") + envolver(b"MSH|2") + b"\x0b" + b"X" * 20)
+        self.assertEqual(error.exception.tramas, [b"MSH|1", b"MSH|2"])
+        self.assertEqual(escaner.pendientes(), 0)
+
+
+class ListenerAsyncioTests(TransactionTestCase):
+    """El motor asyncio contra un puerto real (los hilos de BD necesitan datos confirmados)."""
+
+    def _trama(self, control):
+        return (
+            f"MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|{control}|P|2.3.1\r"
+            f"OBR|1|000123|\rOBX|1|NM|^WBC^|1|5|x|4-10|N|||F"
+        ).encode()
+
+    def _acks(self, sock, cantidad):
+        escaner = EscanerMLLP()
+        acks = []
+        while len(acks) < cantidad:
+            datos = sock.recv(65536)
+            if not datos:
+                break
+            acks.extend(escaner.alimentar(datos))
+        return acks
+
+    def test_varias_tramas_y_trama_demasiado_grande(self):
+        with socket.socket() as libre:
+            libre.bind(("127.0.0.1", 0))
+            puerto = libre.getsockname()[1]
+        registro_equipos.invalidar()
+
+        with mock.patch.object(listener_thread, "puertos_deseados", return_value={puerto: None}), \
+                mock.patch.object(listener_thread, "_postprocesar_resultado"), \
+                mock.patch.object(listener_thread, "MAX_TRAMA", 2000), \
+                mock.patch.object(diario_hl7, "DIRECTORIO", None):
+            hilo = threading.Thread(target=listener_asyncio.listener_loop_asyncio, daemon=True)
+            hilo.start()
+            try:
+                limite = time.monotonic() + 5
+                while True:
+                    try:
+                        sock = socket.create_connection(("127.0.0.1", puerto), timeout=5)
+                        break
+                    except ConnectionRefusedError:
+                        if time.monotonic() > limite:
+                            raise
+                        time.sleep(0.05)
+
+                with sock:
+                    # Dos tramas en una sola escritura: dos ACK
+                    sock.sendall(envolver(self._trama(1)) + envolver(self._trama(2)))
+                    acks = self._acks(sock, 2)
+                    self.assertEqual([a.split(b"\r")[1] for a in acks], [b"MSA|AA|1", b"MSA|AA|2"])
+                    self.assertEqual(HL7Mensaje.objects.count(), 2)
+
+                    # Una completa y detrás una demasiado grande: la completa tiene su ACK
+                    sock.sendall(envolver(self._trama(3)) + b"\x0b" + b"X" * 3000)
+                    acks = self._acks(sock, 2)
+                    self.assertEqual([a.split(b"\r")[1] for a in acks], [b"MSA|AA|3"])
+                    self.assertEqual(HL7Mensaje.objects.count(), 3)
+            finally:
+                listener_thread.LISTENER_RUNNING = False
+                hilo.join(5)
+        self.assertFalse(hilo.is_alive())
+
+
+class MensajeHL7Tests(SimpleTestCase):
+
+    RAW = (
+        "MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|42|P|2.3.1\r"
+        "PID|1||||PEREZ^JUAN\r"
+        "OBR|1|000123^^|X|CBC\r"
+        "OBX|1|NM|^WBC^|1|5.42|10^9/L|4.00-10.00|N|||F\r"
+        "OBX|2|ED|^RBC Histogram.Binary^||AAAA\r"
+    )
+
+    def test_campos_y_componentes(self):
+        mensaje = MensajeHL7(self.RAW)
+        self.assertEqual(mensaje.primero("MSH").campo(2), "Genrui")
+        obx = mensaje.todos("OBX")
+        self.assertEqual(len(obx), 2)
+        self.assertEqual(obx[0].componente(3, 1), "WBC")
+        self.assertEqual(obx[0].campo(20), "")
+        self.assertEqual(len(obx[1]), 6)
+        self.assertIsNone(mensaje.primero("QRD"))
+
+    def test_parse_hl7_y_obx_desde_el_mismo_mensaje(self):
+        mensaje = MensajeHL7(self.RAW.replace("\r", "\r\n"))
+        msh, pid, obr, obx, sample_id, exam_codes = parse_hl7(mensaje)
+        self.assertTrue(msh.startswith("MSH|"))
+        self.assertEqual(sample_id, "000123")
+        self.assertEqual(exam_codes, "CBC")
+        self.assertEqual(obx.count("\n"), 1)
+
+        items = _extract_obx_items(mensaje)
+        self.assertEqual([it["code"] for it in items], ["WBC", "RBC Histogram.Binary"])
+        self.assertEqual(items[0]["unit"], "10^9/L")
+
+
+class RegistroEquiposTests(TestCase):
+
+    def setUp(self):
+        registro_equipos.invalidar()
+        self.examen = Examen.objects.create(codigo="BH", nombre="Biometría", area="HEMATOLOGIA")
+        self.equipo = Equipo.objects.create(
+            nombre="Analizador", codigo="KT6610", fabricante="Genrui", modelo="KT-6610",
+            host="10.0.0.5", tipo_integracion="HL7",
+        )
+        EquipoMapeo.objects.create(equipo=self.equipo, codigo_equipo="WBC ", examen=self.examen, parametro="WBC")
+
+    def test_resolucion_en_memoria(self):
+        self.assertEqual(registro_equipos.resolver_equipo("10.0.0.5"), self.equipo)
+        self.assertEqual(registro_equipos.mapa_equipo(self.equipo)["WBC"].examen, self.examen)
+        with self.assertNumQueries(0):
+            self.assertEqual(registro_equipos.resolver_equipo("10.0.0.9", "genrui", "kt-6610"), self.equipo)
+            self.assertIsNone(registro_equipos.resolver_equipo("10.0.0.9", "Mindray", ""))
+            registro_equipos.mapa_equipo(self.equipo)
+
+    def test_senales_invalidan(self):
+        registro_equipos.resolver_equipo("10.0.0.5")
+        self.assertEqual(set(registro_equipos.mapa_equipo(self.equipo)), {"WBC"})
+
+        EquipoMapeo.objects.create(equipo=self.equipo, codigo_equipo="RBC", examen=self.examen, parametro="RBC")
+        self.assertEqual(set(registro_equipos.mapa_equipo(self.equipo)), {"WBC", "RBC"})
+
+        self.equipo.activo = False
+        self.equipo.save()
+        self.assertIsNone(registro_equipos.resolver_equipo("10.0.0.5", "Genrui"))
+
+    def test_puertos_por_equipo(self):
+        self.equipo.puerto = "2580"
+        self.equipo.save()
+        otro = Equipo.objects.create(nombre="Orina", codigo="UR", puerto="2581", tipo_integracion="HL7")
+        Equipo.objects.create(nombre="Química", codigo="QC", puerto="2581", tipo_integracion="HL7")
+        Equipo.objects.create(nombre="Manual", codigo="MN", puerto="2582", tipo_integracion="MANUAL")
+        self.assertEqual(registro_equipos.puertos_hl7(), {2580: self.equipo, 2581: None})
+
+        otro.activo = False
+        otro.save()
+        self.assertEqual(registro_equipos.puertos_hl7()[2581].codigo, "QC")
+
+
+class CargaResultadosTests(TestCase):
+
+    PARAMETROS = ["WBC", "RBC", "HGB", "HCT", "MCV", "MCH", "MCHC", "PLT", "LYM%", "GRA%"]
+
+    def setUp(self):
+        registro_equipos.invalidar()
+        examen = Examen.objects.create(codigo="BH", nombre="Biometría", area="HEMATOLOGIA")
+        paciente = Paciente.objects.create(documento_identidad="1", nombre_completo="X", sexo="M")
+        self.orden = Orden.objects.create(paciente=paciente, numero_orden="000123")
+        self.oe = OrdenExamen.objects.create(orden=self.orden, examen=examen)
+        equipo = Equipo.objects.create(nombre="KT", codigo="KT6610", host="10.0.0.5", tipo_integracion="HL7")
+        for codigo in self.PARAMETROS:
+            EquipoMapeo.objects.create(equipo=equipo, codigo_equipo=codigo, examen=examen, parametro=codigo)
+
+        segmentos = ["MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|1|P|2.3.1", "OBR|1|000123|"]
+        for i, codigo in enumerate(self.PARAMETROS, start=1):
+            segmentos.append(f"OBX|{i}|NM|^{codigo}^|1|{i}|x|2-8|N|||F")
+        segmentos.append("OBX|99|ED|^RBC Histogram.Binary^||AAAA")
+        self.raw = "\r".join(segmentos)
+
+    def _mensaje(self):
+        return HL7Mensaje.objects.create(
+            ip_equipo="10.0.0.5", mensaje_raw=self.raw, sample_id="000123",
+            orden_id=self.orden.id,  # enlazada al recibirlo
+        )
+
+    def test_carga_por_lotes(self):
+        msg = self._mensaje()
+        _auto_cargar_resultados_desde_hl7(self._mensaje())  # calienta el registro de equipos
+        Resultado.objects.all().delete()
+
+        # orden, savepoint, OrdenExamen, existentes, bulk_create, estado OrdenExamen, msg, release
+        # (la orden ya quedó "En validación" en la primera carga)
+        with self.assertNumQueries(8):
+            r = _auto_cargar_resultados_desde_hl7(msg)
+
+        self.assertEqual((r["creados"], r["ignorados"]), (10, 1))
+        fuera = dict(Resultado.objects.filter(orden_examen=self.oe).values_list("parametro", "fuera_de_rango"))
+        self.assertEqual(len(fuera), 10)
+        self.assertTrue(fuera["WBC"])
+        self.assertFalse(fuera["HGB"])
+
+    def test_reenvio_no_duplica(self):
+        _auto_cargar_resultados_desde_hl7(self._mensaje())
+        r = _auto_cargar_resultados_desde_hl7(self._mensaje())
+        self.assertEqual((r["creados"], r["ignorados"]), (0, 11))
+        self.assertEqual(Resultado.objects.count(), 10)
+
+
+class AdmisionTests(TestCase):
+
+    RAW = b"MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|7|P|2.3.1\rOBR|1|000123|\rOBX|1|NM|^WBC^|1|5|x|4-10|N|||F"
+
+    def setUp(self):
+        registro_equipos.invalidar()
+        admision._CUBETAS.clear()
+        self.equipo = Equipo.objects.create(
+            nombre="KT", codigo="KT6610", host="10.0.0.5", tipo_integracion="HL7",
+            max_mensajes_en_curso=1,
+        )
+
+    def test_en_curso_rechaza_con_ar_sin_guardar(self):
+        self.assertEqual(admision.entrar(self.equipo, 10), (None, 0.0))
+        try:
+            respuesta, _ = _procesar_trama(self.RAW, "10.0.0.5", self.equipo.id)
+        finally:
+            admision.salir(self.equipo)
+        self.assertIn(b"MSA|AR|7|", respuesta)
+        self.assertFalse(HL7Mensaje.objects.exists())
+        self.assertEqual(metricas_hl7.RECHAZOS.valores().get(("KT6610", "en_curso")), 1)
+        self.assertEqual(admision.en_curso(), {})
+
+    def test_tasa_de_bytes_demora_y_luego_rechaza(self):
+        self.equipo.max_mensajes_en_curso = 0
+        self.equipo.max_bytes_por_segundo = 1000
+        motivo, espera = admision.entrar(self.equipo, 1500)
+        admision.salir(self.equipo)
+        self.assertIsNone(motivo)
+        self.assertAlmostEqual(espera, 0.5, places=1)
+        self.assertEqual(admision.entrar(self.equipo, 5000)[0], "bytes")
+
+    def test_trama_mas_grande_que_la_cubeta_entra_si_no_hay_deuda(self):
+        self.equipo.max_mensajes_en_curso = 0
+        self.equipo.max_bytes_por_segundo = 1000
+        motivo, espera = admision.entrar(self.equipo, 7000)
+        admision.salir(self.equipo)
+        self.assertIsNone(motivo)
+        self.assertEqual(espera, admision.ESPERA_MAXIMA)
+        # El exceso queda como deuda: la siguiente grande se rechaza
+        self.assertEqual(admision.entrar(self.equipo, 7000)[0], "bytes")
+
+
+class ColaHL7Tests(TestCase):
+
+    RAW = b"MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|7|P|2.3.1\rOBR|1|000123|\rOBX|1|NM|^WBC^|1|5|x|4-10|N|||F"
+
+    def setUp(self):
+        registro_equipos.invalidar()
+
+    def _trabajo(self, sample_id, **campos):
+        msg = HL7Mensaje.objects.create(mensaje_raw="MSH|1", sample_id=sample_id)
+        return HL7Trabajo.objects.create(mensaje=msg, **campos)
+
+    @mock.patch.object(diario_hl7, "DIRECTORIO", None)
+    def test_ack_inmediato_antes_del_postproceso(self):
+        with mock.patch("configuracion.listener_thread.ACK_INMEDIATO", True), \
+                mock.patch("configuracion.listener_thread._postprocesar_resultado") as postproceso:
+            respuesta, _ = _procesar_trama(self.RAW, "10.0.0.5", None)
+        self.assertIn(b"MSA|AA|7", respuesta)
+        postproceso.assert_not_called()
+        trabajo = HL7Trabajo.objects.select_related("mensaje").get()
+        self.assertEqual((trabajo.estado, trabajo.mensaje.sample_id), ("pendiente", "000123"))
+
+    def test_una_muestra_a_la_vez_y_sin_tope_de_candidatos(self):
+        # Muchos trabajos viejos esperando reintento no tapan a los nuevos
+        futuro = timezone.now() + timedelta(minutes=5)
+        for i in range(60):
+            self._trabajo(f"V{i}", disponible_desde=futuro)
+        primero = self._trabajo("100")
+        segundo = self._trabajo("100")
+        otro = self._trabajo("200")
+
+        self.assertEqual(cola_hl7._reclamar_trabajo(), primero)
+        # El segundo de la muestra espera a que termine el primero
+        self.assertEqual(cola_hl7._reclamar_trabajo(), otro)
+        self.assertIsNone(cola_hl7._reclamar_trabajo())
+
+        # Y también mientras el primero espera su reintento
+        HL7Trabajo.objects.filter(id=primero.id).update(estado="pendiente", disponible_desde=futuro)
+        self.assertIsNone(cola_hl7._reclamar_trabajo())
+        HL7Trabajo.objects.filter(id=primero.id).update(disponible_desde=timezone.now())
+        self.assertEqual(cola_hl7._reclamar_trabajo(), primero)
+        HL7Trabajo.objects.filter(id=primero.id).update(estado="hecho")
+        self.assertEqual(cola_hl7._reclamar_trabajo(), segundo)
+
+    def test_fallo_reintenta_con_espera_y_termina_en_error(self):
+        trabajo = self._trabajo("100")
+        with mock.patch("configuracion.listener_thread._postprocesar_resultado", side_effect=RuntimeError("BD")), \
+                mock.patch.object(cola_hl7.traceback, "print_exc"):
+            for intento in range(1, cola_hl7.MAX_INTENTOS + 1):
+                HL7Trabajo.objects.filter(id=trabajo.id).update(disponible_desde=timezone.now())
+                tomado = cola_hl7._reclamar_trabajo()
+                self.assertEqual((tomado, tomado.intentos), (trabajo, intento))
+                antes = timezone.now()
+                self.assertFalse(cola_hl7.procesar_trabajo(tomado))
+                trabajo.refresh_from_db()
+                if intento < cola_hl7.MAX_INTENTOS:
+                    self.assertEqual(trabajo.estado, "pendiente")
+                    self.assertGreater(trabajo.disponible_desde, antes)
+                    self.assertIsNone(cola_hl7._reclamar_trabajo())
+        self.assertEqual(trabajo.estado, "error")
+        self.assertEqual(trabajo.ultimo_error, "RuntimeError: BD")
+
+    def test_recuperar_huerfanos_respeta_los_trabajos_recientes(self):
+        msg = HL7Mensaje.objects.create(mensaje_raw="MSH|1")
+        reciente = HL7Trabajo.objects.create(mensaje=msg, estado="en_proceso")
+        viejo = HL7Trabajo.objects.create(mensaje=msg, estado="en_proceso")
+        HL7Trabajo.objects.filter(id=viejo.id).update(actualizado=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(cola_hl7.recuperar_huerfanos(), 1)
+        reciente.refresh_from_db()
+        viejo.refresh_from_db()
+        self.assertEqual((reciente.estado, viejo.estado), ("en_proceso", "pendiente"))
+
+
+class DiarioHL7Tests(TestCase):
+
+    RAW = b"MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|7|P|2.3.1\rOBR|1|000123|\rOBX|1|NM|^WBC^|1|5|x|4-10|N|||F"
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        registro_equipos.invalidar()
+
+    def test_rotacion_y_registro_cortado(self):
+        diario = diario_hl7.Diario(self.dir, tamano_segmento=100)
+        seqs = [diario.registrar(self.RAW, "10.0.0.5", 3) for _ in range(3)]
+        diario.cerrar()
+        self.assertEqual(seqs, [1, 2, 3])
+        self.assertEqual(len(diario.segmentos()), 3)
+
+        with open(diario.segmentos()[-1], "ab") as f:
+            f.write(b"HL7D\x00\x00")  # caída a mitad de escritura
+        diario = diario_hl7.Diario(self.dir, tamano_segmento=1 << 20)
+        self.assertEqual(diario.registrar(b"MSH|4", "10.0.0.5"), 4)
+        diario.cerrar()
+
+        registros = list(diario.registros())
+        self.assertEqual([r.seq for r in registros], [1, 2, 3, 4])
+        self.assertEqual((registros[0].ip, registros[0].equipo_id, registros[0].datos), ("10.0.0.5", 3, self.RAW))
+        self.assertIsNone(registros[3].equipo_id)
+
+    def test_reprocesar_reingresa_lo_que_falta(self):
+        diario = diario_hl7.Diario(self.dir, tamano_segmento=100)
+        for _ in range(3):
+            diario.registrar(self.RAW, "10.0.0.5")
+        diario.cerrar()
+        HL7Mensaje.objects.create(mensaje_raw="ya guardado", diario_seq=2)
+
+        with mock.patch.object(diario_hl7, "DIRECTORIO", self.dir), mock.patch.object(diario_hl7, "_DIARIO", diario):
+            call_command("reprocesar_diario_hl7", stdout=StringIO())
+            self.assertEqual(
+                sorted(HL7Mensaje.objects.values_list("diario_seq", flat=True)), [1, 2, 3]
+            )
+            # Todo confirmado: solo queda el último segmento (el que se sigue escribiendo)
+            self.assertEqual(len(diario.segmentos()), 1)
+            call_command("reprocesar_diario_hl7", stdout=StringIO())
+        self.assertEqual(HL7Mensaje.objects.count(), 3)
+
+    def test_purgar_confirmados_borra_segmentos_cerrados(self):
+        diario = diario_hl7.Diario(self.dir, tamano_segmento=100)
+        for _ in range(3):
+            diario.registrar(self.RAW, "10.0.0.5")
+        self.assertEqual(diario.rotaciones, 2)
+        HL7Mensaje.objects.create(mensaje_raw="guardado", diario_seq=1)
+
+        with mock.patch.object(diario_hl7, "DIRECTORIO", self.dir), mock.patch.object(diario_hl7, "_DIARIO", diario):
+            # El segundo segmento tiene una trama sin guardar: se conserva
+            self.assertEqual(diario_hl7.purgar_confirmados(), 1)
+            HL7Mensaje.objects.create(mensaje_raw="guardado", diario_seq=2)
+            self.assertEqual(diario_hl7.purgar_confirmados(), 1)
+        diario.cerrar()
+        self.assertEqual([r.seq for r in diario.registros()], [3])
+
+
+class ImagenesHL7Tests(TestCase):
+
+    def setUp(self):
+        raw = base64.b64encode(bytes(range(255)) * 255 * 3).decode()
+        self.msg = HL7Mensaje.objects.create(mensaje_raw="\r".join([
+            "MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|1|P|2.3.1",
+            "OBX|1|NM|^WBC^||5.0|||||F",
+            f"OBX|2|ED|^WBC Imagen^||^Image^BMP^Base64^{raw}||||||F",
+            "OBX|3|ED|^Roto^||^Image^BMP^Base64^AAAA||||||F",
+            "OBX|4|ED|^RBC Histogram.Binary^||16711680;0,2,5|||||F",
+        ]))
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media = tmp.name
+
+    @mock.patch.object(imagenes_hl7, "MODO", "inmediato")
+    def test_pool_de_procesos_guarda_las_imagenes(self):
+        msg = self.msg
+        with self.settings(MEDIA_ROOT=self.media):
+            pendientes = imagenes_hl7.enviar_imagenes(msg)
+            self.assertEqual(len(pendientes), 1)
+            self.assertEqual(imagenes_hl7.finalizar(msg, pendientes), 1)
+
+            imagen = msg.imagenes.get()
+            self.assertEqual((imagen.tipo, imagen.formato), ("_WBC Imagen_", "png"))
+            self.assertTrue(imagen.archivo.read().startswith(b"\x89PNG"))
+
+    @mock.patch.object(imagenes_hl7, "MODO", "diferido")
+    def test_diferida_se_genera_al_pedirla(self):
+        # Ni el Base64 roto ni el histograma del equipo tienen fila
+        self.assertEqual(imagenes_hl7.finalizar(self.msg, imagenes_hl7.enviar_imagenes(self.msg)), 1)
+        imagen = self.msg.imagenes.get()
+        self.assertEqual(imagen.tipo, "_WBC Imagen_")
+        self.assertEqual((imagen.obx_indice, bool(imagen.archivo)), (1, False))
+
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser("admin", "", "x"))
+        url = f"/configuracion/hl7/imagen/{imagen.pk}/"
+        with mock.patch.object(imagenes_hl7, "CACHE_DIR", self.media):
+            r = self.client.get(url)
+            self.assertEqual(r["Content-Type"], "image/png")
+            self.assertTrue(b"".join(r.streaming_content).startswith(b"\x89PNG"))
+
+            with mock.patch.object(imagenes_hl7, "_generar") as generar:
+                r = self.client.get(url)  # desde el caché
+                b"".join(r.streaming_content)
+                generar.assert_not_called()
+
+            r = self.client.get(url + "?miniatura=1")
+            self.assertEqual(r.status_code, 200)
+            b"".join(r.streaming_content)
+            self.assertEqual(sorted(os.listdir(self.media)), [f"{imagen.pk}.png", f"{imagen.pk}_mini.png"])
+
+
+class GraficasHL7Tests(TestCase):
+
+    def test_empaque_ida_y_vuelta(self):
+        grupos = [(16711680, [0, 3, 70000]), (255, [1, 2, 3, 4])]
+        datos = graficas_hl7.empacar(grupos)
+        self.assertEqual([(c, list(a)) for c, a in graficas_hl7.desempacar(datos)], grupos)
+        self.assertEqual([a.typecode for _, a in graficas_hl7.desempacar(datos)], ["I", "H"])
+
+    def test_extraccion_al_recibir_y_lectura_por_orden(self):
+        msg = HL7Mensaje.objects.create(sample_id="123", mensaje_raw="\r".join([
+            "MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|1|P|2.3.1",
+            "OBX|1|NM|^WBC^||5.0|||||F",
+            "OBX|2|ED|^RBC Histogram.Binary^||16711680;0,2,5,(9)|||||F",
+            "OBX|3|ED|^PLT Histogram.Binary^||(1, 2, 3)|||||F",
+            "OBX|4|ED|^DIFFScatter.Binary^||255,(10,20)(30,40);65280,(5,6)|||||F",
+        ]))
+        self.assertEqual(graficas_hl7.extraer(msg), 3)
+        self.assertEqual(graficas_hl7.extraer(msg), 3)  # reintento: reemplaza
+
+        # La orden se crea después: la señal enlaza el mensaje y sus gráficas
+        paciente = Paciente.objects.create(documento_identidad="1", nombre_completo="X", sexo="M")
+        orden = Orden.objects.create(paciente=paciente, numero_orden="000123")
+        with self.assertNumQueries(1):
+            graficas = graficas_hl7.graficas_para_orden(orden)
+        self.assertEqual(graficas["rbc"], [0, 2, 5, 9])
+        self.assertEqual(graficas["plt"], [1, 2, 3])
+        self.assertEqual(graficas["diff"], [(255, [(10, 20), (30, 40)]), (65280, [(5, 6)])])
+        self.assertNotIn("baso", graficas)
+
+
+class OrdenesHL7Tests(TestCase):
+
+    def setUp(self):
+        registro_equipos.invalidar()
+        paciente = Paciente.objects.create(documento_identidad="1", nombre_completo="X", sexo="M")
+        self.orden = Orden.objects.create(paciente=paciente, numero_orden="001000")
+
+    def test_clave_muestra(self):
+        self.assertEqual(ordenes_hl7.clave_muestra(" 001000^^^ "), "1000")
+        self.assertEqual(ordenes_hl7.clave_muestra("000"), "0")
+        self.assertEqual(ordenes_hl7.clave_muestra(None), "")
+        self.assertEqual(ordenes_hl7.candidatos("1000"), ["1000", "001000"])
+
+    def test_enlace_al_recibir(self):
+        trama = "\r".join([
+            "MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|1|P|2.3.1",
+            "OBR|1||1000|||",
+            "OBX|1|NM|^WBC^||5.0|||||F",
+        ]).encode()
+        with mock.patch.object(diario_hl7, "DIRECTORIO", None):
+            _procesar_trama(trama, "10.0.0.1")
+        msg = HL7Mensaje.objects.get()
+        self.assertEqual((msg.sample_key, msg.orden_id), ("1000", self.orden.id))
+        with self.assertNumQueries(1):
+            self.assertEqual(ordenes_hl7.mensaje_de_orden(self.orden), msg)
+
+    def test_comando_enlaza_mensajes_anteriores(self):
+        msg = HL7Mensaje.objects.create(sample_id="1000", mensaje_raw="MSH|^~\\&|X")
+        HL7Mensaje.objects.filter(pk=msg.pk).update(sample_key="")  # como antes de la migración
+        call_command("enlazar_mensajes_hl7", stdout=StringIO())
+        msg.refresh_from_db()
+        self.assertEqual((msg.sample_key, msg.orden_id), ("1000", self.orden.id))
+
+    def test_comando_y_recepcion_eligen_la_misma_orden(self):
+        sin_ceros = Orden.objects.create(paciente=self.orden.paciente, numero_orden="1000")
+        for sample_id, esperada in (("001000", self.orden), ("1000", sin_ceros), ("01000", sin_ceros)):
+            self.assertEqual(ordenes_hl7.resolver_orden(sample_id), esperada)
+            msg = HL7Mensaje.objects.create(sample_id=sample_id, mensaje_raw="MSH|^~\\&|X")
+            call_command("enlazar_mensajes_hl7", "--todos", stdout=StringIO())
+            msg.refresh_from_db()
+            self.assertEqual(msg.orden_id, esperada.id, sample_id)
+
+
+class CompresionHL7Tests(TestCase):
+
+    RAW = "\r".join([
+        "MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|1|P|2.3.1",
+        "OBR|1|000123|",
+        "OBX|1|ED|^Imagen^||" + "QUFB" * 5000,
+        "OBX|2|NM|^WBC^||5.0|||||F",
+    ])
+
+    @mock.patch.object(compresion_hl7, "ALGORITMO", "zlib")
+    def test_cuerpo_comprimido_y_segmentos_derivados(self):
+        msg = HL7Mensaje.objects.create(sample_id="123", mensaje_raw=self.RAW)
+        msg = HL7Mensaje.objects.get(pk=msg.pk)
+        self.assertEqual((msg.compresion, msg.mensaje_texto, msg.tamano_raw), ("zlib", "", len(self.RAW)))
+        self.assertLess(len(msg.mensaje_comprimido), len(self.RAW) // 10)
+        self.assertEqual(msg.mensaje_raw, self.RAW)
+        self.assertTrue(msg.msh.startswith("MSH|"))
+        self.assertEqual(msg.obx.count("\n"), 1)
+
+    def test_comando_comprime_mensajes_anteriores(self):
+        with mock.patch.object(compresion_hl7, "ALGORITMO", ""):
+            msg = HL7Mensaje.objects.create(mensaje_raw=self.RAW)
+        self.assertEqual(HL7Mensaje.objects.get(pk=msg.pk).compresion, "")
+
+        salida = StringIO()
+        call_command("comprimir_mensajes_hl7", algoritmo="lzma", stdout=salida)
+        msg = HL7Mensaje.objects.get(pk=msg.pk)
+        self.assertEqual((msg.compresion, msg.mensaje_raw), ("lzma", self.RAW))
+        self.assertIn("Mensajes convertidos: 1", salida.getvalue())
+        self.assertIn("lzma", salida.getvalue())
+
+
+class ArchivoHL7Tests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        parche = mock.patch.object(archivo_hl7, "DIRECTORIO", tmp.name)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_archiva_y_lee_por_id_clave_y_orden(self):
+        paciente = Paciente.objects.create(documento_identidad="1", nombre_completo="X", sexo="M")
+        orden = Orden.objects.create(paciente=paciente, numero_orden="000777")
+        raw = "\r".join([
+            "MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|1|P|2.3.1",
+            "OBR|1|777|",
+            "OBX|1|ED|^RBC Histogram.Binary^||16711680;0,2,5|||||F",
+        ])
+        viejo = HL7Mensaje.objects.create(sample_id="777", mensaje_raw=raw, orden=orden, diario_seq=41)
+        nuevo = HL7Mensaje.objects.create(sample_id="778", mensaje_raw=raw)
+        graficas_hl7.extraer(viejo)
+        hace_un_anio = timezone.now() - timedelta(days=365)
+        HL7Mensaje.objects.filter(pk=viejo.pk).update(fecha_recepcion=hace_un_anio)
+        Orden.objects.filter(pk=orden.pk).update(fecha=hace_un_anio - timedelta(hours=1))
+        orden.refresh_from_db()
+
+        call_command("archivar_hl7", dias=30, stdout=StringIO())
+        self.assertEqual(list(HL7Mensaje.objects.values_list("id", flat=True)), [nuevo.id])
+        self.assertFalse(HL7Grafica.objects.exists())
+
+        msg = archivo_hl7.obtener(viejo.id)
+        self.assertTrue(msg.archivado)
+        self.assertEqual((msg.mensaje_raw, msg.orden_id, msg.sample_key), (raw, orden.id, "777"))
+        self.assertEqual(msg.fecha_recepcion, hace_un_anio)
+        self.assertIsNone(archivo_hl7.obtener(nuevo.id))
+        self.assertEqual([m.id for m in archivo_hl7.por_clave("777")], [viejo.id])
+        self.assertEqual(archivo_hl7.diario_seqs(), {41})
+
+        # El informe sigue encontrando las gráficas de la orden
+        self.assertEqual(graficas_hl7.graficas_para_orden(orden)["rbc"], [0, 2, 5])
+        # Los meses anteriores a la orden no se recorren
+        self.assertEqual([m.id for m in archivo_hl7.por_orden(orden.id, hace_un_anio)], [viejo.id])
+        self.assertEqual(list(archivo_hl7.por_orden(orden.id, hace_un_anio + timedelta(days=62))), [])
+
+
+class CapturaHL7Tests(TestCase):
+
+    def test_captura_y_lectura(self):
+        registro_equipos.invalidar()
+        trama = "\r".join([
+            "MSH|^~\\&|Genrui|KT-6610|||20250101||ORU^R01|1|P|2.3.1",
+            "OBR|1||1000|||",
+            "OBX|1|NM|^WBC^||5.0|||||F",
+        ]).encode()
+        with tempfile.TemporaryDirectory() as directorio:
+            with mock.patch.object(captura_hl7, "DIRECTORIO", directorio), \
+                    mock.patch.object(diario_hl7, "DIRECTORIO", None):
+                respuesta, _ = _procesar_trama(trama, "10.0.0.1")
+                _procesar_trama(trama, "10.0.0.1", diario_seq=7)  # reingreso: no se captura
+                captura_hl7.cerrar()
+            archivos = os.listdir(directorio)
+            self.assertEqual(len(archivos), 1)
+            registros = list(captura_hl7.leer(os.path.join(directorio, archivos[0])))
+
+        self.assertEqual(len(registros), 1)
+        r = registros[0]
+        self.assertEqual((r.ip, r.equipo_id, r.trama, r.respuesta), ("10.0.0.1", None, trama, respuesta))
+        self.assertGreaterEqual(r.duracion, 0)
+
+
+class DatosSinteticosTests(TestCase):
+
+    def test_generar(self):
+        call_command(
+            "generar_datos_sinteticos", "--pacientes", "20", "--ordenes", "30", "--resultados", "600",
+            "--mensajes", "60", "--imagenes", "0.5", "--lote", "10", stdout=StringIO(),
+        )
+        self.assertEqual(Paciente.objects.count(), 20)
+        self.assertEqual(Orden.objects.count(), 30)
+        self.assertGreater(Resultado.objects.count(), 300)
+        self.assertEqual(HL7Mensaje.objects.exclude(orden__numero_orden=F("sample_id")).count(), 0)
+
+        msg = HL7Mensaje.objects.filter(tipo="resultado", imagenes__isnull=False).first()
+        imagen = msg.imagenes.first()
+        self.assertEqual(msg.hl7.todos("OBX")[imagen.obx_indice].campo(2), "ED")
+        self.assertEqual(len(graficas_hl7.graficas_para_orden(msg.orden)["rbc"]), 256)
+
+
+class MetricasHL7Tests(TestCase):
+
+    def test_histograma_en_formato_prometheus(self):
+        h = metricas_hl7.Histograma("prueba_segundos", "Prueba", ("etapa",), buckets=(0.01, 0.1))
+        h.observar(0.005, "parseo")
+        h.observar(0.05, "parseo")
+        h.observar(3, "parseo")
+        lineas = list(h.lineas())
+        self.assertIn('prueba_segundos_bucket{etapa="parseo",le="0.01"} 1', lineas)
+        self.assertIn('prueba_segundos_bucket{etapa="parseo",le="0.1"} 2', lineas)
+        self.assertIn('prueba_segundos_bucket{etapa="parseo",le="+Inf"} 3', lineas)
+        self.assertIn('prueba_segundos_count{etapa="parseo"} 3', lineas)
+        self.assertEqual(h.percentil(("parseo",), 0.5), 0.1)
+
+    @mock.patch("configuracion.views.METRICAS_TOKEN", "secreto")
+    def test_endpoint_con_token_sin_sesion(self):
+        with metricas_hl7.medir("parseo"):
+            pass
+        r = self.client.get("/configuracion/hl7/metrics/", HTTP_AUTHORIZATION="Bearer secreto")
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn("# TYPE hl7_etapa_segundos histogram", r.content.decode())
+
+        # Sin token (aunque venga de 127.0.0.1, p. ej. por un proxy local) pide sesión
+        for cabeceras in ({}, {"HTTP_AUTHORIZATION": "Bearer otro"}):
+            r = self.client.get("/configuracion/hl7/metrics/", REMOTE_ADDR="127.0.0.1", **cabeceras)
+            self.assertEqual(r.status_code, 302)
@@ -21,11 +21,13 @@ urlpatterns = [
     path('hl7/', views.hl7_dashboard, name='hl7_dashboard'),
     path('hl7/historial/', views.hl7_historial, name='hl7_historial'),
     path('hl7/<int:pk>/', views.hl7_ver, name='hl7_ver'),
+    path('hl7/imagen/<int:pk>/', views.hl7_imagen, name='hl7_imagen'),
     path('hl7/<int:pk>/aplicar/', views.hl7_aplicar_a_orden, name='hl7_aplicar_a_orden'),
     path('hl7/<int:pk>/eliminar/', views.hl7_eliminar_ajax, name='hl7_eliminar'),
     path('hl7/eliminar_varios/', views.hl7_eliminar_varios_ajax, name='hl7_eliminar_varios'),
     path('hl7/start/', views.hl7_start, name='hl7_start'),
     path('hl7/stop/', views.hl7_stop, name='hl7_stop'),
+    path('hl7/metrics/', views.hl7_metrics, name='hl7_metrics'),
 
     # Roles y usuarios
     path('roles/', views.roles_dashboard, name='roles_dashboard'),
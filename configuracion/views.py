@@ -3,14 +3,19 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django import forms
 from django.contrib.auth.models import User, Group, Permission
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.contrib.contenttypes.models import ContentType
 from django.views.decorators.http import require_POST
 from functools import wraps, lru_cache
+import hmac
 import json
 
-from .listener_thread import start_listener, stop_listener, status_listener
-from .models import HL7Mensaje, ConfigGeneral, Equipo, EquipoMapeo
+from .listener_thread import start_listener, stop_listener, status_listener, ACK_INMEDIATO, PUERTOS_ABIERTOS
+from .cola_hl7 import resumen_cola
+from .hl7 import como_mensaje
+from . import archivo_hl7, imagenes_hl7, metricas_hl7, ordenes_hl7, registro_equipos
+from .models import HL7Mensaje, HL7Imagen, ConfigGeneral, Equipo, EquipoMapeo
 from .forms import ConfigGeneralForm, EquipoForm, EquipoMapeoForm
 
 
@@ -172,13 +177,48 @@ def equipo_mapeo_editar(request, equipo_id, mapeo_id=None):
 @login_required
 @requiere_modulo('mod_configuracion')
 def hl7_dashboard(request):
-    mensajes = HL7Mensaje.objects.order_by('-id')[:20]
+    mensajes = HL7Mensaje.objects.defer(*HL7Mensaje.CAMPOS_CUERPO).order_by('-id')[:20]
     return render(request, 'configuracion/hl7_dashboard.html', {
         'mensajes': mensajes,
-        'listener_status': status_listener()
+        'listener_status': status_listener(),
+        'puertos': [
+            (puerto, registro_equipos.equipo_por_id(equipo_id))
+            for puerto, equipo_id in sorted(PUERTOS_ABIERTOS.items())
+        ],
+        'ack_inmediato': ACK_INMEDIATO,
+        'cola': resumen_cola(),
+        'metricas': metricas_hl7.resumen(),
     })
 
 
+# Con este token (Authorization: Bearer ...) las métricas se leen sin sesión (Prometheus).
+# No se confía en REMOTE_ADDR: detrás de un proxy inverso local todo llega desde 127.0.0.1.
+METRICAS_TOKEN = getattr(settings, "HL7_METRICAS_TOKEN", None)
+
+
+def _respuesta_metricas():
+    return HttpResponse(
+        metricas_hl7.exponer(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@requiere_modulo('mod_configuracion')
+def _hl7_metrics_con_sesion(request):
+    return _respuesta_metricas()
+
+
+def hl7_metrics(request):
+    """
+    Métricas del pipeline HL7 en formato de texto de Prometheus.
+    Sin login con el token METRICAS_TOKEN; si no, requiere acceso al módulo.
+    """
+    autorizacion = request.META.get('HTTP_AUTHORIZATION', '')
+    if METRICAS_TOKEN and hmac.compare_digest(autorizacion.encode(), f'Bearer {METRICAS_TOKEN}'.encode()):
+        return _respuesta_metricas()
+    return _hl7_metrics_con_sesion(request)
+
+
 @login_required
 @requiere_modulo('mod_configuracion')
 def hl7_start(request):
@@ -196,7 +236,7 @@ def hl7_stop(request):
 @login_required
 @requiere_modulo('mod_configuracion')
 def hl7_historial(request):
-    mensajes = HL7Mensaje.objects.order_by('-id')
+    mensajes = HL7Mensaje.objects.defer(*HL7Mensaje.CAMPOS_CUERPO).order_by('-id')
     return render(request, 'configuracion/hl7_historial.html', {
         'mensajes': mensajes,
     })
@@ -205,12 +245,41 @@ def hl7_historial(request):
 @login_required
 @requiere_modulo('mod_configuracion')
 def hl7_ver(request, pk):
-    msg = get_object_or_404(HL7Mensaje, pk=pk)
+    msg = HL7Mensaje.objects.filter(pk=pk).first()
+    if msg is None:
+        # Mensaje viejo: puede estar en el archivo mensual (sin imágenes guardadas)
+        msg = archivo_hl7.obtener(pk)
+        if msg is None:
+            raise Http404('Mensaje HL7 no encontrado')
+        imagenes = []
+    else:
+        imagenes = msg.imagenes.order_by('obx_indice', 'id')
     return render(request, 'configuracion/hl7_ver.html', {
-        'msg': msg
+        'msg': msg,
+        'imagenes': imagenes,
     })
 
 
+@login_required
+@requiere_modulo('mod_configuracion')
+def hl7_imagen(request, pk):
+    """
+    Imagen de un equipo (o su miniatura con ?miniatura=1). En modo diferido se
+    genera en el primer pedido y queda en el caché en disco.
+    """
+    imagen = get_object_or_404(HL7Imagen.objects.select_related('mensaje'), pk=pk)
+    try:
+        ruta, content_type = imagenes_hl7.materializar(imagen, miniatura=bool(request.GET.get('miniatura')))
+    except Exception as e:
+        print(f"Error generando imagen HL7 {pk}: {e}")
+        raise Http404("Imagen no disponible")
+
+    respuesta = FileResponse(open(ruta, 'rb'), content_type=content_type)
+    # La imagen de un mensaje no cambia
+    respuesta['Cache-Control'] = 'private, max-age=86400'
+    return respuesta
+
+
 @login_required
 def hl7_eliminar_ajax(request, pk):
     """Elimina un mensaje HL7 (solo para admins)"""
@@ -247,20 +316,19 @@ def hl7_eliminar_varios_ajax(request):
     return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
 
 
-def _hl7_parse_msh(raw_text):
+def _hl7_parse_msh(mensaje):
     """
+    mensaje: MensajeHL7 (o el texto crudo).
     Devuelve dict mínimo desde MSH:
       {'app': 'Genrui', 'facility': 'KT-6610'}
     """
     out = {'app': '', 'facility': ''}
     try:
-        for line in (raw_text or '').splitlines():
-            if line.startswith('MSH|'):
-                parts = line.split('|')
-                # MSH|^~\&|SENDING_APP|SENDING_FACILITY|...
-                out['app'] = (parts[2] or '').strip() if len(parts) > 2 else ''
-                out['facility'] = (parts[3] or '').strip() if len(parts) > 3 else ''
-                break
+        seg = como_mensaje(mensaje).primero('MSH')
+        if seg:
+            # MSH|^~\&|SENDING_APP|SENDING_FACILITY|...
+            out['app'] = seg.campo(2).strip()
+            out['facility'] = seg.campo(3).strip()
     except Exception:
         pass
     return out
@@ -270,40 +338,25 @@ def _infer_equipo_for_msg(msg):
     """
     Intenta determinar el Equipo (configuracion.Equipo) para un HL7Mensaje.
     Prioridad:
+      0) Equipo guardado al recibirlo (puerto propio del equipo)
       1) IP del mensaje contra host del equipo
       2) MSH sending app/facility contra nombre/fabricante/modelo/codigo
     """
-    try:
-        if msg.ip_equipo:
-            eq = (
-                Equipo.objects
-                .filter(activo=True, host=str(msg.ip_equipo).strip())
-                .order_by('id')
-                .first()
-            )
-            if eq:
-                return eq
-    except Exception:
-        pass
-
-    msh = _hl7_parse_msh(getattr(msg, 'mensaje_raw', '') or '')
-    app = msh.get('app', '') or ''
-    fac = msh.get('facility', '') or ''
+    if msg.equipo_id:
+        eq = registro_equipos.equipo_por_id(msg.equipo_id)
+        if eq:
+            return eq
 
+    msh = _hl7_parse_msh(msg.hl7)
     try:
-        qs = Equipo.objects.filter(activo=True)
-        if app:
-            qs = qs.filter(models.Q(nombre__icontains=app) | models.Q(fabricante__icontains=app) | models.Q(codigo__icontains=app))
-        if fac:
-            qs = qs.filter(models.Q(modelo__icontains=fac) | models.Q(codigo__icontains=fac) | models.Q(nombre__icontains=fac))
-        eq = qs.order_by('id').first()
-        return eq
+        return registro_equipos.resolver_equipo(msg.ip_equipo, msh.get('app', ''), msh.get('facility', ''))
     except Exception:
         return None
 
 
-def _extract_obx_items(raw_text):
+def _extract_obx_items(mensaje):
     """
+    mensaje: MensajeHL7 (o el texto crudo).
     Devuelve lista de dicts:
       [{'code': 'WBC', 'value': '6.5', 'unit': '10^9/L', 'ref': '4.0-10.0', 'type': 'NM'}, ...]
     code = OBX-3 antes de '^'
@@ -312,30 +365,20 @@ def _extract_obx_items(raw_text):
     ref   = OBX-7
     """
     items = []
-    for line in (raw_text or '').splitlines():
-        line = (line or '').strip()
-        if not line.startswith('OBX|'):
+    for seg in como_mensaje(mensaje).todos('OBX'):
+        if not seg.tiene_campo(5):
             continue
-        parts = line.split('|')
-        if len(parts) < 6:
-            continue
-
-        vtype = (parts[2] or '').strip()  # OBX-2
-        obx3 = (parts[3] or '').strip()   # OBX-3
-        val = (parts[5] or '').strip()    # OBX-5
-        unit = (parts[6] or '').strip() if len(parts) > 6 else ''  # OBX-6
-        ref = (parts[7] or '').strip() if len(parts) > 7 else ''   # OBX-7
 
-        code = obx3.split('^')[0].strip() if obx3 else ''
+        code = seg.componente(3, 0).strip()  # OBX-3
         if not code:
             continue
 
         items.append({
             'code': code,
-            'value': val,
-            'unit': unit,
-            'ref': ref,
-            'type': vtype,
+            'value': seg.campo(5).strip(),  # OBX-5
+            'unit': seg.campo(6).strip(),   # OBX-6
+            'ref': seg.campo(7).strip(),    # OBX-7
+            'type': seg.campo(2).strip(),   # OBX-2
         })
     return items
 
@@ -360,7 +403,7 @@ def hl7_aplicar_a_orden(request, pk):
     except Exception:
         return JsonResponse({'ok': False, 'error': 'No se pudo importar modelos de laboratorio.'}, status=500)
 
-    orden = Orden.objects.filter(numero_orden=sample_id).first()
+    orden = ordenes_hl7.orden_del_mensaje(msg)
     if not orden:
         return JsonResponse({'ok': False, 'error': f'No existe Orden con numero_orden={sample_id}.'}, status=404)
 
@@ -368,25 +411,17 @@ def hl7_aplicar_a_orden(request, pk):
     if not equipo:
         return JsonResponse({'ok': False, 'error': 'No se pudo determinar el Equipo para este HL7. (Revisa host/IP o MSH)'}, status=400)
 
-    # Mapeos activos del equipo
-    mapeos = (
-        EquipoMapeo.objects
-        .filter(equipo=equipo, activo=True)
-        .select_related('examen')
-        .all()
-    )
-    mapa = {}
-    for mp in mapeos:
-        if not mp.codigo_equipo:
-            continue
-        if not mp.examen:
-            continue
-        mapa[mp.codigo_equipo.strip()] = mp
+    # Mapeos activos del equipo (con examen asignado)
+    mapa = {
+        codigo: mp
+        for codigo, mp in registro_equipos.mapa_equipo(equipo).items()
+        if mp.examen
+    }
 
     if not mapa:
         return JsonResponse({'ok': False, 'error': f'El equipo {equipo.codigo} no tiene mapeos activos con examen asignado.'}, status=400)
 
-    obx_items = _extract_obx_items(msg.mensaje_raw or '')
+    obx_items = _extract_obx_items(msg.hl7)
     if not obx_items:
         return JsonResponse({'ok': False, 'error': 'El HL7 no contiene OBX procesables.'}, status=400)
 
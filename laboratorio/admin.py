@@ -16,7 +16,7 @@ class ExamenAdmin(admin.ModelAdmin):
 
 @admin.register(Orden)
 class OrdenAdmin(admin.ModelAdmin):
-    list_display = ('numero_orden', 'paciente', 'fecha', 'estado', 'total')
+    list_display = ('numero_orden', 'paciente', 'fecha', 'estado', 'total', 'estado_pdf')
     search_fields = ('numero_orden', 'paciente__nombre_completo')
 
 
@@ -0,0 +1,188 @@
+"""
+Compara cómo se dibujan las 4 gráficas de Hematología del informe (RBC, PLT,
+DIFF, BASO): tiempo por informe y bytes del PDF.
+
+- matplotlib: histogramas rasterizados a PNG (como el InformeCanvas anterior)
+  y un círculo por punto. Solo si matplotlib está instalado.
+- canvas: una línea por segmento del histograma y un círculo por punto.
+- vectorial: laboratorio/utils/graficas_pdf.py (lo que usa el informe).
+
+    python manage.py benchmark_graficas --puntos 5000
+"""
+import importlib
+import io
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from laboratorio.utils import graficas_pdf
+
+
+ANCHO, ALTO = 111.25, 90
+POSICIONES = [60 + i * (ANCHO + 10) for i in range(4)]
+
+
+def _datos(puntos, semilla):
+    rng = np.random.default_rng(semilla)
+    canales = np.arange(256)
+
+    def curva(centro, ancho):
+        return (200 * np.exp(-((canales - centro) / ancho) ** 2) + rng.integers(0, 4, 256)).astype(int).tolist()
+
+    def nube(n, centro):
+        return [tuple(p) for p in rng.normal(centro, 25, (n, 2)).clip(0, 255).astype(int).tolist()]
+
+    rojo, verde, azul = colors.Color(1, 0, 0), colors.Color(0, 1, 0), colors.Color(0, 0, 1)
+    return {
+        "rbc": curva(90, 25),
+        "plt": curva(40, 30),
+        "diff": [(rojo, nube(puntos * 6 // 10, 150)), (verde, nube(puntos * 4 // 10, 80))],
+        "baso": [(azul, nube(puntos // 2, 120))],
+    }
+
+
+# ------------------------------
+# COPIAS DE LO ANTERIOR
+# ------------------------------
+
+def _hist_matplotlib(c, x, y, width, height, values, label):
+    """Copia de InformeCanvas._draw_histogram_matplotlib."""
+    plt = importlib.import_module("matplotlib.pyplot")
+    fig, ax = plt.subplots(figsize=(width / 72, height / 72), dpi=72)
+    fig.patch.set_facecolor('white')
+    ax.set_facecolor('white')
+    x_vals = list(range(len(values)))
+    ax.fill_between(x_vals, values, color='#00CCFF', alpha=0.7)
+    ax.plot(x_vals, values, color='#0088CC', linewidth=0.8)
+    ax.set_xlim(0, len(values) - 1)
+    ax.set_ylim(0, max(values) * 1.1)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    for lado in ('left', 'bottom'):
+        ax.spines[lado].set_color('#333333')
+        ax.spines[lado].set_linewidth(0.7)
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+    ax.set_title(label, fontsize=9, fontweight='bold', pad=2)
+    if label == "RBC":
+        ax.set_xlim(0, 300)
+        ax.set_xticks([0, 100, 200, 300])
+        ax.set_xticklabels(['0', '100', '200', ''], fontsize=6)
+        ax.set_xlabel('fL', fontsize=7)
+    else:
+        ax.set_xlim(0, 40)
+        ax.set_xticks([0, 10, 20, 30, 40])
+        ax.set_xticklabels(['0', '10', '20', '30', '40'], fontsize=6)
+        ax.set_xlabel('fL', fontsize=7)
+    plt.tight_layout(pad=0.3)
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', transparent=True, dpi=72)
+    buf.seek(0)
+    c.drawImage(ImageReader(buf), x, y, width=width, height=height, mask='auto')
+    plt.close(fig)
+
+
+def _hist_canvas(c, x, y, width, height, values, label):
+    """Copia de la curva de InformeCanvas._draw_hist anterior (ejes y escalas aparte)."""
+    max_val = max(values) or 1
+    c.setStrokeColor(graficas_pdf.COLOR_CURVA)
+    c.setLineWidth(1)
+    step = width / float(len(values) - 1)
+    previo = None
+    for i, v in enumerate(values):
+        punto = (x + i * step, y + (v / max_val) * (height - 6))
+        if previo:
+            c.line(*previo, *punto)
+        previo = punto
+    c.setStrokeColor(graficas_pdf.COLOR_EJES)
+    c.setLineWidth(0.7)
+    c.line(x, y, x, y + height)
+    c.line(x, y, x + width, y)
+    c.setFont("Helvetica-Bold", 9)
+    c.drawCentredString(x + width / 2, y + height + 4, label)
+
+
+def _scatter_canvas(c, x, y, width, height, grupos, label):
+    """Copia de los puntos de InformeCanvas._draw_scatter anterior: un círculo por punto."""
+    todos = [p for _, puntos in grupos for p in puntos]
+    min_x, max_x = min(p[0] for p in todos), max(p[0] for p in todos)
+    min_y, max_y = min(p[1] for p in todos), max(p[1] for p in todos)
+    c.setLineWidth(0)
+    for color, puntos in grupos:
+        c.setFillColor(color)
+        for px, py in puntos:
+            nx = x + (px - min_x) / (max_x - min_x) * (width - 4) + 2
+            ny = y + (py - min_y) / (max_y - min_y) * (height - 4) + 2
+            c.circle(nx, ny, 0.7, stroke=0, fill=1)
+    c.setStrokeColor(graficas_pdf.COLOR_EJES)
+    c.setLineWidth(0.7)
+    c.line(x, y, x, y + height)
+    c.line(x, y, x + width, y)
+    c.setFont("Helvetica-Bold", 9)
+    c.drawCentredString(x + width / 2, y + height + 4, label)
+
+
+def _vectorial(c, x, y, width, height, datos, label, dispersion=False):
+    if dispersion:
+        dibujo = graficas_pdf.dispersion(datos, label, width, height)
+    else:
+        dibujo = graficas_pdf.histograma(datos, label, width, height)
+    graficas_pdf.dibujar(c, dibujo, x, y)
+
+
+def _informe(datos, histograma, dispersion):
+    """Bytes de una página con las 4 gráficas."""
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    y = 600
+    histograma(c, POSICIONES[0], y, ANCHO, ALTO, datos["rbc"], "RBC")
+    histograma(c, POSICIONES[1], y, ANCHO, ALTO, datos["plt"], "PLT")
+    dispersion(c, POSICIONES[2], y, ANCHO, ALTO, datos["diff"], "DIFF")
+    dispersion(c, POSICIONES[3], y, ANCHO, ALTO, datos["baso"], "BASO")
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Mide el dibujo de las gráficas de Hematología del informe (matplotlib / canvas / vectorial).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puntos', type=int, default=2000, help='Puntos de la dispersión DIFF (BASO: la mitad)')
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **options):
+        datos = _datos(options['puntos'], options['semilla'])
+        self.stdout.write(
+            f"RBC/PLT: 256 canales; DIFF: {options['puntos']} puntos; BASO: {options['puntos'] // 2} puntos"
+        )
+
+        variantes = [
+            ("canvas", _hist_canvas, _scatter_canvas),
+            ("vectorial", _vectorial, lambda *a: _vectorial(*a, dispersion=True)),
+        ]
+        try:
+            t0 = time.perf_counter()
+            importlib.import_module("matplotlib")
+            importlib.import_module("matplotlib").use("Agg")
+            importlib.import_module("matplotlib.pyplot")
+            self.stdout.write(f"  importar matplotlib.pyplot: {(time.perf_counter() - t0) * 1000:.0f} ms")
+            variantes.insert(0, ("matplotlib", _hist_matplotlib, _scatter_canvas))
+        except ImportError:
+            self.stdout.write("  matplotlib no está instalado: se omite esa variante")
+
+        for nombre, histograma, dispersion in variantes:
+            _informe(datos, histograma, dispersion)  # calentar
+            mejor = None
+            for _ in range(max(1, options['repeticiones'])):
+                t0 = time.perf_counter()
+                pdf = _informe(datos, histograma, dispersion)
+                dt = time.perf_counter() - t0
+                mejor = dt if mejor is None else min(mejor, dt)
+            self.stdout.write(f"  {nombre:<11} {mejor * 1000:8.1f} ms  {len(pdf) / 1024:8.1f} KB")
@@ -0,0 +1,107 @@
+"""
+Exporta los informes PDF de muchas órdenes a un ZIP (uno por orden) o a un
+solo PDF, generándolos en paralelo (laboratorio/utils/pdf_lote.py).
+
+    python manage.py exportar_informes --desde 2026-01-01 --hasta 2026-01-31 --salida enero.zip
+    python manage.py exportar_informes --medico salas --formato pdf --salida salas.pdf
+    python manage.py exportar_informes --ids 10,11,12 --todas --salida tres.zip
+"""
+import os
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from laboratorio.utils import pdf_lote
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Fecha inválida (AAAA-MM-DD): {valor}')
+
+
+class Command(BaseCommand):
+    help = 'Exporta los informes PDF de varias órdenes a un ZIP o a un solo PDF.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_fecha, help='Órdenes desde esta fecha (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=_fecha, help='Órdenes hasta esta fecha, incluida (AAAA-MM-DD)')
+        parser.add_argument('--medico', help='Médico solicitante (parte del nombre)')
+        parser.add_argument('--paciente', help='Documento de identidad del paciente')
+        parser.add_argument('--ids', help='Ids de orden separados por coma')
+        parser.add_argument(
+            '--todas',
+            action='store_true',
+            help='Incluye las órdenes no validadas (por defecto solo las validadas)',
+        )
+        parser.add_argument(
+            '--formato',
+            choices=('zip', 'pdf'),
+            help='zip (un PDF por orden) o pdf (uno solo); por defecto según la extensión de --salida',
+        )
+        parser.add_argument('--salida', required=True, help='Archivo a escribir')
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=None,
+            help='Procesos para generar los informes (por defecto INFORME_LOTE_PROCESOS o uno por núcleo)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            ids = [int(i) for i in (options['ids'] or '').split(',') if i.strip()]
+        except ValueError:
+            raise CommandError('--ids: se esperaban números separados por coma')
+        if not (ids or options['desde'] or options['hasta'] or options['medico'] or options['paciente']):
+            raise CommandError('Indique --desde/--hasta, --medico, --paciente o --ids')
+
+        seleccion = pdf_lote.ordenes(
+            desde=options['desde'], hasta=options['hasta'], medico=options['medico'],
+            paciente=options['paciente'], ids=ids, todas=options['todas'],
+        )
+        if not seleccion:
+            raise CommandError('No hay órdenes con esos filtros')
+
+        salida = options['salida']
+        formato = options['formato'] or ('pdf' if salida.lower().endswith('.pdf') else 'zip')
+        self.stdout.write(f'Órdenes a exportar: {len(seleccion)} ({formato})')
+
+        self._ultimo = 0.0
+        generar = pdf_lote.pdf_informes if formato == 'pdf' else pdf_lote.zip_informes
+        temporal = f'{salida}.{os.getpid()}.tmp'
+        try:
+            with open(temporal, 'wb') as f:
+                for parte in generar(seleccion, options['procesos'], self._progreso):
+                    f.write(parte)
+            os.replace(temporal, salida)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+        estado = self._estado
+        mensaje = (
+            f'{salida}: {estado.listos} informes en {time.monotonic() - estado.inicio:.1f} s '
+            f'({os.path.getsize(salida) / 1024 / 1024:.1f} MB)'
+        )
+        if estado.fallidos:
+            self.stdout.write(self.style.WARNING(f'{mensaje}; fallidos: {estado.fallidos}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(mensaje))
+
+    def _progreso(self, estado):
+        self._estado = estado
+        ahora = time.monotonic()
+        hechos = estado.listos + estado.fallidos
+        # Una línea por segundo como mucho, y la del último informe
+        if estado.terminado or (ahora - self._ultimo < 1.0 and hechos < estado.total):
+            return
+        self._ultimo = ahora
+        segundos = ahora - estado.inicio
+        ritmo = hechos / segundos if segundos else 0.0
+        restante = (estado.total - hechos) / ritmo if ritmo else 0.0
+        self.stdout.write(
+            f'  {hechos}/{estado.total} ({ritmo:.1f}/s, faltan ~{restante:.0f} s)'
+            + (f', fallidos: {estado.fallidos}' if estado.fallidos else '')
+        )
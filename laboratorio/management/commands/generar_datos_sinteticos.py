@@ -0,0 +1,512 @@
+"""
+Llena una BD de prueba (vacía) con volúmenes reales para medir rendimiento:
+pacientes, órdenes con sus exámenes y resultados, y mensajes HL7 con y sin
+imágenes. Todo con bulk_create y una semilla fija: la misma semilla y los
+mismos argumentos dan los mismos datos (las fechas se cuentan hacia atrás
+desde hoy).
+
+    python manage.py generar_datos_sinteticos                 # 200k / 1M / 20M / 2M
+    python manage.py generar_datos_sinteticos --escala 0.01   # 1% para probar rápido
+"""
+import base64
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from configuracion import graficas_hl7, imagenes_hl7
+from configuracion.models import Equipo, HL7Grafica, HL7Imagen, HL7Mensaje
+from configuracion.ordenes_hl7 import clave_muestra
+from laboratorio.models import Examen, ExamenParametro, Orden, OrdenExamen, Paciente, Resultado
+
+
+NOMBRES = (
+    "JUAN", "MARIA", "CARLOS", "ANA", "LUIS", "ROSA", "JOSE", "CARMEN", "JORGE", "LUCIA",
+    "PEDRO", "ELENA", "MIGUEL", "SOFIA", "DIEGO", "PATRICIA", "RAUL", "VERONICA", "OSCAR", "GLORIA",
+)
+APELLIDOS = (
+    "QUISPE", "MAMANI", "GARCIA", "RODRIGUEZ", "FLORES", "LOPEZ", "SANCHEZ", "RAMIREZ", "TORRES", "CHAVEZ",
+    "VARGAS", "CASTILLO", "ROJAS", "MENDOZA", "HUAMAN", "GUTIERREZ", "DIAZ", "PEREZ", "CRUZ", "RIOS",
+)
+MEDICOS = (
+    "DR. ALBERTO SALAS", "DRA. INES PAREDES", "DR. VICTOR CACERES", "DRA. NORMA ARIAS",
+    "DR. HUGO VILLANUEVA", "DRA. SILVIA PONCE", "DR. RENE ESPINOZA", "DRA. MONICA LEON",
+)
+
+# Catálogo para una BD sin exámenes: codigo, nombre, area, muestra, precio,
+# parámetros (nombre, unidad, referencia, mínimo, máximo) o (nombre, None, None, valores)
+CATALOGO = [
+    ("HEM", "HEMOGRAMA COMPLETO", "HEMATOLOGIA", "Sangre", "25.00", [
+        ("Leucocitos", "10^9/L", "4.00-10.00", 3.0, 12.0),
+        ("Linfocitos %", "%", "20.0-40.0", 15.0, 45.0),
+        ("Monocitos %", "%", "3.0-14.0", 2.0, 15.0),
+        ("Granulocitos %", "%", "50.0-70.0", 45.0, 75.0),
+        ("Hematíes", "10^12/L", "4.00-5.50", 3.5, 6.0),
+        ("Hemoglobina", "g/dL", "12.0-16.0", 10.0, 18.0),
+        ("Hematocrito", "%", "36.0-50.0", 32.0, 52.0),
+        ("VCM", "fL", "80.0-100.0", 75.0, 105.0),
+        ("HCM", "pg", "27.0-34.0", 25.0, 36.0),
+        ("CHCM", "g/dL", "32.0-36.0", 30.0, 37.0),
+        ("RDW-CV", "%", "11.0-16.0", 10.0, 18.0),
+        ("Plaquetas", "10^9/L", "100-300", 80.0, 450.0),
+        ("VPM", "fL", "6.5-12.0", 6.0, 13.0),
+        ("Plaquetocrito", "%", "0.108-0.282", 0.1, 0.3),
+    ]),
+    ("LIP", "PERFIL LIPIDICO", "BIOQUIMICA", "Sangre", "45.00", [
+        ("Colesterol total", "mg/dL", "0-200", 120.0, 280.0),
+        ("HDL", "mg/dL", "40-60", 30.0, 75.0),
+        ("LDL", "mg/dL", "0-130", 60.0, 190.0),
+        ("VLDL", "mg/dL", "5-40", 5.0, 50.0),
+        ("Triglicéridos", "mg/dL", "0-150", 60.0, 320.0),
+    ]),
+    ("HEP", "PERFIL HEPATICO", "BIOQUIMICA", "Sangre", "60.00", [
+        ("TGO", "U/L", "0-40", 10.0, 90.0),
+        ("TGP", "U/L", "0-41", 10.0, 95.0),
+        ("Fosfatasa alcalina", "U/L", "40-129", 30.0, 200.0),
+        ("GGT", "U/L", "8-61", 5.0, 120.0),
+        ("Bilirrubina total", "mg/dL", "0.1-1.2", 0.1, 2.5),
+        ("Bilirrubina directa", "mg/dL", "0.0-0.3", 0.0, 1.0),
+        ("Proteínas totales", "g/dL", "6.4-8.3", 5.5, 9.0),
+        ("Albúmina", "g/dL", "3.5-5.2", 2.8, 5.5),
+    ]),
+    ("ELE", "ELECTROLITOS", "BIOQUIMICA", "Sangre", "35.00", [
+        ("Sodio", "mmol/L", "135-145", 128.0, 150.0),
+        ("Potasio", "mmol/L", "3.5-5.1", 3.0, 6.0),
+        ("Cloro", "mmol/L", "98-107", 92.0, 112.0),
+    ]),
+    ("ORI", "EXAMEN COMPLETO DE ORINA", "UROANALISIS", "Orina", "15.00", [
+        ("Color", None, None, ("Amarillo", "Amarillo claro", "Ámbar")),
+        ("Aspecto", None, None, ("Transparente", "Ligeramente turbio", "Turbio")),
+        ("Densidad", "", "1.005-1.030", 1.000, 1.035),
+        ("pH", "", "5.0-8.0", 4.5, 8.5),
+        ("Proteínas", None, None, ("Negativo", "Negativo", "Trazas", "+")),
+        ("Glucosa", None, None, ("Negativo", "Negativo", "Negativo", "+")),
+        ("Leucocitos", "x campo", "0-5", 0.0, 30.0),
+        ("Hematíes", "x campo", "0-3", 0.0, 15.0),
+        ("Células epiteliales", None, None, ("Escasas", "Regular cantidad", "Abundantes")),
+        ("Bacterias", None, None, ("Escasas", "Regular cantidad", "Abundantes")),
+    ]),
+    ("GLU", "GLUCOSA", "BIOQUIMICA", "Sangre", "8.00", [("Glucosa", "mg/dL", "70-110", 60.0, 220.0)]),
+    ("URE", "UREA", "BIOQUIMICA", "Sangre", "10.00", [("Urea", "mg/dL", "15-45", 10.0, 90.0)]),
+    ("CRE", "CREATININA", "BIOQUIMICA", "Sangre", "10.00", [("Creatinina", "mg/dL", "0.7-1.3", 0.5, 2.5)]),
+    ("ACU", "ACIDO URICO", "BIOQUIMICA", "Sangre", "10.00", [("Ácido úrico", "mg/dL", "3.4-7.0", 2.5, 10.0)]),
+    ("HBA", "HEMOGLOBINA GLICOSILADA", "BIOQUIMICA", "Sangre", "40.00", [("HbA1c", "%", "4.0-5.6", 4.0, 11.0)]),
+    ("TSH", "TSH", "INMUNOLOGIA", "Sangre", "35.00", [("TSH", "uUI/mL", "0.27-4.20", 0.1, 9.0)]),
+    ("T4L", "T4 LIBRE", "INMUNOLOGIA", "Sangre", "35.00", [("T4 libre", "ng/dL", "0.93-1.70", 0.6, 2.4)]),
+    ("PCR", "PROTEINA C REACTIVA", "INMUNOLOGIA", "Sangre", "20.00", [("PCR", "mg/L", "0-5", 0.1, 60.0)]),
+    ("VSG", "VELOCIDAD DE SEDIMENTACION", "HEMATOLOGIA", "Sangre", "8.00", [("VSG", "mm/h", "0-20", 2.0, 60.0)]),
+    ("GRH", "GRUPO SANGUINEO Y FACTOR RH", "HEMATOLOGIA", "Sangre", "12.00", [
+        ("Grupo sanguíneo", None, None, ("O", "O", "O", "A", "A", "B", "AB")),
+        ("Factor Rh", None, None, ("Positivo",) * 9 + ("Negativo",)),
+    ]),
+    ("HCG", "BETA HCG CUALITATIVA", "INMUNOLOGIA", "Sangre", "25.00", [
+        ("Beta HCG", None, None, ("Negativo", "Negativo", "Negativo", "Positivo")),
+    ]),
+    ("TPT", "TIEMPO DE PROTROMBINA", "HEMATOLOGIA", "Sangre", "20.00", [
+        ("Tiempo de protrombina", "seg", "11.0-13.5", 10.0, 18.0),
+        ("INR", "", "0.8-1.2", 0.8, 2.5),
+    ]),
+    ("PHE", "PARASITOLOGICO SERIADO", "MICROBIOLOGIA", "Heces", "18.00", [
+        ("Resultado", None, None, ("No se observan parásitos",) * 4 + ("Blastocystis hominis", "Giardia lamblia")),
+    ]),
+]
+
+# Valores de los OBX del hemograma del KT-6610: codigo, unidad, referencia, mínimo, máximo
+OBX_CBC = [(p[0], p[1], p[2], p[3], p[4]) for p in CATALOGO[0][5]]
+IMAGENES_ED = ("WBC Image", "DIFF Image", "BASO Image")
+VARIANTES_GRAFICAS = 32
+
+PROPORCION_FUERA_DE_RANGO = 0.08
+DIAS_RECIENTES = 7   # órdenes de la última semana: todavía en curso
+
+# Resultado va con executemany: son 20 por orden y armar cada fila con el ORM
+# (bulk_create) tomaba más que la inserción misma
+COLUMNAS_RESULTADO = (
+    'orden_examen_id', 'parametro', 'valor', 'unidad', 'referencia', 'fuera_de_rango', 'validado',
+    'verificado', 'fecha_validacion', 'orden_equipo', 'creado', 'modificado',
+    'acreditado', 'es_calculado', 'observacion', 'metodo', 'validado_por_id',
+)
+
+
+@contextmanager
+def _sin_auto_now(*modelos):
+    """Permite fijar a mano las fechas auto_now / auto_now_add (se reparten en el período)."""
+    campos = [
+        (campo, campo.auto_now, campo.auto_now_add)
+        for modelo in modelos for campo in modelo._meta.concrete_fields
+        if getattr(campo, 'auto_now', False) or getattr(campo, 'auto_now_add', False)
+    ]
+    for campo, _, _ in campos:
+        campo.auto_now = campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, auto_now, auto_now_add in campos:
+            campo.auto_now, campo.auto_now_add = auto_now, auto_now_add
+
+
+class _Parametro:
+    __slots__ = ('nombre', 'unidad', 'referencia', 'minimo', 'maximo', 'bajo', 'alto', 'valores', 'decimales')
+
+    def __init__(self, nombre, unidad, referencia, minimo=None, maximo=None, valores=None):
+        self.nombre, self.unidad, self.referencia = nombre, unidad, referencia
+        self.minimo, self.maximo, self.valores = minimo, maximo, valores
+        self.bajo = self.alto = None
+        if referencia and '-' in referencia:
+            try:
+                self.bajo, self.alto = (float(x) for x in referencia.replace(',', '.').split('-', 1))
+            except ValueError:
+                pass
+        if self.bajo is not None and minimo is None:
+            ancho = self.alto - self.bajo
+            self.minimo, self.maximo = max(0.0, self.bajo - ancho * 0.3), self.alto + ancho * 0.3
+        self.decimales = len(referencia.split('-')[0].split('.')[1]) if referencia and '.' in referencia.split('-')[0] else 0
+
+    def valor(self, rng):
+        """(valor, fuera_de_rango)."""
+        if self.bajo is None:
+            return rng.choice(self.valores or ("Negativo",)), False
+        if rng.random() < PROPORCION_FUERA_DE_RANGO:
+            numero = rng.uniform(self.minimo, self.bajo) if rng.random() < 0.5 else rng.uniform(self.alto, self.maximo)
+        else:
+            numero = rng.uniform(self.bajo, self.alto)
+        numero = round(numero, self.decimales)
+        return f"{numero:.{self.decimales}f}", not (self.bajo <= numero <= self.alto)
+
+
+class Command(BaseCommand):
+    help = (
+        "Llena una BD de prueba vacía con pacientes, órdenes, resultados y mensajes HL7 "
+        "sintéticos (bulk_create, semilla fija) para medir rendimiento a escala."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=200_000)
+        parser.add_argument('--ordenes', type=int, default=1_000_000)
+        parser.add_argument('--resultados', type=int, default=20_000_000,
+                            help='Resultado aproximados en total (define cuántos exámenes lleva cada orden)')
+        parser.add_argument('--mensajes', type=int, default=2_000_000, help='HL7Mensaje aproximados en total')
+        parser.add_argument('--imagenes', type=float, default=0.02,
+                            help='Fracción de los mensajes de resultados que traen las 3 imágenes ED (por defecto 0.02)')
+        parser.add_argument('--escala', type=float, default=1.0,
+                            help='Multiplica todas las cantidades (0.01 = 1%% para una prueba rápida)')
+        parser.add_argument('--dias', type=int, default=730, help='Días hacia atrás en que se reparten las órdenes')
+        parser.add_argument('--semilla', type=int, default=20250101)
+        parser.add_argument('--lote', type=int, default=1000, help='Órdenes por transacción (por defecto 1000)')
+
+    def handle(self, *args, **options):
+        escala = options['escala']
+        n_pacientes = max(1, round(options['pacientes'] * escala))
+        n_ordenes = max(1, round(options['ordenes'] * escala))
+        n_resultados = round(options['resultados'] * escala)
+        n_mensajes = round(options['mensajes'] * escala)
+
+        for modelo in (Paciente, Orden, OrdenExamen, Resultado, HL7Mensaje):
+            if modelo.objects.exists():
+                raise CommandError(
+                    f'La tabla de {modelo.__name__} no está vacía: use una BD de prueba nueva '
+                    '(los ids se asignan desde 1)'
+                )
+
+        self.rng = random.Random(options['semilla'])
+        self.hasta = timezone.now().replace(microsecond=0)
+        self.segundos = options['dias'] * 86400
+        self.lote = max(1, options['lote'])
+        self.fraccion_imagenes = options['imagenes']
+
+        if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+            # BD descartable: sin fsync por transacción
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+
+        inicio = time.monotonic()
+        self._catalogo()
+        self._equipos()
+        self._variantes_hl7()
+
+        # Exámenes por orden para llegar a --resultados: las pendientes no tienen resultados
+        en_curso = min(1.0, DIAS_RECIENTES / max(1, options['dias']))
+        con_resultados = n_ordenes * (1 - en_curso * 0.3)
+        promedio = n_resultados / max(1.0, con_resultados * self.parametros_por_examen)
+        self.examenes_por_orden = max(1.0, min(promedio, len(self.examenes)))
+        self.mensajes_por_orden = n_mensajes / n_ordenes
+
+        with _sin_auto_now(Paciente, Orden, OrdenExamen, Resultado, HL7Mensaje, HL7Imagen):
+            self._pacientes(n_pacientes)
+            self.n_pacientes = n_pacientes
+            totales = self._ordenes(n_ordenes)
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Listo en {time.monotonic() - inicio:.0f} s: {n_pacientes} pacientes, {n_ordenes} órdenes, '
+            f'{totales["examenes"]} OrdenExamen, {totales["resultados"]} Resultado, '
+            f'{totales["mensajes"]} HL7Mensaje ({totales["con_imagenes"]} con imágenes), '
+            f'{totales["graficas"]} HL7Grafica'
+        ))
+
+    # ------------------------------
+    # CATÁLOGO Y EQUIPOS
+    # ------------------------------
+
+    def _catalogo(self):
+        if not Examen.objects.exists():
+            for codigo, nombre, area, muestra, precio, parametros in CATALOGO:
+                examen = Examen.objects.create(codigo=codigo, nombre=nombre, area=area, muestra=muestra,
+                                               precio=Decimal(precio))
+                ExamenParametro.objects.bulk_create([
+                    ExamenParametro(examen=examen, nombre=p[0], unidad=p[1] or '', referencia=p[2] or '')
+                    for p in parametros
+                ])
+            self.stdout.write(f'Catálogo sintético: {len(CATALOGO)} exámenes')
+
+        definiciones = {
+            nombre: [_Parametro(p[0], p[1], p[2], *p[3:]) if len(p) == 5 else _Parametro(p[0], p[1], p[2], valores=p[3])
+                     for p in parametros]
+            for _, nombre, _, _, _, parametros in CATALOGO
+        }
+        self.examenes = []
+        for examen in Examen.objects.filter(activo=True).prefetch_related('parametros').order_by('id'):
+            parametros = definiciones.get(examen.nombre) or [
+                _Parametro(p.nombre, p.unidad, p.referencia) for p in examen.parametros.all()
+            ] or [_Parametro(examen.nombre, examen.unidad, None)]
+            self.examenes.append((examen.id, examen.precio, parametros))
+        if not self.examenes:
+            raise CommandError('No hay exámenes activos')
+        self.parametros_por_examen = sum(len(p) for _, _, p in self.examenes) / len(self.examenes)
+
+    def _equipos(self):
+        self.equipos = list(Equipo.objects.filter(tipo_integracion='HL7').values_list('id', 'host'))
+        if not self.equipos:
+            self.equipos = [(None, '192.168.1.50')]
+
+    def _variantes_hl7(self):
+        """OBX de gráficas e imágenes ya armados: se reusan entre mensajes."""
+        rng = random.Random(self.rng.random())
+
+        def histograma(centro):
+            return [max(0, int(200 * 2.718 ** (-((i - centro) / 25.0) ** 2)) + rng.randrange(5)) for i in range(256)]
+
+        def scatter(n):
+            return [(rng.randrange(256), rng.randrange(256)) for _ in range(n)]
+
+        self.variantes = []
+        for _ in range(VARIANTES_GRAFICAS):
+            rbc, plt = histograma(rng.uniform(80, 100)), histograma(rng.uniform(30, 50))
+            diff = [(16711680, scatter(600)), (65280, scatter(400))]
+            baso = [(255, scatter(300))]
+            obx = [
+                ("RBC Histogram.Binary", "16711680;" + ",".join(map(str, rbc))),
+                ("PLT Histogram.Binary", "255;" + ",".join(map(str, plt))),
+                ("DIFFScatter.Binary", ";".join(
+                    f"{color}," + "".join(f"({x},{y})" for x, y in puntos) for color, puntos in diff)),
+                ("BASOScatter.Binary", ";".join(
+                    f"{color}," + "".join(f"({x},{y})" for x, y in puntos) for color, puntos in baso)),
+            ]
+            datos = {
+                'rbc': graficas_hl7.empacar([(16711680, rbc)]),
+                'plt': graficas_hl7.empacar([(255, plt)]),
+                'diff': graficas_hl7.empacar([(c, [v for p in ps for v in p]) for c, ps in diff]),
+                'baso': graficas_hl7.empacar([(c, [v for p in ps for v in p]) for c, ps in baso]),
+            }
+            self.variantes.append((obx, datos))
+
+        # Imagen RAW 255x255 RGB como la del KT-6610
+        raw = bytearray(b"\xf4" * (255 * 255 * 3))
+        for _ in range(4000):
+            p = rng.randrange(255 * 255) * 3
+            raw[p:p + 3] = bytes((rng.randrange(256), rng.randrange(120), rng.randrange(256)))
+        self.imagen_ed = base64.b64encode(bytes(raw)).decode("ascii")
+
+    # ------------------------------
+    # PACIENTES
+    # ------------------------------
+
+    def _fecha(self, fraccion):
+        """Fecha del período (0 = --dias atrás, 1 = ahora)."""
+        return self.hasta - timedelta(seconds=int(self.segundos * (1 - fraccion)))
+
+    def _pacientes(self, total):
+        rng = self.rng
+        hoy = date.today()
+        for desde in range(0, total, self.lote * 5):
+            filas = []
+            for i in range(desde, min(total, desde + self.lote * 5)):
+                sexo = rng.choice('MF')
+                nombre = f"{rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)} {rng.choice(NOMBRES)}"
+                registro = self._fecha(i / total * 0.9)
+                filas.append(Paciente(
+                    id=i + 1,
+                    documento_identidad=f"{40000000 + i * 7 % 60000000:08d}",
+                    nombre_completo=nombre,
+                    sexo=sexo,
+                    fecha_nacimiento=hoy - timedelta(days=rng.randrange(365, 90 * 365)),
+                    telefono=f"9{rng.randrange(10 ** 8):08d}" if rng.random() < 0.7 else None,
+                    email=f"paciente{i + 1}@correo.test" if rng.random() < 0.3 else None,
+                    direccion=f"Av. Sintética {rng.randrange(1, 2000)}" if rng.random() < 0.5 else None,
+                    fecha_registro=registro.date(),
+                    numero_registro=10001 + i,
+                    creado_en=registro,
+                    actualizado_en=registro,
+                ))
+            with transaction.atomic():
+                Paciente.objects.bulk_create(filas)
+            self.stdout.write(f'  pacientes: {desde + len(filas)}')
+
+    # ------------------------------
+    # ÓRDENES, RESULTADOS Y MENSAJES
+    # ------------------------------
+
+    def _estado(self, fecha):
+        if (self.hasta - fecha).days >= DIAS_RECIENTES:
+            return 'Validado' if self.rng.random() < 0.97 else 'En validación'
+        return self.rng.choices(
+            ('Pendiente', 'En proceso', 'En validación', 'Validado'), (0.3, 0.25, 0.25, 0.2)
+        )[0]
+
+    def _cantidad(self, promedio):
+        base = int(promedio)
+        return base + (self.rng.random() < promedio - base)
+
+    def _ordenes(self, total):
+        totales = dict.fromkeys(('examenes', 'resultados', 'mensajes', 'con_imagenes', 'graficas'), 0)
+        ids = {'oe': 0, 'msg': 0}
+        for desde in range(0, total, self.lote):
+            filas = {'ordenes': [], 'examenes': [], 'resultados': [], 'mensajes': [], 'imagenes': [], 'graficas': []}
+            for i in range(desde, min(total, desde + self.lote)):
+                self._orden(i, total, filas, ids)
+            with transaction.atomic():
+                Orden.objects.bulk_create(filas['ordenes'])
+                OrdenExamen.objects.bulk_create(filas['examenes'])
+                self._insertar_resultados(filas['resultados'])
+                HL7Mensaje.objects.bulk_create(filas['mensajes'], batch_size=200)
+                HL7Imagen.objects.bulk_create(filas['imagenes'])
+                HL7Grafica.objects.bulk_create(filas['graficas'])
+            totales['examenes'] += len(filas['examenes'])
+            totales['resultados'] += len(filas['resultados'])
+            totales['mensajes'] += len(filas['mensajes'])
+            totales['con_imagenes'] += len({im.mensaje_id for im in filas['imagenes']})
+            totales['graficas'] += len(filas['graficas'])
+            self.stdout.write(
+                f'  órdenes: {desde + len(filas["ordenes"])}; resultados: {totales["resultados"]}; '
+                f'mensajes: {totales["mensajes"]}'
+            )
+        return totales
+
+    def _insertar_resultados(self, filas):
+        if not filas:
+            return
+        tabla = connection.ops.quote_name(Resultado._meta.db_table)
+        columnas = ", ".join(
+            connection.ops.quote_name(Resultado._meta.get_field(c.removesuffix('_id')).column)
+            for c in COLUMNAS_RESULTADO
+        )
+        marcas = ", ".join(["%s"] * len(COLUMNAS_RESULTADO))
+        with connection.cursor() as cursor:
+            cursor.executemany(f"INSERT INTO {tabla} ({columnas}) VALUES ({marcas})", filas)
+
+    def _orden(self, i, total, filas, ids):
+        rng = self.rng
+        orden_id = i + 1
+        numero = f"{1000 + i:06d}"
+        fecha = self._fecha((i + rng.random()) / total)
+        estado = self._estado(fecha)
+        # Solo pacientes ya registrados; unos pocos concentran muchas órdenes
+        registrados = max(1, min(self.n_pacientes, int(self.n_pacientes * (i + 1) / total / 0.9)))
+        paciente_id = int(registrados * rng.random() ** 1.5) + 1
+
+        examenes = rng.sample(self.examenes, min(len(self.examenes), self._cantidad(self.examenes_por_orden)))
+        estado_oe = {'Pendiente': 'Pendiente', 'En proceso': 'Pendiente',
+                     'En validación': 'Procesado', 'Validado': 'Validado'}[estado]
+        validado = estado == 'Validado'
+        fecha_resultado = fecha + timedelta(minutes=rng.randrange(30, 600))
+        fecha_db = connection.ops.adapt_datetimefield_value(fecha_resultado)
+
+        for examen_id, precio, parametros in examenes:
+            ids['oe'] += 1
+            filas['examenes'].append(OrdenExamen(
+                id=ids['oe'], orden_id=orden_id, examen_id=examen_id, precio=precio, estado=estado_oe,
+                creado_en=fecha, actualizado_en=fecha_resultado,
+            ))
+            if estado == 'Pendiente':
+                continue
+            for posicion, p in enumerate(parametros):
+                valor, fuera = p.valor(rng)
+                filas['resultados'].append((
+                    ids['oe'], p.nombre, valor, p.unidad, p.referencia, fuera, validado,
+                    validado, fecha_db if validado else None, posicion, fecha_db, fecha_db,
+                    True, False, None, None, None,
+                ))
+
+        filas['ordenes'].append(Orden(
+            id=orden_id, paciente_id=paciente_id, numero_orden=numero, fecha=fecha,
+            medico=rng.choice(MEDICOS) if rng.random() < 0.8 else None,
+            tipo='Urgente' if rng.random() < 0.1 else 'Rutina', estado=estado,
+            total=sum((precio for _, precio, _ in examenes), Decimal('0.00')),
+            creado_en=fecha, actualizado_en=fecha_resultado,
+        ))
+
+        for k in range(self._cantidad(self.mensajes_por_orden)):
+            consulta = estado == 'Pendiente' or (k == 0 and rng.random() < 0.4)
+            recepcion = fecha + timedelta(minutes=rng.randrange(5, 600))
+            self._mensaje(ids, filas, orden_id, numero, recepcion, consulta)
+
+    def _mensaje(self, ids, filas, orden_id, numero, recepcion, consulta):
+        rng = self.rng
+        ids['msg'] += 1
+        mensaje_id = ids['msg']
+        equipo_id, ip = rng.choice(self.equipos)
+        ts = timezone.localtime(recepcion).strftime('%Y%m%d%H%M%S')
+
+        imagenes = False
+        if consulta:
+            texto = (
+                f"MSH|^~\\&|Genrui|KT-6610|||{ts}||QRY^Q02|{mensaje_id}|P|2.3.1\r"
+                f"QRD|{ts}|R|D|{mensaje_id}|||RD|{numero}|OTH|||T\r"
+            )
+        else:
+            obx_graficas, datos = rng.choice(self.variantes)
+            imagenes = rng.random() < self.fraccion_imagenes
+            segmentos = [
+                f"MSH|^~\\&|Genrui|KT-6610|||{ts}||ORU^R01|{mensaje_id}|P|2.3.1",
+                "PID|1||||SINTETICO^PACIENTE||19800101|M",
+                f"OBR|1|{numero}||^CBC|||{ts}",
+            ]
+            for codigo, unidad, referencia, minimo, maximo in OBX_CBC:
+                segmentos.append(
+                    f"OBX|{len(segmentos) - 2}|NM|^{codigo}^||{round(rng.uniform(minimo, maximo), 2)}|{unidad}|{referencia}|N|||F"
+                )
+            for nombre, valor in obx_graficas:
+                segmentos.append(f"OBX|{len(segmentos) - 2}|ED|^{nombre}^||{valor}|||||F")
+            if imagenes:
+                for nombre in IMAGENES_ED:
+                    filas['imagenes'].append(HL7Imagen(
+                        mensaje_id=mensaje_id, tipo=f"_{nombre}_", formato=imagenes_hl7.FORMATO,
+                        obx_indice=len(segmentos) - 3, creado=recepcion,
+                    ))
+                    segmentos.append(
+                        f"OBX|{len(segmentos) - 2}|ED|^{nombre}^||^Image^BMP^Base64^{self.imagen_ed}|||||F"
+                    )
+            texto = "\r".join(segmentos) + "\r"
+            for tipo, empacado in datos.items():
+                filas['graficas'].append(HL7Grafica(
+                    mensaje_id=mensaje_id, orden_id=orden_id, equipo_id=equipo_id, sample_id=numero,
+                    tipo=tipo, datos=empacado,
+                ))
+
+        msg = HL7Mensaje(
+            id=mensaje_id, fecha_recepcion=recepcion, ip_equipo=ip,
+            sample_id=numero, sample_key=clave_muestra(numero), exam_codes='' if consulta else 'CBC',
+            tipo='consulta' if consulta else 'resultado',
+            estado='pendiente' if consulta else 'procesado',
+            equipo_id=equipo_id, orden_id=orden_id,
+        )
+        msg.asignar_cuerpo(texto)
+        filas['mensajes'].append(msg)
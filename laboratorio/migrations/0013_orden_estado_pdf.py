@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-17 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laboratorio', '0012_contadorproforma'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orden',
+            name='estado_pdf',
+            field=models.CharField(blank=True, choices=[('', 'Sin generar'), ('en_cola', 'En cola'), ('generando', 'Generando'), ('listo', 'Listo'), ('error', 'Error')], default='', max_length=12, verbose_name='Estado del PDF'),
+        ),
+        migrations.AddField(
+            model_name='orden',
+            name='pdf_generado',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='PDF generado el'),
+        ),
+    ]
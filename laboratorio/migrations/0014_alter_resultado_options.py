@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-18 00:06
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laboratorio', '0013_orden_estado_pdf'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='resultado',
+            options={'ordering': ['orden_examen', 'orden_equipo', 'id']},
+        ),
+    ]
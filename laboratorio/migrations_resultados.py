@@ -5,7 +5,9 @@ Esto permite que el generador de PDF con gráficas pueda mostrar resultados de 
 from django.db import transaction
 from django.db.models import Q
 
-from configuracion.models import HL7Mensaje, Equipo, EquipoMapeo
+from configuracion.hl7 import como_mensaje
+from configuracion import ordenes_hl7, registro_equipos
+from configuracion.models import HL7Mensaje
 from laboratorio.models import Orden, OrdenExamen, Resultado
 
 
@@ -23,48 +25,35 @@ def _parse_msh_fields(msh_line: str):
     return out
 
 
-def _extract_obx_items(hl7_raw_text: str):
+def _extract_obx_items(mensaje):
     """
-    Extrae items OBX del mensaje HL7.
+    Extrae items OBX del mensaje HL7 (MensajeHL7 o texto crudo).
     Devuelve lista de diccionarios con: seq, code, value, unit, ref, type, raw_obx3
     """
     items = []
 
     try:
-        for line in (hl7_raw_text or "").split("\r"):
-            line = (line or "").strip()
-            if not line.startswith("OBX|"):
-                continue
-
-            parts = line.split("|")
-            if len(parts) < 6:
+        for seg in como_mensaje(mensaje).todos("OBX"):
+            if not seg.tiene_campo(5):
                 continue
 
             try:
-                seq = int(parts[1])
+                seq = int(seg.campo(1))
             except Exception:
                 seq = 0
 
-            vtype = (parts[2] or "").strip()
-            obx3 = (parts[3] or "").strip()
-            val = (parts[5] or "").strip()
-            unit = (parts[6] or "").strip() if len(parts) > 6 else ""
-            ref = (parts[7] or "").strip() if len(parts) > 7 else ""
-
-            parts3 = obx3.split("^")
-            code = parts3[1].strip() if len(parts3) > 1 else ""
-
+            code = seg.componente(3, 1).strip()
             if not code:
                 continue
 
             items.append({
                 "seq": seq,
                 "code": code,
-                "raw_obx3": obx3,
-                "value": val,
-                "unit": unit,
-                "ref": ref,
-                "type": vtype,
+                "raw_obx3": seg.campo(3).strip(),
+                "value": seg.campo(5).strip(),
+                "unit": seg.campo(6).strip(),
+                "ref": seg.campo(7).strip(),
+                "type": seg.campo(2).strip(),
             })
 
     except Exception:
@@ -93,39 +82,18 @@ def _is_graph_or_binary_obx(item):
 
 def _detectar_equipo_desde_mensaje(msg: HL7Mensaje):
     """
-    Detecta el equipo que envió el mensaje HL7.
+    Detecta el equipo que envió el mensaje HL7 (el guardado al recibirlo; si
+    no, por IP y luego por MSH).
     """
-    # Primero intentar por IP
-    if msg.ip_equipo:
-        eq = Equipo.objects.filter(
-            activo=True, 
-            host=str(msg.ip_equipo).strip()
-        ).order_by("id").first()
-        if eq:
-            return eq
-
-    # Luego por MSH
     try:
-        msh_line = msg.msh or ""
-        msh = _parse_msh_fields(msh_line)
-        app = msh.get("sending_app", "")
-        fac = msh.get("sending_facility", "")
-
-        qs = Equipo.objects.filter(activo=True)
-
-        if fac:
-            qs = qs.filter(
-                Q(codigo__icontains=fac) |
-                Q(modelo__icontains=fac) |
-                Q(nombre__icontains=fac)
-            )
-        if app:
-            qs = qs.filter(
-                Q(codigo__icontains=app) |
-                Q(fabricante__icontains=app) |
-                Q(nombre__icontains=app)
-            )
-        return qs.order_by("id").first()
+        if msg.equipo_id:
+            eq = registro_equipos.equipo_por_id(msg.equipo_id)
+            if eq:
+                return eq
+        msh = _parse_msh_fields(msg.msh or "")
+        return registro_equipos.resolver_equipo(
+            msg.ip_equipo, msh.get("sending_app", ""), msh.get("sending_facility", "")
+        )
     except Exception:
         return None
 
@@ -163,10 +131,8 @@ def migrar_resultados_desde_hl7(orden_id=None, dry_run=False):
     for orden in ordenes:
         num_orden = orden.numero_orden
         
-        # Buscar mensaje HL7 que coincida con el número de orden
-        msg = HL7Mensaje.objects.filter(
-            sample_id=num_orden
-        ).first()
+        # Mensaje HL7 enlazado a la orden (al recibirlo o por enlazar_mensajes_hl7)
+        msg = ordenes_hl7.mensaje_de_orden(orden)
 
         if not msg:
             resultados["ordenes_sin_mensaje"] += 1
@@ -188,15 +154,7 @@ def migrar_resultados_desde_hl7(orden_id=None, dry_run=False):
             continue
 
         # Obtener mapeos
-        mapeos = EquipoMapeo.objects.filter(
-            equipo=equipo, 
-            activo=True
-        ).select_related("examen").all()
-        
-        mapa = {}
-        for mp in mapeos:
-            if mp.codigo_equipo:
-                mapa[mp.codigo_equipo.strip()] = mp
+        mapa = registro_equipos.mapa_equipo(equipo)
 
         if not mapa:
             resultados["ordenes_sin_mapeo"] += 1
@@ -208,7 +166,7 @@ def migrar_resultados_desde_hl7(orden_id=None, dry_run=False):
             continue
 
         # Extraer OBX
-        items = _extract_obx_items(msg.mensaje_raw or "")
+        items = _extract_obx_items(msg.hl7)
         if not items:
             resultados["detalle"].append({
                 "orden": num_orden,
@@ -350,7 +308,7 @@ def reporte_migracion():
         num_orden = orden.numero_orden
         
         # Verificar si existe mensaje HL7
-        msg = HL7Mensaje.objects.filter(sample_id=num_orden).first()
+        msg = ordenes_hl7.mensaje_de_orden(orden)
         
         if msg:
             # Verificar si ya está procesado
@@ -399,8 +357,8 @@ def procesar_mensajes_hl7_pendientes(dry_run=False):
     for msg in mensajes:
         num_orden = msg.sample_id
         
-        # Buscar orden que coincida con el sample_id
-        orden = Orden.objects.filter(numero_orden=num_orden).first()
+        # Orden enlazada al mensaje (o la que coincida con el sample_id)
+        orden = ordenes_hl7.orden_del_mensaje(msg, guardar=not dry_run)
         
         if not orden:
             resultados["mensajes_sin_orden"] += 1
@@ -425,15 +383,7 @@ def procesar_mensajes_hl7_pendientes(dry_run=False):
             continue
 
         # Obtener mapeos
-        mapeos = EquipoMapeo.objects.filter(
-            equipo=equipo, 
-            activo=True
-        ).select_related("examen").all()
-        
-        mapa = {}
-        for mp in mapeos:
-            if mp.codigo_equipo:
-                mapa[mp.codigo_equipo.strip()] = mp
+        mapa = registro_equipos.mapa_equipo(equipo)
 
         if not mapa:
             resultados["mensajes_sin_mapeo"] += 1
@@ -446,7 +396,7 @@ def procesar_mensajes_hl7_pendientes(dry_run=False):
             continue
 
         # Extraer OBX
-        items = _extract_obx_items(msg.mensaje_raw or "")
+        items = _extract_obx_items(msg.hl7)
         if not items:
             resultados["detalle"].append({
                 "mensaje_id": msg.id,
@@ -104,6 +104,15 @@ class Orden(models.Model):
     observaciones = models.TextField(blank=True, null=True)
     equipo = models.ForeignKey(Equipo, on_delete=models.SET_NULL, null=True, blank=True)
     pdf_ruta = models.CharField(max_length=255, blank=True, null=True, verbose_name="Ruta del PDF generado")
+    # Informe generado en segundo plano (laboratorio/utils/pdf_servicio.py)
+    estado_pdf = models.CharField(max_length=12, blank=True, default='', choices=[
+        ('', 'Sin generar'),
+        ('en_cola', 'En cola'),
+        ('generando', 'Generando'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    ], verbose_name="Estado del PDF")
+    pdf_generado = models.DateTimeField(null=True, blank=True, verbose_name="PDF generado el")
 
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
@@ -152,10 +161,8 @@ class Resultado(models.Model):
     verificado = models.BooleanField(default=False)
     orden_equipo = models.PositiveIntegerField(default=0, db_index=True)
 
-
-class Meta:
-    ordering = ['orden_examen', 'orden_equipo', 'id']
-
+    class Meta:
+        ordering = ['orden_examen', 'orden_equipo', 'id']
 
     def __str__(self):
         return f"{self.parametro} ({self.valor or ''})"
@@ -176,7 +183,6 @@ class Meta:
             self.fuera_de_rango = False
 
 
-
 class Muestra(models.Model):
     orden = models.ForeignKey(Orden, on_delete=models.CASCADE, related_name='muestras')
     codigo_barra = models.CharField(max_length=100, unique=True)
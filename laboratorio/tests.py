@@ -0,0 +1,209 @@
+import os
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from .models import Examen, Orden, OrdenExamen, Paciente, Resultado
+from .utils import graficas_pdf, pdf_cache, pdf_lote, pdf_servicio
+from .utils.cache_disco import CacheDisco
+
+
+class PdfServicioTests(TestCase):
+
+    def test_pedidos_de_una_orden_se_juntan(self):
+        paciente = Paciente.objects.create(documento_identidad="1", nombre_completo="X", sexo="M")
+        orden = Orden.objects.create(paciente=paciente, numero_orden="000123")
+        with mock.patch.object(pdf_servicio, "PROCESOS", 0), \
+                mock.patch.object(pdf_servicio, "_iniciar_despachador"), \
+                mock.patch("laboratorio.utils.pdf_informe.generar_pdf_para_orden", return_value="x.pdf") as generar:
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(3):
+                    pdf_servicio.solicitar(orden.id)
+            orden.refresh_from_db()
+            self.assertEqual((orden.estado_pdf, pdf_servicio.pendientes()), ("en_cola", 1))
+
+            self.assertEqual(pdf_servicio.drenar(), 1)
+        self.assertEqual(generar.call_count, 1)
+        orden.refresh_from_db()
+        self.assertEqual(orden.estado_pdf, "listo")
+        self.assertIsNotNone(orden.pdf_generado)
+        self.assertEqual(pdf_servicio.pendientes(), 0)
+
+
+class PdfCacheTests(TestCase):
+
+    def test_etag_y_304(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser("admin", "", "x"))
+        paciente = Paciente.objects.create(documento_identidad="1", nombre_completo="X", sexo="M")
+        orden = Orden.objects.create(paciente=paciente, numero_orden="000123")
+        examen = Examen.objects.create(codigo="GLU", nombre="GLUCOSA", area="BIOQUIMICA")
+        oe = OrdenExamen.objects.create(orden=orden, examen=examen)
+        resultado = Resultado.objects.create(orden_examen=oe, parametro="Glucosa", valor="90")
+        url = f"/ordenes/{orden.id}/imprimir/"
+
+        with tempfile.TemporaryDirectory() as directorio, \
+                mock.patch.object(pdf_cache, "CACHE_DIR", directorio), \
+                mock.patch("laboratorio.utils.pdf_informe.renderizar_informe", return_value=b"%PDF-1.4 prueba") as render:
+            r = self.client.get(url)
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(b"".join(r.streaming_content), b"%PDF-1.4 prueba")
+            etag = r["ETag"]
+
+            r = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(r.status_code, 304)
+            self.assertEqual(render.call_count, 1)
+
+            # Un resultado corregido cambia la huella: se genera de nuevo y se borra el anterior
+            resultado.valor = "95"
+            resultado.save()
+            r = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(r.status_code, 200)
+            self.assertNotEqual(r["ETag"], etag)
+            r.close()
+            self.assertEqual(render.call_count, 2)
+            self.assertEqual(len(os.listdir(directorio)), 1)
+
+            # Renombrar el examen cambia el título de su sección en el informe
+            etag = r["ETag"]
+            examen.nombre = "GLUCOSA BASAL"
+            examen.save()
+            r = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(r.status_code, 200)
+            r.close()
+            self.assertEqual(render.call_count, 3)
+
+
+class PdfLoteTests(SimpleTestCase):
+
+    def test_unir_pdfs_de_reportlab(self):
+        from reportlab.pdfgen import canvas
+
+        with tempfile.TemporaryDirectory() as directorio:
+            rutas = []
+            for i, paginas in enumerate((2, 1)):
+                rutas.append(os.path.join(directorio, f"{i}.pdf"))
+                c = canvas.Canvas(rutas[-1])
+                for p in range(paginas):
+                    c.setFont("Courier" if p else "Helvetica", 10)
+                    c.drawString(100, 100, f"informe {i} pagina {p}")
+                    c.showPage()
+                c.save()
+
+            unido = b"".join(pdf_lote.unir_pdfs(iter(rutas)))
+
+        objetos = pdf_lote._objetos(unido)
+        tipos = [pdf_lote._TIPO.search(d) for d, _ in objetos.values()]
+        self.assertEqual(sum(1 for t in tipos if t and t.group(1) == b"Page"), 3)
+        self.assertEqual(sum(1 for t in tipos if t and t.group(1) == b"Pages"), 1)
+        # Toda referencia apunta a un objeto de la salida
+        for diccionario, _ in objetos.values():
+            for ref in pdf_lote._REFERENCIA.findall(diccionario):
+                self.assertIn(int(ref), objetos)
+        self.assertIn(b"/Count 3", objetos[2][0])
+
+    def test_fallidos_en_pagina_final_y_referencia_rota(self):
+        from reportlab.pdfgen import canvas
+
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer)
+        c.drawString(100, 100, "informe")
+        c.showPage()
+        c.save()
+        informe = buffer.getvalue()
+
+        def informes(ids, procesos, progreso):
+            yield 1, "000001", informe
+            yield 2, None, None
+
+        with mock.patch.object(pdf_lote, "informes", informes):
+            unido = b"".join(pdf_lote.pdf_informes([1, 2]))
+        self.assertIn(b"/Count 2", pdf_lote._objetos(unido)[2][0])
+
+        roto = informe.replace(b"/F1 2 0 R", b"/F1 9 0 R")
+        with self.assertRaises(ValueError):
+            b"".join(pdf_lote.unir_pdfs([roto]))
+
+
+class CacheDiscoTests(SimpleTestCase):
+
+    def test_poda_los_de_acceso_mas_viejo(self):
+        cache = CacheDisco(1000, ".pdf")
+        with tempfile.TemporaryDirectory() as directorio:
+            with open(os.path.join(directorio, "otro.tmp"), "wb") as f:
+                f.write(b"x" * 5000)   # no cuenta: no termina en .pdf
+            for i in range(12):
+                ruta = os.path.join(directorio, f"{i}.pdf")
+                with open(ruta, "wb") as f:
+                    f.write(b"x" * 100)
+                os.utime(ruta, (i, i))
+                cache.anotar(directorio, 100)
+            restantes = sorted(int(n[:-4]) for n in os.listdir(directorio) if n.endswith(".pdf"))
+            self.assertTrue(os.path.exists(os.path.join(directorio, "otro.tmp")))
+        self.assertEqual(restantes, list(range(3, 12)))
+
+
+class GraficasPdfTests(SimpleTestCase):
+
+    def test_histograma_reducido_conserva_picos(self):
+        from reportlab.graphics.shapes import PolyLine
+
+        valores = [0] * 1000
+        valores[537] = 50
+        dibujo = graficas_pdf.histograma(valores, "RBC", 100, 90)
+        curva = next(s for s in dibujo.contents[0].contents if isinstance(s, PolyLine))
+        ys = curva.points[1::2]
+        self.assertEqual(len(ys), 100 * graficas_pdf.RESOLUCION)
+        self.assertAlmostEqual(max(ys), 90 - 6)
+        self.assertIsNone(graficas_pdf.histograma([5], "PLT", 100, 90))
+
+    def test_dispersion_un_trazo_por_color(self):
+        from reportlab.graphics.shapes import Path
+        from reportlab.lib import colors
+
+        puntos = [(x % 50, x // 50) for x in range(2500)] * 2   # repetidos: se dibujan una vez
+        dibujo = graficas_pdf.dispersion([(colors.red, puntos), (colors.blue, [(0, 0), (49, 49)])], "DIFF", 100, 90)
+        trazos = [s for s in dibujo.contents[0].contents if isinstance(s, Path)]
+        self.assertEqual(len(trazos), 2)
+        self.assertEqual(len(trazos[0].operators), 2 * 2500)
+        self.assertIsNone(graficas_pdf.dispersion([(colors.red, [])], "BASO", 100, 90))
+
+
+class InformePaginacionTests(TestCase):
+
+    def test_paginas_x_de_y(self):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+        from laboratorio.views_informe import MARGEN_INFERIOR, InformeCanvas
+
+        paciente = Paciente.objects.create(documento_identidad="1", nombre_completo="X", sexo="M")
+        orden = Orden.objects.create(paciente=paciente, numero_orden="000321")
+        for i, area in enumerate(("BIOQUIMICA", "INMUNOLOGIA")):
+            examen = Examen.objects.create(codigo=f"E{i}", nombre=f"EXAMEN {i}", area=area)
+            oe = OrdenExamen.objects.create(orden=orden, examen=examen)
+            Resultado.objects.bulk_create([
+                Resultado(orden_examen=oe, parametro=f"P{j}", valor="1", observacion="larga " * 40 if j == 3 else "")
+                for j in range(60)
+            ])
+        orden = Orden.objects.select_related("paciente").get(id=orden.id)
+
+        informe = InformeCanvas(canvas.Canvas(BytesIO(), pagesize=A4), orden)
+        paginas = informe._paginar(informe._bloques())
+        self.assertGreater(len(paginas), 2)
+        for pagina in paginas:
+            bloque, y = pagina[-1]
+            if bloque.requerido is not None:
+                self.assertGreaterEqual(y - bloque.requerido, MARGEN_INFERIOR)
+        # La observación larga se parte en varias líneas dentro del ancho de la página
+        partes = informe._partir("Obs.: " + "larga " * 40)
+        self.assertGreater(len(partes), 1)
+
+        buffer = BytesIO()
+        InformeCanvas(canvas.Canvas(buffer, pagesize=A4, pageCompression=0), orden).generate_report()
+        pdf = buffer.getvalue()
+        total = len(paginas)
+        self.assertEqual(pdf.count(b"/Type /Page\n"), total)
+        self.assertIn(f"gina 1 de {total})".encode(), pdf)
+        self.assertIn(f"gina {total} de {total})".encode(), pdf)
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from . import views
 from .views_informe import imprimir_informe   # ✅ IMPORTE CORRECTO Y FINAL
+from .views_informe import exportar_informes, exportar_informes_progreso
 
 
 urlpatterns = [
@@ -11,6 +12,8 @@ urlpatterns = [
     path('informe_resultados/<int:orden_id>/pdf/', views.informe_resultados_pdf, name='informe_resultados_pdf'),
     path('ordenes/<int:orden_id>/imprimir/', imprimir_informe, name='imprimir_informe'),
     path('ordenes/<int:orden_id>/pdf/', imprimir_informe, name='orden_pdf'),
+    path('ordenes/informes/lote/', exportar_informes, name='exportar_informes'),
+    path('ordenes/informes/lote/progreso/', exportar_informes_progreso, name='exportar_informes_progreso'),
 
     # -----------------------------
     # Órdenes
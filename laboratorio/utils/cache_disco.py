@@ -0,0 +1,55 @@
+"""
+Caché en un directorio con tope de tamaño, podado por último acceso.
+
+Lo usan el caché de imágenes HL7 (configuracion/imagenes_hl7.py) y el de
+informes PDF (pdf_cache.py): quien escribe un archivo llama a anotar() con
+su tamaño y, al pasar `maximo` bytes, se borran los archivos de mtime más
+viejo (quien lee uno le hace os.utime) hasta bajar al 80%. El tamaño se
+lleva en memoria; se mide recorriendo el directorio la primera vez en cada
+proceso y en cada poda.
+"""
+
+import os
+import threading
+
+
+class CacheDisco:
+
+    def __init__(self, maximo, sufijo=""):
+        self.maximo = maximo
+        self.sufijo = sufijo   # solo cuentan (y se borran) los archivos con este final
+        self._lock = threading.Lock()
+        self._bytes = None     # tamaño aproximado (None = sin medir todavía)
+
+    def podar(self, directorio):
+        """Borra los archivos de acceso más viejo hasta bajar al 80% del máximo."""
+        archivos = []
+        total = 0
+        for entrada in os.scandir(directorio):
+            if entrada.is_file() and entrada.name.endswith(self.sufijo):
+                st = entrada.stat()
+                archivos.append((st.st_mtime, st.st_size, entrada.path))
+                total += st.st_size
+
+        if total > self.maximo:
+            archivos.sort()
+            objetivo = self.maximo * 0.8
+            for _, tamano, ruta in archivos:
+                if total <= objetivo:
+                    break
+                try:
+                    os.remove(ruta)
+                    total -= tamano
+                except OSError:
+                    pass
+        self._bytes = total
+
+    def anotar(self, directorio, tamano):
+        """Cuenta un archivo nuevo de `tamano` bytes ya escrito en el directorio."""
+        with self._lock:
+            if self._bytes is None:
+                self.podar(directorio)  # primera vez en este proceso: medir (ya incluye el nuevo)
+                return
+            self._bytes += tamano
+            if self._bytes > self.maximo:
+                self.podar(directorio)
@@ -0,0 +1,150 @@
+"""
+Gráficas de Hematología del informe (histogramas RBC / PLT y dispersión
+DIFF / BASO) como dibujos vectoriales de ReportLab, sin matplotlib.
+
+`histograma()` y `dispersion()` devuelven un Drawing; `dibujar(c, dibujo, x, y)`
+lo pone en un canvas con la esquina de los ejes en (x, y) y `svg_base64(dibujo)`
+lo da como SVG para las plantillas HTML. El título y las escalas caen fuera
+del área de los ejes, dentro de un margen de MARGEN puntos.
+
+Antes de dibujar, los datos se reducen con NumPy a la resolución de salida
+(RESOLUCION muestras por punto): el histograma al máximo de cada columna, para
+no perder picos, y la dispersión a los puntos distintos de esa grilla. Los
+puntos de cada color van en un solo trazo (segmentos de largo cero con punta
+redonda) en lugar de un círculo cada uno.
+"""
+
+import base64
+
+import numpy as np
+from reportlab.graphics import renderPDF, renderSVG
+from reportlab.graphics.shapes import Drawing, Group, Line, Path, PolyLine, String
+from reportlab.lib import colors
+
+
+RESOLUCION = 2
+MARGEN = 12
+
+COLOR_EJES = colors.Color(0.2, 0.2, 0.2)
+COLOR_CURVA = colors.Color(0, 0.8, 1)
+COLOR_PUNTOS = colors.Color(0, 0.7, 1)
+
+# Escala del eje X por tipo: (máximo, ticks, líneas punteadas)
+ESCALAS = {
+    "RBC": (300.0, (0, 100, 200), (100, 300)),
+    "PLT": (40.0, (0, 10, 20, 30), (10, 30)),
+}
+
+
+def _lienzo(ancho, alto):
+    """Drawing con margen alrededor y el grupo donde se dibuja con origen en los ejes."""
+    dibujo = Drawing(ancho + 2 * MARGEN, alto + 2 * MARGEN)
+    grupo = Group(transform=(1, 0, 0, 1, MARGEN, MARGEN))
+    dibujo.add(grupo)
+    return dibujo, grupo
+
+
+def _ejes(grupo, ancho, alto):
+    """Ejes tipo "L"."""
+    grupo.add(Line(0, 0, 0, alto, strokeColor=COLOR_EJES, strokeWidth=0.7))
+    grupo.add(Line(0, 0, ancho, 0, strokeColor=COLOR_EJES, strokeWidth=0.7))
+
+
+def _titulo(grupo, ancho, alto, etiqueta):
+    grupo.add(String(ancho / 2.0, alto + 4, etiqueta, fontName="Helvetica-Bold",
+                     fontSize=9, fillColor=colors.black, textAnchor="middle"))
+
+
+def _reducir(valores, columnas):
+    """(posiciones, valores): a lo sumo `columnas` muestras, el máximo de cada tramo."""
+    n = len(valores)
+    if n <= columnas:
+        return np.arange(n, dtype=float), valores
+    bordes = np.unique(np.linspace(0, n, columnas + 1).astype(int))[:-1]
+    fines = np.append(bordes[1:], n)
+    return (bordes + fines - 1) / 2.0, np.maximum.reduceat(valores, bordes)
+
+
+def histograma(valores, etiqueta, ancho, alto, color=COLOR_CURVA):
+    """Histograma estilo equipo; None si hay menos de dos valores."""
+    valores = np.asarray(valores, dtype=float)
+    n = len(valores)
+    if n < 2:
+        return None
+    maximo = valores.max()
+    if maximo <= 0:
+        maximo = 1.0
+
+    dibujo, grupo = _lienzo(ancho, alto)
+
+    # Curva principal
+    posiciones, alturas = _reducir(valores, int(ancho * RESOLUCION))
+    xs = posiciones * (ancho / (n - 1))
+    ys = alturas / maximo * (alto - 6)
+    grupo.add(PolyLine(np.column_stack((xs, ys)).ravel().tolist(),
+                       strokeColor=color, strokeWidth=1, strokeLineJoin=1))
+
+    _ejes(grupo, ancho, alto)
+
+    # Escalas específicas (RBC / PLT en fL)
+    x_max, ticks, punteadas = ESCALAS.get(etiqueta, (float(n - 1), None, ()))
+    if ticks is None:
+        ticks = (0, int(x_max / 2), int(x_max))
+    for val in punteadas:
+        px = val / x_max * ancho
+        grupo.add(Line(px, 0, px, alto, strokeColor=COLOR_EJES, strokeWidth=0.7, strokeDashArray=(1, 2)))
+    for val in ticks:
+        px = val / x_max * ancho
+        grupo.add(Line(px, 0, px, 3, strokeColor=COLOR_EJES, strokeWidth=0.5))
+        grupo.add(String(px, -8, str(val), fontName="Helvetica", fontSize=6,
+                         fillColor=colors.black, textAnchor="middle"))
+    if etiqueta in ESCALAS:
+        grupo.add(String(ancho, -8, "fL", fontName="Helvetica", fontSize=7,
+                         fillColor=colors.black, textAnchor="end"))
+
+    _titulo(grupo, ancho, alto, etiqueta)
+    return dibujo
+
+
+def dispersion(grupos, etiqueta, ancho, alto):
+    """
+    Dispersión DIFF / BASO. grupos: [(Color, [(x, y), ...]), ...]; la escala
+    es común a todos. None si no hay puntos.
+    """
+    grupos = [(color, np.asarray(puntos, dtype=float).reshape(-1, 2)) for color, puntos in grupos]
+    todos = [p for _, p in grupos if len(p)]
+    if not todos:
+        return None
+    todos = np.concatenate(todos)
+    minimo, maximo = todos.min(axis=0), todos.max(axis=0)
+    rango = np.where(maximo > minimo, maximo - minimo, 1.0)
+    escala = np.array((ancho - 4, alto - 4)) / rango
+
+    dibujo, grupo = _lienzo(ancho, alto)
+
+    # Puntos: un trazo por color; los que caen en el mismo lugar se dibujan una vez
+    for color, puntos in grupos:
+        if not len(puntos):
+            continue
+        coordenadas = (puntos - minimo) * escala + 2
+        coordenadas = np.unique(np.round(coordenadas * RESOLUCION), axis=0) / RESOLUCION
+        segmentos = np.repeat(coordenadas, 2, axis=0).ravel().tolist()
+        grupo.add(Path(segmentos, [0, 1] * len(coordenadas), strokeColor=color or COLOR_PUNTOS,
+                       strokeWidth=1.4, strokeLineCap=1, fillColor=None))
+
+    _ejes(grupo, ancho, alto)
+    grupo.add(String(2, alto + 4, "LAS", fontName="Helvetica-Bold", fontSize=7, fillColor=colors.black))
+    grupo.add(String(ancho, -8, "MAS", fontName="Helvetica-Bold", fontSize=7,
+                     fillColor=colors.black, textAnchor="end"))
+    _titulo(grupo, ancho, alto, etiqueta)
+    return dibujo
+
+
+def dibujar(c, dibujo, x, y):
+    """Dibuja en el canvas con la esquina de los ejes en (x, y)."""
+    renderPDF.draw(dibujo, c, x - MARGEN, y - MARGEN)
+
+
+def svg_base64(dibujo):
+    """El dibujo como SVG en base64 (para <img src="data:image/svg+xml;base64,...">)."""
+    return base64.b64encode(renderSVG.drawToString(dibujo).encode("utf-8")).decode("ascii")
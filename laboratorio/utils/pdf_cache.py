@@ -0,0 +1,111 @@
+"""
+Caché en disco de los informes PDF (InformeCanvas).
+
+Cada informe se guarda como `<orden_id>-<huella>.pdf` en INFORME_CACHE_DIR. La
+huella resume todo lo que cambia el informe: la orden y el paciente, sus
+exámenes (y el nombre y área de cada Examen, que dan los títulos y la
+agrupación), el último Resultado modificado y cuántos hay validados, las
+gráficas de los equipos y VERSION (subirla al cambiar el diseño del informe). Si algo cambia, cambia el nombre y el informe se genera
+de nuevo; el archivo anterior de la orden se borra.
+
+La huella también es el ETag de imprimir_informe: el navegador revalida y,
+si no cambió nada, recibe un 304 sin que se genere ni se lea el PDF.
+
+El caché se poda por último acceso al pasar INFORME_CACHE_MAX bytes.
+"""
+
+import glob
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .cache_disco import CacheDisco
+
+
+VERSION = 3
+
+CACHE_DIR = getattr(settings, "INFORME_CACHE_DIR", None)
+CACHE_MAX = getattr(settings, "INFORME_CACHE_MAX", 512 * 1024 * 1024)
+
+_CACHE = CacheDisco(CACHE_MAX, ".pdf")
+
+
+def _directorio():
+    return str(CACHE_DIR or os.path.join(settings.MEDIA_ROOT, "informes_cache"))
+
+
+class Huella:
+    __slots__ = ("etag", "modificado")
+
+    def __init__(self, etag, modificado):
+        self.etag = etag
+        self.modificado = modificado
+
+
+def huella(orden):
+    """Huella del informe de la orden (con orden.paciente ya cargado)."""
+    from configuracion.models import HL7Grafica
+    from laboratorio.models import OrdenExamen, Resultado
+
+    resultados = Resultado.objects.filter(orden_examen__orden_id=orden.id).aggregate(
+        modificado=Max("modificado"), total=Count("id"), validados=Count("id", filter=Q(validado=True)),
+    )
+    examenes = OrdenExamen.objects.filter(orden_id=orden.id).aggregate(
+        modificado=Max("actualizado_en"), total=Count("id"), examen=Max("examen__actualizado_en"),
+    )
+    grafica = HL7Grafica.objects.filter(orden_id=orden.id).aggregate(ultima=Max("id"))["ultima"]
+
+    paciente = orden.paciente
+    edad = None
+    if paciente.fecha_nacimiento:
+        # El informe muestra la edad al día de hoy
+        hoy, nacimiento = timezone.now().date(), paciente.fecha_nacimiento
+        edad = hoy.year - nacimiento.year - ((hoy.month, hoy.day) < (nacimiento.month, nacimiento.day))
+
+    partes = (
+        VERSION, orden.id, orden.estado, orden.actualizado_en, paciente.actualizado_en, edad,
+        resultados["modificado"], resultados["total"], resultados["validados"],
+        examenes["modificado"], examenes["total"], examenes["examen"], grafica,
+    )
+    etag = hashlib.sha1("|".join(map(str, partes)).encode()).hexdigest()[:20]
+    fechas = [f for f in (orden.actualizado_en, paciente.actualizado_en, resultados["modificado"],
+                          examenes["modificado"], examenes["examen"]) if f]
+    return Huella(etag, max(fechas) if fechas else None)
+
+
+def obtener(orden, firma=None):
+    """
+    Ruta del PDF de la orden al día (generado ahora si no estaba) y su huella.
+    firma: la huella ya calculada (imprimir_informe la calcula para el ETag).
+    """
+    from laboratorio.utils.pdf_informe import renderizar_informe
+
+    firma = firma or huella(orden)
+    directorio = _directorio()
+    ruta = os.path.join(directorio, f"{orden.id}-{firma.etag}.pdf")
+    try:
+        os.utime(ruta)  # acceso reciente: lo último en podarse
+        return ruta, firma
+    except FileNotFoundError:
+        pass
+
+    datos = renderizar_informe(orden)
+    os.makedirs(directorio, exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(datos)
+    os.replace(temporal, ruta)
+
+    # Versiones anteriores del informe de la orden
+    for vieja in glob.glob(os.path.join(directorio, f"{orden.id}-*.pdf")):
+        if vieja != ruta:
+            try:
+                os.remove(vieja)
+            except OSError:
+                pass
+    _CACHE.anotar(directorio, len(datos))
+    return ruta, firma
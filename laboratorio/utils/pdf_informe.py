@@ -15,6 +15,14 @@ from reportlab.lib import colors
 from laboratorio.views_informe import InformeCanvas
 
 
+def renderizar_informe(orden):
+    """Bytes del informe PDF de la orden (sin caché; ver pdf_cache.obtener)."""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    InformeCanvas(c, orden).generate_report()
+    return buffer.getvalue()
+
+
 def generar_pdf_para_orden(orden, guardar=True, retorno_bytes=False):
     """
     Genera un informe PDF para una orden específica.
@@ -30,17 +38,11 @@ def generar_pdf_para_orden(orden, guardar=True, retorno_bytes=False):
         None si hay error
     """
     try:
-        # Crear buffer para el PDF
-        buffer = io.BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        
-        # Usar la clase InformeCanvas existente
-        report_generator = InformeCanvas(c, orden)
-        report_generator.generate_report()
-        
-        # Obtener los bytes del PDF
-        pdf_bytes = buffer.getvalue()
-        buffer.close()
+        # Del caché de informes (se genera con InformeCanvas si la orden cambió)
+        from laboratorio.utils import pdf_cache
+        ruta_cache, _ = pdf_cache.obtener(orden)
+        with open(ruta_cache, 'rb') as f:
+            pdf_bytes = f.read()
         
         if retorno_bytes:
             return pdf_bytes
@@ -55,8 +57,11 @@ def generar_pdf_para_orden(orden, guardar=True, retorno_bytes=False):
             filename = f"{numero_orden}.pdf"
             filepath = os.path.join(informes_dir, filename)
             
-            with open(filepath, 'wb') as f:
+            # Se reemplaza de una vez: quien lo esté leyendo no ve un PDF a medias
+            temporal = f"{filepath}.{os.getpid()}.tmp"
+            with open(temporal, 'wb') as f:
                 f.write(pdf_bytes)
+            os.replace(temporal, filepath)
             
             # Actualizar campo pdf_ruta en la orden si existe
             try:
@@ -0,0 +1,365 @@
+"""
+Exportación de informes por lote: muchas órdenes en un ZIP o en un solo PDF.
+
+Los informes se generan en un pool de procesos (INFORME_LOTE_PROCESOS, por
+defecto uno por núcleo) a través del caché de pdf_cache, así que los que no
+cambiaron no se vuelven a dibujar. La salida se arma y se entrega por partes
+en el orden de las órdenes, con a lo sumo unos pocos informes por delante:
+ni el ZIP ni el PDF unido se guardan enteros en memoria.
+
+El PDF unido se arma copiando los objetos de cada informe con otra numeración
+(no hay biblioteca para unir PDFs entre las dependencias). Solo entiende lo que
+escribe ReportLab: tabla xref clásica, sin flujos de objetos ni cifrado.
+
+Los informes que no se pudieron generar no se omiten en silencio: van en
+errores.txt dentro del ZIP y en una página final del PDF unido.
+
+El avance (listos / fallidos / total) se informa con un callback; la vista
+lo deja en PROGRESO para que la página lo consulte mientras descarga.
+"""
+
+import io
+import multiprocessing
+import os
+import re
+import threading
+import time
+import traceback
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .pdf_servicio import _iniciar_proceso
+
+
+PROCESOS = getattr(settings, "INFORME_LOTE_PROCESOS", None)  # None = núcleos de la máquina
+MAXIMO = getattr(settings, "INFORME_LOTE_MAXIMO", 2000)      # tope de órdenes por pedido web
+BLOQUE = 256 * 1024
+
+_LOCK = threading.Lock()
+PROGRESO = {}   # token -> Progreso de las exportaciones web en curso o recientes
+
+
+class Progreso:
+    __slots__ = ("total", "listos", "fallidos", "inicio", "terminado")
+
+    def __init__(self, total):
+        self.total = total
+        self.listos = 0
+        self.fallidos = 0
+        self.inicio = time.monotonic()
+        self.terminado = False
+
+    def como_dict(self):
+        return {
+            "total": self.total,
+            "listos": self.listos,
+            "fallidos": self.fallidos,
+            "segundos": round(time.monotonic() - self.inicio, 1),
+            "terminado": self.terminado,
+        }
+
+
+def registrar_progreso(token, progreso):
+    """Deja el avance de una exportación web a la vista (se guardan los últimos 50)."""
+    with _LOCK:
+        PROGRESO[token] = progreso
+        while len(PROGRESO) > 50:
+            del PROGRESO[next(iter(PROGRESO))]
+
+
+# ------------------------------
+# SELECCIÓN
+# ------------------------------
+
+def ordenes(desde=None, hasta=None, medico=None, paciente=None, ids=None, todas=False):
+    """Ids de las órdenes a exportar, por fecha. Por defecto solo las validadas."""
+    from laboratorio.models import Orden
+
+    qs = Orden.objects.all()
+    if ids:
+        qs = qs.filter(id__in=ids)
+    if desde:
+        qs = qs.filter(fecha__date__gte=desde)
+    if hasta:
+        qs = qs.filter(fecha__date__lte=hasta)
+    if medico:
+        qs = qs.filter(medico__icontains=medico)
+    if paciente:
+        qs = qs.filter(paciente__documento_identidad=paciente)
+    if not todas:
+        qs = qs.filter(estado="Validado")
+    return list(qs.order_by("fecha", "id").values_list("id", flat=True))
+
+
+# ------------------------------
+# GENERACIÓN
+# ------------------------------
+
+def _informe(orden_id):
+    """En el proceso hijo: (numero_orden, ruta del PDF en el caché)."""
+    from laboratorio.models import Orden
+    from laboratorio.utils import pdf_cache
+
+    orden = Orden.objects.select_related("paciente").get(id=orden_id)
+    ruta, _ = pdf_cache.obtener(orden)
+    return orden.numero_orden, ruta
+
+
+def informes(ids, procesos=None, progreso=None):
+    """
+    Genera los informes en paralelo y los entrega en el orden de `ids`:
+    (orden_id, numero_orden, ruta); ruta es None si el informe falló.
+    progreso: callable que recibe el Progreso después de cada informe.
+    """
+    estado = Progreso(len(ids))
+    procesos = procesos or PROCESOS or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(
+        max_workers=procesos,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_iniciar_proceso,
+        initargs=(settings.SETTINGS_MODULE,),
+    )
+    pendientes = deque()
+    siguientes = iter(ids)
+    try:
+        while True:
+            # Unos pocos por delante: el pool no se queda sin trabajo y la salida no se acumula
+            while len(pendientes) < procesos * 2:
+                orden_id = next(siguientes, None)
+                if orden_id is None:
+                    break
+                pendientes.append((orden_id, pool.submit(_informe, orden_id)))
+            if not pendientes:
+                break
+
+            orden_id, futuro = pendientes.popleft()
+            try:
+                numero, ruta = futuro.result()
+                estado.listos += 1
+            except Exception:
+                print(f"PDF lote: no se pudo generar el informe de la orden {orden_id}")
+                traceback.print_exc()
+                numero, ruta = None, None
+                estado.fallidos += 1
+            if progreso:
+                progreso(estado)
+            yield orden_id, numero, ruta
+    finally:
+        # También si el cliente cortó la descarga (el generador se cierra a medias)
+        pool.shutdown(wait=False, cancel_futures=True)
+        estado.terminado = True
+        if progreso:
+            progreso(estado)
+
+
+# ------------------------------
+# ZIP
+# ------------------------------
+
+class _Salida:
+    """Archivo de solo escritura para zipfile: acumula lo escrito hasta que se retire."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        datos, self.partes = b"".join(self.partes), []
+        return datos
+
+
+def _error(orden_id):
+    return f"Orden {orden_id}: no se pudo generar el informe"
+
+
+def zip_informes(ids, procesos=None, progreso=None):
+    """Bytes de un ZIP con un PDF por orden, por partes. Los informes fallidos van en errores.txt."""
+    salida = _Salida()
+    errores = []
+    # Sin compresión: los PDF de ReportLab ya van comprimidos
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_STORED) as zf:
+        for orden_id, numero, ruta in informes(ids, procesos, progreso):
+            if ruta is None:
+                errores.append(_error(orden_id))
+                continue
+            with open(ruta, "rb") as origen, zf.open(f"informe_{numero}.pdf", "w") as destino:
+                while True:
+                    bloque = origen.read(BLOQUE)
+                    if not bloque:
+                        break
+                    destino.write(bloque)
+                    yield salida.retirar()
+        if errores:
+            zf.writestr("errores.txt", "\n".join(errores) + "\n")
+    yield salida.retirar()
+
+
+# ------------------------------
+# PDF UNIDO
+# ------------------------------
+
+_XREF = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+_SUBSECCION = re.compile(rb"(\d+) (\d+)\s*$")
+_CABECERA = re.compile(rb"\d+ \d+ obj\s*")
+_REFERENCIA = re.compile(rb"(\d+) 0 R\b")
+_LARGO = re.compile(rb"/Length (\d+)")
+_TIPO = re.compile(rb"/Type\s*/(Pages|Page|Catalog)\b")
+_INFO = re.compile(rb"/Info (\d+) 0 R")
+
+
+def _objetos(datos):
+    """
+    {numero: (diccionario, resto)} de un PDF de ReportLab, sin el objeto /Info
+    (autor, fechas); resto = stream ... endstream.
+    """
+    inicio = datos.rindex(b"startxref")
+    posicion = int(datos[inicio + 9:].split()[0])
+    trailer = datos.index(b"trailer", posicion)
+    lineas = datos[posicion:trailer].splitlines()[1:]
+    info = _INFO.search(datos, trailer)
+
+    desplazamientos = {}
+    numero = 0
+    for linea in lineas:
+        entrada = _XREF.match(linea)
+        if entrada:
+            if entrada.group(3) == b"n":
+                desplazamientos[numero] = int(entrada.group(1))
+            numero += 1
+        elif _SUBSECCION.match(linea):
+            numero = int(_SUBSECCION.match(linea).group(1))
+    if info:
+        desplazamientos.pop(int(info.group(1)), None)
+
+    objetos = {}
+    for numero, desde in desplazamientos.items():
+        cuerpo = _CABECERA.match(datos, desde).end()
+        fin = datos.index(b"endobj", cuerpo)
+        stream = datos.find(b"stream", cuerpo, fin)
+        if stream == -1:
+            objetos[numero] = (datos[cuerpo:fin], b"")
+            continue
+        # Los datos del stream pueden contener "endobj": se saltan por /Length
+        largo = int(_LARGO.search(datos, cuerpo, stream).group(1))
+        salto = 8 if datos[stream + 6:stream + 8] == b"\r\n" else 7
+        fin = datos.index(b"endobj", stream + salto + largo)
+        objetos[numero] = (datos[cuerpo:stream], datos[stream:fin])
+    return objetos
+
+
+def unir_pdfs(rutas):
+    """
+    Un solo PDF con las páginas de los PDF de `rutas` (un iterable de rutas o
+    de bytes de un PDF: se lee uno a la vez), por partes. Los objetos 1-2 son
+    el catálogo y el árbol de páginas nuevos; se escriben al final, cuando ya
+    se conocen todas las páginas. Una referencia a un objeto que no está en
+    el PDF es un ValueError: el resultado saldría roto.
+    """
+    posicion = 0
+    desplazamientos = {}   # número nuevo -> posición en la salida
+    paginas = []
+    siguiente = 3
+
+    cabecera = b"%PDF-1.4\n%\x93\x8c\x8b\x9e\n"
+    yield cabecera
+    posicion += len(cabecera)
+
+    for ruta in rutas:
+        if isinstance(ruta, bytes):
+            objetos = _objetos(ruta)
+        else:
+            with open(ruta, "rb") as f:
+                objetos = _objetos(f.read())
+
+        # Sin el catálogo ni el árbol de páginas del informe; las páginas cuelgan del nuevo
+        tipos = {}
+        for numero, (diccionario, _) in objetos.items():
+            tipo = _TIPO.search(diccionario)
+            tipos[numero] = tipo.group(1).decode() if tipo else None
+        nuevos = {}
+        for numero in sorted(objetos):
+            if tipos[numero] not in ("Pages", "Catalog"):
+                nuevos[numero] = siguiente
+                siguiente += 1
+
+        def renumerar(m):
+            numero = int(m.group(1))
+            if tipos.get(numero) == "Pages":
+                return b"2 0 R"
+            if numero not in nuevos:
+                raise ValueError(f"PDF lote: referencia al objeto {numero}, que no está en el PDF")
+            return b"%d 0 R" % nuevos[numero]
+
+        for numero, nuevo in nuevos.items():
+            diccionario, resto = objetos[numero]
+            if tipos[numero] == "Page":
+                paginas.append(nuevo)
+            trozo = b"%d 0 obj\n%s%sendobj\n" % (nuevo, _REFERENCIA.sub(renumerar, diccionario), resto)
+            desplazamientos[nuevo] = posicion
+            posicion += len(trozo)
+            yield trozo
+
+    hijos = b" ".join(b"%d 0 R" % p for p in paginas)
+    for numero, trozo in (
+        (1, b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"),
+        (2, b"2 0 obj\n<< /Type /Pages /Count %d /Kids [ %s ] >>\nendobj\n" % (len(paginas), hijos)),
+    ):
+        desplazamientos[numero] = posicion
+        posicion += len(trozo)
+        yield trozo
+
+    tabla = [b"xref\n0 %d\n0000000000 65535 f \n" % siguiente]
+    tabla += [b"%010d 00000 n \n" % desplazamientos[n] for n in range(1, siguiente)]
+    tabla.append(b"trailer\n<< /Root 1 0 R /Size %d >>\nstartxref\n%d\n%%%%EOF\n" % (siguiente, posicion))
+    yield b"".join(tabla)
+
+
+def pagina_errores(errores):
+    """Bytes de un PDF con la lista de informes que no se pudieron generar."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    _, alto = A4
+    y = alto
+    for i, linea in enumerate(errores):
+        if i % 60 == 0:
+            if i:
+                c.showPage()
+            c.setFont("Helvetica-Bold", 12)
+            c.drawString(50, alto - 60, "Informes que no se pudieron generar")
+            c.setFont("Helvetica", 9)
+            y = alto - 90
+        c.drawString(50, y, linea)
+        y -= 12
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def pdf_informes(ids, procesos=None, progreso=None):
+    """
+    Bytes de un solo PDF con los informes de las órdenes, por partes. Si
+    alguno falló, al final va una página con la lista.
+    """
+    def rutas():
+        errores = []
+        for orden_id, _, ruta in informes(ids, procesos, progreso):
+            if ruta is None:
+                errores.append(_error(orden_id))
+            else:
+                yield ruta
+        if errores:
+            yield pagina_errores(errores)
+
+    return unir_pdfs(rutas())
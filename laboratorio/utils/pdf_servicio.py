@@ -0,0 +1,238 @@
+"""
+Generación de los informes PDF en segundo plano.
+
+El listener (y quien necesite el PDF al día) llama a `solicitar(orden_id)` en
+lugar de generar el informe en su hilo. Los pedidos de una misma orden se
+juntan: el PDF se genera INFORME_PDF_ESPERA segundos después del último pedido
+(como mucho 5 ventanas después del primero), así tres ORU seguidos de una
+orden dan un solo informe, el del final. Un pedido que llega mientras la orden
+se está generando la deja en cola para una pasada más.
+
+Los informes se dibujan en un pool de procesos (ReportLab ocupa
+la CPU y retiene el GIL); INFORME_PDF_PROCESOS = 0 los genera en el hilo del
+despachador. El estado queda en Orden.estado_pdf: en_cola -> generando ->
+listo / error. Los pedidos viven en memoria: al arrancar el listener,
+`recuperar_pendientes()` vuelve a pedir los que quedaron en_cola o generando.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+
+PROCESOS = getattr(settings, "INFORME_PDF_PROCESOS", 2)
+ESPERA = getattr(settings, "INFORME_PDF_ESPERA", 2.0)
+VENTANAS_MAXIMAS = 5
+
+_COND = threading.Condition()
+_VENCE = {}        # orden_id -> time.monotonic() en que se genera (se corre con cada pedido)
+_LIMITE = {}       # orden_id -> a más tardar (desde el primer pedido)
+_EN_CURSO = set()
+_TERMINADOS = []   # (orden_id, ok, segundos)
+_DESPACHADOR = None
+_POOL = None
+
+
+# ------------------------------
+# PROCESO HIJO
+# ------------------------------
+
+def _iniciar_proceso(modulo_settings):
+    # spawn: el hijo arranca sin Django configurado
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", modulo_settings)
+    import django
+    django.setup()
+
+
+def _renderizar(orden_id):
+    """Genera y guarda el informe de la orden. Devuelve (ok, segundos)."""
+    from laboratorio.models import Orden
+    from laboratorio.utils.pdf_informe import generar_pdf_para_orden
+
+    t0 = time.perf_counter()
+    orden = Orden.objects.select_related("paciente").filter(id=orden_id).first()
+    ok = orden is not None and generar_pdf_para_orden(orden, guardar=True) is not None
+    return ok, time.perf_counter() - t0
+
+
+# ------------------------------
+# PEDIDOS
+# ------------------------------
+
+def _marcar(orden_id, estado, **campos):
+    from laboratorio.models import Orden
+    Orden.objects.filter(id=orden_id).update(estado_pdf=estado, **campos)
+
+
+def solicitar(orden_id):
+    """Pide (o posterga) el informe de la orden; se genera al confirmarse la transacción."""
+    def encolar():
+        _marcar(orden_id, "en_cola")
+        ahora = time.monotonic()
+        with _COND:
+            _VENCE[orden_id] = ahora + ESPERA
+            _LIMITE.setdefault(orden_id, ahora + ESPERA * VENTANAS_MAXIMAS)
+            _iniciar_despachador()
+            _COND.notify()
+
+    transaction.on_commit(encolar)
+
+
+def recuperar_pendientes():
+    """Vuelve a pedir los informes que quedaron a medio camino (proceso caído)."""
+    from laboratorio.models import Orden
+
+    ids = list(Orden.objects.filter(estado_pdf__in=("en_cola", "generando")).values_list("id", flat=True))
+    for orden_id in ids:
+        solicitar(orden_id)
+    return len(ids)
+
+
+def pendientes():
+    """Órdenes esperando o generándose en este proceso."""
+    with _COND:
+        return len(_VENCE) + len(_EN_CURSO - _VENCE.keys())
+
+
+# ------------------------------
+# DESPACHADOR
+# ------------------------------
+
+def _pool():
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(
+            max_workers=PROCESOS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_iniciar_proceso,
+            initargs=(settings.SETTINGS_MODULE,),
+        )
+    return _POOL
+
+
+def _enviar(orden_id):
+    """Futuro con (ok, segundos) del informe."""
+    global _POOL
+    if PROCESOS <= 0:
+        futuro = Future()
+        try:
+            futuro.set_result(_renderizar(orden_id))
+        except Exception as e:
+            futuro.set_exception(e)
+        return futuro
+    try:
+        return _pool().submit(_renderizar, orden_id)
+    except BrokenProcessPool:
+        # Un hijo murió (memoria, señal): el pool se descarta y se arma otro
+        _POOL = None
+        return _pool().submit(_renderizar, orden_id)
+
+
+def _al_terminar(orden_id, futuro):
+    try:
+        ok, segundos = futuro.result()
+    except Exception:
+        traceback.print_exc()
+        ok, segundos = False, 0.0
+    with _COND:
+        _TERMINADOS.append((orden_id, ok, segundos))
+        _COND.notify()
+
+
+def _cerrar_terminados(terminados):
+    from configuracion import metricas_hl7
+
+    for orden_id, ok, segundos in terminados:
+        with _COND:
+            _EN_CURSO.discard(orden_id)
+            repetir = orden_id in _VENCE
+        if ok:
+            metricas_hl7.observar("pdf", segundos)
+        if repetir:
+            continue  # llegó otro pedido mientras se generaba: sigue en_cola
+        if ok:
+            _marcar(orden_id, "listo", pdf_generado=timezone.now())
+        else:
+            print(f"PDF: no se pudo generar el informe de la orden {orden_id}")
+            _marcar(orden_id, "error")
+
+
+def _tomar_vencidos(ahora):
+    """Con _COND tomado: saca los pedidos cuya espera terminó (y que no se estén generando)."""
+    vencidos = [
+        orden_id for orden_id, vence in _VENCE.items()
+        if orden_id not in _EN_CURSO and min(vence, _LIMITE[orden_id]) <= ahora
+    ]
+    for orden_id in vencidos:
+        del _VENCE[orden_id], _LIMITE[orden_id]
+        _EN_CURSO.add(orden_id)
+    return vencidos
+
+
+def _despachar():
+    while True:
+        try:
+            with _COND:
+                while True:
+                    ahora = time.monotonic()
+                    vencidos = _tomar_vencidos(ahora)
+                    if vencidos or _TERMINADOS:
+                        break
+                    proximo = min(
+                        (min(v, _LIMITE[o]) for o, v in _VENCE.items() if o not in _EN_CURSO),
+                        default=None,
+                    )
+                    _COND.wait(None if proximo is None else max(0.0, proximo - ahora))
+                terminados, _TERMINADOS[:] = list(_TERMINADOS), []
+
+            _cerrar_terminados(terminados)
+            for orden_id in vencidos:
+                _marcar(orden_id, "generando")
+                futuro = _enviar(orden_id)
+                futuro.add_done_callback(lambda f, o=orden_id: _al_terminar(o, f))
+        except Exception:
+            traceback.print_exc()
+            time.sleep(1.0)
+        finally:
+            close_old_connections()
+
+
+def _iniciar_despachador():
+    """Con _COND tomado."""
+    global _DESPACHADOR
+    if _DESPACHADOR is None or not _DESPACHADOR.is_alive():
+        _DESPACHADOR = threading.Thread(target=_despachar, name="pdf-despachador", daemon=True)
+        _DESPACHADOR.start()
+
+
+def drenar():
+    """
+    Genera ya, en el hilo actual y sin esperar la ventana, los informes pedidos
+    que no se estén generando. Devuelve cuántos generó.
+    """
+    with _COND:
+        ids = [o for o in _VENCE if o not in _EN_CURSO]
+        for orden_id in ids:
+            _LIMITE[orden_id] = 0
+        ids = _tomar_vencidos(time.monotonic())
+    for orden_id in ids:
+        _marcar(orden_id, "generando")
+        futuro = Future()
+        try:
+            futuro.set_result(_renderizar(orden_id))
+        except Exception as e:
+            futuro.set_exception(e)
+        _al_terminar(orden_id, futuro)
+    with _COND:
+        terminados = [t for t in _TERMINADOS if t[0] in ids]
+        _TERMINADOS[:] = [t for t in _TERMINADOS if t[0] not in ids]
+    _cerrar_terminados(terminados)
+    return len(ids)
@@ -1625,111 +1625,7 @@ def informe_resultados_pdf(request, orden_id):
     # =========================
     # EXTRAER DATOS DE GRÁFICAS (HISTOGRAMAS) DEL MENSAJE HL7
     # =========================
-    import re
-    import base64
-    from io import BytesIO
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-
-    def parse_histogram_binary(raw):
-        """Extrae valores numéricos del formato histograma HL7."""
-        if not raw:
-            return None
-        try:
-            s = str(raw).strip()
-            s = s.replace("(", "").replace(")", "").replace("[", "").replace("]", "")
-            
-            values_str = None
-            if ";" in s:
-                parts = s.split(";")
-                if len(parts) >= 2:
-                    values_str = parts[1]
-            elif "," in s:
-                parts = s.split(",")
-                try:
-                    first_val = int(parts[0])
-                    if first_val > 65535:
-                        values_str = ",".join(parts[1:])
-                    else:
-                        values_str = s
-                except ValueError:
-                    values_str = s
-            else:
-                return None
-            
-            if not values_str:
-                return None
-            
-            values = []
-            for x in values_str.split(","):
-                x = x.strip()
-                if x:
-                    try:
-                        values.append(int(x))
-                    except:
-                        try:
-                            values.append(int(float(x)))
-                        except:
-                            continue
-            
-            return values if values else None
-        except Exception:
-            return None
-
-    def generate_histogram_base64(values, label, x_max=None):
-        """Genera un histograma como imagen base64."""
-        if not values or len(values) < 2:
-            return None
-        try:
-            fig, ax = plt.subplots(figsize=(6, 2), dpi=100)
-            fig.patch.set_facecolor('white')
-            ax.set_facecolor('white')
-            
-            x_vals = list(range(len(values)))
-            ax.fill_between(x_vals, values, color='#00CCFF', alpha=0.7)
-            ax.plot(x_vals, values, color='#0088CC', linewidth=0.8)
-            
-            ax.set_xlim(0, len(values) - 1)
-            max_val = max(values) if values else 1
-            ax.set_ylim(0, max_val * 1.1)
-            
-            ax.set_xticks([])
-            ax.set_yticks([])
-            
-            ax.spines['left'].set_visible(True)
-            ax.spines['left'].set_color('#333333')
-            ax.spines['bottom'].set_visible(True)
-            ax.spines['bottom'].set_color('#333333')
-            ax.spines['right'].set_visible(False)
-            ax.spines['top'].set_visible(False)
-            
-            ax.set_title(label, fontsize=9, fontweight='bold', pad=2)
-            
-            if label == "RBC":
-                ax.set_xlim(0, 300)
-                ax.set_xticks([0, 100, 200, 300])
-                ax.set_xticklabels(['0', '100', '200', ''], fontsize=6)
-                ax.set_xlabel('fL', fontsize=7)
-            elif label == "PLT":
-                ax.set_xlim(0, 40)
-                ax.set_xticks([0, 10, 20, 30, 40])
-                ax.set_xticklabels(['0', '10', '20', '30', '40'], fontsize=6)
-                ax.set_xlabel('fL', fontsize=7)
-            
-            plt.tight_layout(pad=0.3)
-            
-            buf = BytesIO()
-            plt.savefig(buf, format='png', transparent=True, dpi=100)
-            buf.seek(0)
-            img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-            plt.close(fig)
-            buf.close()
-            
-            return img_base64
-        except Exception as e:
-            print(f"Error generando histograma {label}: {e}")
-            return None
+    from laboratorio.utils import graficas_pdf
 
     # Buscar mensaje HL7 con datos de histogramas
     graphs_data = {
@@ -1740,52 +1636,21 @@ def informe_resultados_pdf(request, orden_id):
     }
 
     try:
-        from configuracion.models import HL7Mensaje
-        
-        numero_orden = str(orden.numero_orden).strip()
-        
-        # Buscar mensaje que contenga histogramas (buscar por contenido específico)
-        # El mensaje con histogramas es más antiguo, no el más reciente
-        hl7_msg = None
-        
-        # Primero intentar buscar directamente por contenido de histograma
-        hl7_msg = HL7Mensaje.objects.filter(
-            sample_id=numero_orden,
-            mensaje_raw__contains='RBC Histogram.Binary'
-        ).order_by('id').first()
-        
-        # Si no encuentra, intentar con otras estrategias
-        if not hl7_msg:
-            candidates = [numero_orden, numero_orden.lstrip("0") or numero_orden, str(orden.id)]
-            for candidate in candidates:
-                msg = HL7Mensaje.objects.filter(
-                    sample_id=candidate,
-                    mensaje_raw__contains='RBC Histogram.Binary'
-                ).order_by('id').first()
-                if msg:
-                    hl7_msg = msg
-                    break
-        
-        if hl7_msg and hl7_msg.mensaje_raw:
-            lines = hl7_msg.mensaje_raw.replace("\r", "\n").split("\n")
-            
-            for line in lines:
-                if 'RBC Histogram.Binary' in line:
-                    values = parse_histogram_binary(line)
-                    if values:
-                        graphs_data['rbc'] = generate_histogram_base64(values, "RBC")
-                
-                elif 'PLT Histogram.Binary' in line:
-                    values = parse_histogram_binary(line)
-                    if values:
-                        graphs_data['plt'] = generate_histogram_base64(values, "PLT")
-                
-                elif 'DIFFScatter.Binary' in line or 'DIFF Scatter.Binary' in line:
-                    graphs_data['diff'] = 'available'
-                
-                elif 'BASOScatter.Binary' in line or 'BASO Scatter.Binary' in line:
-                    graphs_data['baso'] = 'available'
-                    
+        from configuracion.graficas_hl7 import graficas_para_orden
+
+        # Gráficas extraídas al recibir el mensaje: una consulta por orden / sample_id
+        graficas = graficas_para_orden(orden)
+
+        for tipo in ('rbc', 'plt'):
+            if graficas.get(tipo):
+                # Vectorial (SVG), el mismo dibujo que InformeCanvas
+                dibujo = graficas_pdf.histograma(graficas[tipo], tipo.upper(), 400, 110)
+                graphs_data[tipo] = graficas_pdf.svg_base64(dibujo) if dibujo else None
+
+        for tipo in ('diff', 'baso'):
+            if graficas.get(tipo):
+                graphs_data[tipo] = 'available'
+
     except Exception as e:
         print(f"Error extrayendo datos HL7: {e}")
 
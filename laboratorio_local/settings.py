@@ -53,6 +53,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Varios hilos escriben a la vez (listener, cola HL7, vistas): tomar el
+        # bloqueo de escritura al abrir la transacción y esperar en vez de fallar.
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -64,3 +70,84 @@ LOGOUT_REDIRECT_URL = '/accounts/login/'
 STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Listener HL7 (configuracion/listener_thread.py)
+# Motor de E/S: 'hilos' (socket bloqueante) o 'asyncio' (configuracion/listener_asyncio.py).
+HL7_LISTENER_MOTOR = 'hilos'
+HL7_LISTENER_HILOS_BD = 4  # hilos para el trabajo de BD del motor asyncio
+# 'secuencial' atiende una conexión a la vez; 'concurrente' usa un pool acotado de hilos.
+HL7_LISTENER_MODO = 'secuencial'
+HL7_LISTENER_MAX_CONEXIONES = 16
+HL7_LISTENER_TIMEOUT_INACTIVIDAD = 300  # segundos sin datos antes de cerrar la conexión
+HL7_MLLP_MAX_TRAMA = 4 * 1024 * 1024  # bytes; una trama mayor cierra la conexión
+
+# ACK inmediato: el listener responde apenas guarda el mensaje y el post-proceso
+# (imágenes, resultados, PDF) lo hace la cola persistente (configuracion/cola_hl7.py).
+HL7_ACK_INMEDIATO = False
+HL7_COLA_TRABAJADORES = 2
+HL7_COLA_MAX_INTENTOS = 5
+# Segundos sin cambios para dar por abandonado (proceso caído) un trabajo 'en_proceso'
+HL7_COLA_HUERFANO_SEGUNDOS = 600
+
+# Equipos y mapeos se resuelven en memoria (configuracion/registro_equipos.py); se
+# invalidan al guardar/borrar y, por cambios desde otro proceso, cada N segundos.
+HL7_REGISTRO_TTL = 60
+
+# configuracion/hl7/metrics/ se puede leer sin sesión con "Authorization: Bearer <token>"
+# (bearer_token en el scrape de Prometheus). None = solo con sesión.
+HL7_METRICAS_TOKEN = None
+
+# Control de admisión por equipo (límites en cada Equipo; ver configuracion/admision.py):
+# si un equipo excede su tasa de bytes se demora la lectura hasta N segundos por trama;
+# por encima de eso el mensaje se rechaza con ACK AR.
+HL7_ADMISION_ESPERA_MAXIMA = 2.0
+
+# Diario en disco de las tramas HL7 recibidas (configuracion/diario_hl7.py): cada trama
+# se sincroniza antes del ACK; `reprocesar_diario_hl7` reingresa las que no llegaron a la BD.
+# Los segmentos ya confirmados en la BD se borran solos al rotar y al iniciar el listener.
+# None = desactivado.
+HL7_DIARIO_DIR = BASE_DIR / 'hl7_diario'
+HL7_DIARIO_SEGMENTO = 16 * 1024 * 1024
+
+# Cuerpo de los HL7Mensaje (configuracion/compresion_hl7.py): 'zlib', 'lzma' o '' (sin comprimir).
+# Los mensajes anteriores se comprimen con `comprimir_mensajes_hl7`.
+HL7_COMPRESION = 'zlib'
+HL7_COMPRESION_NIVEL = 6
+
+# Archivo mensual (configuracion/archivo_hl7.py): `archivar_hl7` pasa a HL7_ARCHIVO_DIR los
+# mensajes con más de HL7_ARCHIVO_DIAS días; hl7_ver y las gráficas del informe los siguen leyendo.
+HL7_ARCHIVO_DIR = BASE_DIR / 'hl7_archivo'
+HL7_ARCHIVO_DIAS = 180
+
+# Captura del tráfico de los equipos (configuracion/captura_hl7.py) para reproducirlo con
+# `reproducir_captura_hl7` contra otra versión. Trae datos de pacientes. None = desactivada.
+HL7_CAPTURA_DIR = None
+
+# Imágenes ED de los equipos (configuracion/imagenes_hl7.py): se decodifican en un pool
+# de procesos (0 = en el mismo hilo). Formato 'png' (nivel de compresión 0-9) o 'bmp'.
+HL7_IMAGENES_PROCESOS = 2
+HL7_IMAGENES_FORMATO = 'png'
+HL7_IMAGENES_COMPRESION = 6
+
+# 'diferido': al recibir solo se guarda la referencia al OBX; la imagen se genera al
+# pedirla y queda en un caché en disco (podado por último acceso). 'inmediato': archivo al recibir.
+HL7_IMAGENES_MODO = 'diferido'
+HL7_IMAGENES_CACHE_DIR = MEDIA_ROOT / 'hl7_cache'
+HL7_IMAGENES_CACHE_MAX = 256 * 1024 * 1024
+
+# Informes PDF en segundo plano (laboratorio/utils/pdf_servicio.py): los pedidos de una
+# orden se juntan durante INFORME_PDF_ESPERA segundos y se generan en un pool de procesos
+# (0 = en el hilo del despachador).
+INFORME_PDF_PROCESOS = 2
+INFORME_PDF_ESPERA = 2.0
+
+# Caché en disco de los informes PDF (laboratorio/utils/pdf_cache.py): uno por orden y
+# versión de sus datos; se poda por último acceso al pasar INFORME_CACHE_MAX bytes.
+INFORME_CACHE_DIR = MEDIA_ROOT / 'informes_cache'
+INFORME_CACHE_MAX = 512 * 1024 * 1024
+
+# Exportación de informes por lote (laboratorio/utils/pdf_lote.py, `exportar_informes` y
+# ordenes/informes/lote/): procesos para generarlos (None = uno por núcleo) y tope de
+# órdenes por pedido desde la web.
+INFORME_LOTE_PROCESOS = None
+INFORME_LOTE_MAXIMO = 2000
@@ -1,7 +1,15 @@
+import argparse
+import base64
+import random
 import socket
 import sys
+import threading
+import time
+from collections import Counter
 from datetime import datetime
 
+from configuracion.mllp import EscanerMLLP, envolver
+
 # Configuración de conexión
 IP = "127.0.0.1"
 PUERTO = 2575
@@ -249,9 +257,329 @@ def modo_interactivo():
         )
 
 
+# ------------------------------
+# PRUEBA DE CARGA (varios equipos a la vez)
+# ------------------------------
+#
+#   python simulador.py carga --equipos 8 --mps 20 --duracion 60 --consultas 0.1
+#
+# Cada equipo virtual es una conexión MLLP propia que, como el KT-6610, manda un
+# mensaje y espera su ACK antes del siguiente. Entre todos apuntan a --mps
+# mensajes por segundo; si el listener no da abasto, el ritmo real queda abajo
+# y se ve en el informe.
+
+# codigo, unidad, referencia, mínimo, máximo
+PARAMETROS_CBC = [
+    ("WBC", "10^9/L", "4.00-10.00", 3.0, 12.0),
+    ("LYM%", "%", "20.0-40.0", 15.0, 45.0),
+    ("MID%", "%", "3.0-14.0", 2.0, 15.0),
+    ("GRA%", "%", "50.0-70.0", 45.0, 75.0),
+    ("RBC", "10^12/L", "4.00-5.50", 3.5, 6.0),
+    ("HGB", "g/dL", "12.0-16.0", 10.0, 18.0),
+    ("HCT", "%", "36.0-50.0", 32.0, 52.0),
+    ("MCV", "fL", "80.0-100.0", 75.0, 105.0),
+    ("MCH", "pg", "27.0-34.0", 25.0, 36.0),
+    ("MCHC", "g/dL", "32.0-36.0", 30.0, 37.0),
+    ("RDW-CV", "%", "11.0-16.0", 10.0, 18.0),
+    ("PLT", "10^9/L", "100-300", 80.0, 450.0),
+    ("MPV", "fL", "6.5-12.0", 6.0, 13.0),
+    ("PCT", "%", "0.108-0.282", 0.1, 0.3),
+]
+
+IMAGENES_ED = ("WBC Image", "DIFF Image", "BASO Image")
+_IMAGEN_ED = None
+
+
+def _imagen_ed():
+    """Base64 de una imagen RAW 255x255 RGB (lo que manda el KT-6610), generada una vez."""
+    global _IMAGEN_ED
+    if _IMAGEN_ED is None:
+        rng = random.Random(6610)
+        raw = bytearray(b"\xf4" * (255 * 255 * 3))
+        for _ in range(4000):
+            p = rng.randrange(255 * 255) * 3
+            raw[p:p + 3] = bytes((rng.randrange(256), rng.randrange(120), rng.randrange(256)))
+        _IMAGEN_ED = base64.b64encode(bytes(raw)).decode("ascii")
+    return _IMAGEN_ED
+
+
+def _histograma(rng, centro):
+    return ",".join(
+        str(max(0, int(200 * 2.718 ** (-((i - centro) / 25.0) ** 2)) + rng.randrange(5)))
+        for i in range(256)
+    )
+
+
+def _scatter(rng, n):
+    return "".join(f"({rng.randrange(256)},{rng.randrange(256)})" for _ in range(n))
+
+
+def mensaje_oru_kt6610(numero_orden, control_id, imagenes=True, rng=random):
+    """ORU^R01 como lo manda el KT-6610: CBC, histogramas, scatter e imágenes ED."""
+    now = datetime.now().strftime("%Y%m%d%H%M%S")
+    segmentos = [
+        f"MSH|^~\\&|Genrui|KT-6610|||{now}||ORU^R01|{control_id}|P|2.3.1",
+        "PID|1||||PRUEBA^CARGA||19800101|M",
+        f"OBR|1|{numero_orden}||^CBC|||{now}",
+    ]
+    for codigo, unidad, referencia, minimo, maximo in PARAMETROS_CBC:
+        valor = round(rng.uniform(minimo, maximo), 2)
+        segmentos.append(f"OBX|{len(segmentos) - 2}|NM|^{codigo}^||{valor}|{unidad}|{referencia}|N|||F")
+
+    graficas = [
+        ("RBC Histogram.Binary", f"16711680;{_histograma(rng, 90)}"),
+        ("PLT Histogram.Binary", f"255;{_histograma(rng, 40)}"),
+        ("DIFFScatter.Binary", f"16711680,{_scatter(rng, 600)};65280,{_scatter(rng, 400)}"),
+        ("BASOScatter.Binary", f"255,{_scatter(rng, 300)}"),
+    ]
+    for nombre, valor in graficas:
+        segmentos.append(f"OBX|{len(segmentos) - 2}|ED|^{nombre}^||{valor}|||||F")
+
+    if imagenes:
+        for nombre in IMAGENES_ED:
+            segmentos.append(f"OBX|{len(segmentos) - 2}|ED|^{nombre}^||^Image^BMP^Base64^{_imagen_ed()}|||||F")
+
+    return "\r".join(segmentos) + "\r"
+
+
+def mensaje_qry(numero_orden, control_id):
+    """Consulta del equipo por los datos de la muestra (QRY^Q02 con QRD)."""
+    now = datetime.now().strftime("%Y%m%d%H%M%S")
+    return (
+        f"MSH|^~\\&|Genrui|KT-6610|||{now}||QRY^Q02|{control_id}|P|2.3.1\r"
+        f"QRD|{now}|R|D|{control_id}|||RD|{numero_orden}|OTH|||T\r"
+    )
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    i = min(len(valores_ordenados) - 1, int(round(p * (len(valores_ordenados) - 1))))
+    return valores_ordenados[i]
+
+
+class Estadisticas:
+    """Contadores compartidos por los equipos virtuales."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = {"ORU": [], "QRY": []}
+        self.enviados = Counter()
+        self.acks = Counter()        # código MSA (AA, AE, AR, ?)
+        self.errores = Counter()     # tipo de error
+        self.retransmisiones = 0
+        self.bytes_enviados = 0
+
+    def enviado(self, tipo, n_bytes):
+        with self._lock:
+            self.enviados[tipo] += 1
+            self.bytes_enviados += n_bytes
+
+    def ack(self, tipo, latencia, codigo):
+        with self._lock:
+            self.latencias[tipo].append(latencia)
+            self.acks[codigo] += 1
+
+    def error(self, motivo):
+        with self._lock:
+            self.errores[motivo] += 1
+
+    def retransmision(self):
+        with self._lock:
+            self.retransmisiones += 1
+
+    def informe(self, segundos, mps_objetivo):
+        with self._lock:
+            lineas = []
+            total_acks = sum(self.acks.values())
+            lineas.append(f"Duración: {segundos:.1f} s")
+            lineas.append(
+                f"Enviados: {sum(self.enviados.values())} "
+                f"({', '.join(f'{k}={v}' for k, v in sorted(self.enviados.items()))}); "
+                f"{self.bytes_enviados / 1024 / 1024:.1f} MB"
+            )
+            lineas.append(
+                f"Respuestas: {total_acks} ({', '.join(f'{k}={v}' for k, v in sorted(self.acks.items())) or '-'})"
+            )
+            lineas.append(
+                f"Throughput: {total_acks / segundos if segundos else 0:.2f} msg/s (objetivo {mps_objetivo:g})"
+            )
+            lineas.append(f"Retransmisiones: {self.retransmisiones}")
+            lineas.append(
+                f"Errores: {sum(self.errores.values())}"
+                + (f" ({', '.join(f'{k}={v}' for k, v in sorted(self.errores.items()))})" if self.errores else "")
+            )
+            lineas.append("Latencia ACK (ms)    n      p50      p90      p95      p99      máx")
+            for tipo, valores in sorted(self.latencias.items()):
+                v = sorted(valores)
+                if not v:
+                    continue
+                lineas.append(
+                    f"  {tipo:<15}{len(v):>6}"
+                    + "".join(f"{percentil(v, p) * 1000:>9.1f}" for p in (0.5, 0.9, 0.95, 0.99))
+                    + f"{v[-1] * 1000:>9.1f}"
+                )
+            return "\n".join(lineas)
+
+
+class EquipoVirtual(threading.Thread):
+    """Un analizador: una conexión, un mensaje en vuelo a la vez, a ritmo fijo."""
+
+    def __init__(self, numero, ip, puerto, intervalo, inicio, fin, args, estadisticas):
+        super().__init__(name=f"equipo-{numero}", daemon=True)
+        self.numero = numero
+        self.destino = (ip, puerto)
+        self.intervalo = intervalo
+        self.programado = inicio
+        self.fin = fin
+        self.args = args
+        self.estadisticas = estadisticas
+        self.rng = random.Random(numero)
+        self.sock = None
+        self.escaner = EscanerMLLP()
+        self.secuencia = 0
+
+    def _numero_orden(self):
+        if self.args.orden_cantidad:
+            n = self.args.orden_desde + self.rng.randrange(self.args.orden_cantidad)
+            return f"{n:06d}"
+        return f"C{self.numero:02d}{self.secuencia:06d}"
+
+    def _conectar(self):
+        self._cerrar()
+        self.sock = socket.create_connection(self.destino, timeout=self.args.timeout)
+        self.escaner.reiniciar()
+
+    def _cerrar(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _esperar_respuesta(self):
+        limite = time.monotonic() + self.args.timeout
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise socket.timeout()
+            self.sock.settimeout(restante)
+            datos = self.sock.recv(65536)
+            if not datos:
+                raise ConnectionResetError("el listener cerró la conexión")
+            tramas = self.escaner.alimentar(datos)
+            if tramas:
+                return tramas[0]
+
+    def _enviar(self, tipo, trama):
+        """Envía y espera respuesta, retransmitiendo en una conexión nueva si no llega."""
+        for intento in range(self.args.reintentos + 1):
+            if intento:
+                self.estadisticas.retransmision()
+            try:
+                if self.sock is None:
+                    self._conectar()
+                t0 = time.perf_counter()
+                self.sock.sendall(trama)
+                self.estadisticas.enviado(tipo, len(trama))
+                respuesta = self._esperar_respuesta()
+            except socket.timeout:
+                self.estadisticas.error("timeout")
+                self._cerrar()
+                continue
+            except OSError as e:
+                self.estadisticas.error(type(e).__name__)
+                self._cerrar()
+                time.sleep(min(1.0, self.intervalo))
+                continue
+            latencia = time.perf_counter() - t0
+            codigo = "?"
+            for linea in respuesta.decode("utf-8", errors="ignore").split("\r"):
+                if linea.startswith("MSA|"):
+                    codigo = linea.split("|")[1]
+                    break
+            self.estadisticas.ack(tipo, latencia, codigo)
+            return
+        self.estadisticas.error("sin_respuesta")
+
+    def run(self):
+        while True:
+            ahora = time.monotonic()
+            if self.programado >= self.fin:
+                break
+            if self.programado > ahora:
+                time.sleep(self.programado - ahora)
+            self.programado += self.intervalo
+
+            self.secuencia += 1
+            control_id = f"LT{self.numero:02d}{self.secuencia:08d}"
+            numero_orden = self._numero_orden()
+            if self.rng.random() < self.args.consultas:
+                tipo, mensaje = "QRY", mensaje_qry(numero_orden, control_id)
+            else:
+                tipo = "ORU"
+                mensaje = mensaje_oru_kt6610(numero_orden, control_id, not self.args.sin_imagenes, self.rng)
+            self._enviar(tipo, envolver(mensaje.encode("utf-8")))
+        self._cerrar()
+
+
+def prueba_de_carga(argv):
+    parser = argparse.ArgumentParser(
+        prog="simulador.py carga",
+        description="Simula varios analizadores enviando al listener HL7 a un ritmo dado.",
+    )
+    parser.add_argument("--ip", default=IP)
+    parser.add_argument("--puertos", default=str(PUERTO),
+                        help="Puertos separados por coma; los equipos se reparten entre ellos")
+    parser.add_argument("--equipos", type=int, default=4, help="Analizadores simultáneos")
+    parser.add_argument("--mps", type=float, default=5.0, help="Mensajes por segundo entre todos")
+    parser.add_argument("--duracion", type=float, default=30.0, help="Segundos de prueba")
+    parser.add_argument("--consultas", type=float, default=0.1,
+                        help="Fracción de mensajes que son consultas QRY/QRD (0-1)")
+    parser.add_argument("--sin-imagenes", action="store_true", help="ORU sin las imágenes ED")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Segundos de espera del ACK")
+    parser.add_argument("--reintentos", type=int, default=2, help="Retransmisiones si no llega el ACK")
+    parser.add_argument("--orden-desde", type=int, default=1000,
+                        help="Con --orden-cantidad: primer número de orden existente")
+    parser.add_argument("--orden-cantidad", type=int, default=0,
+                        help="Usar números de orden reales (desde --orden-desde); 0 = muestras ficticias")
+    args = parser.parse_args(argv)
+
+    puertos = [int(p) for p in args.puertos.split(",") if p.strip()]
+    intervalo = args.equipos / args.mps
+    if not args.sin_imagenes:
+        _imagen_ed()  # que no cuente dentro de la prueba
+
+    estadisticas = Estadisticas()
+    inicio = time.monotonic()
+    fin = inicio + args.duracion
+    equipos = [
+        EquipoVirtual(
+            i + 1, args.ip, puertos[i % len(puertos)], intervalo,
+            inicio + i * intervalo / args.equipos, fin, args, estadisticas,
+        )
+        for i in range(args.equipos)
+    ]
+
+    print(f"{args.equipos} equipos -> {args.ip}:{args.puertos}, {args.mps:g} msg/s, {args.duracion:g} s, "
+          f"consultas {args.consultas:.0%}, imágenes {'no' if args.sin_imagenes else 'sí'}")
+    for equipo in equipos:
+        equipo.start()
+    try:
+        for equipo in equipos:
+            equipo.join()
+    except KeyboardInterrupt:
+        print("\nInterrumpido: informe parcial")
+
+    print(estadisticas.informe(time.monotonic() - inicio, args.mps))
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "carga":
+        prueba_de_carga(sys.argv[2:])
     # Si se pasa argumento por línea de comandos, usarlo directamente
-    if len(sys.argv) > 1:
+    elif len(sys.argv) > 1:
         numero_orden = sys.argv[1]
         documento = sys.argv[2] if len(sys.argv) > 2 else None
         nombre = sys.argv[3] if len(sys.argv) > 3 else None